@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+alignment_matrix.py
+Multiple sequence alignments as contiguous uint8 matrices
+
+An AlignmentMatrix holds the aligned sequences as an (n_seqs, n_columns)
+array of ASCII codes plus the record IDs and descriptions. Gap scoring,
+column/row selection and edge trimming are whole-array NumPy operations;
+Bio.Align.MultipleSeqAlignment objects are only built when writing.
+"""
+
+import numpy as np
+from Bio import AlignIO
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+from Bio.SeqRecord import SeqRecord
+
+GAP = ord('-')
+
+# Characters counted as missing data in gap fractions
+GAP_CHARS = b'-N'
+IS_GAP = np.zeros(256, dtype=bool)
+IS_GAP[list(GAP_CHARS)] = True
+
+class AlignmentMatrix:
+    """Aligned sequences as an (n_seqs, n_columns) uint8 array"""
+
+    def __init__(self, ids, descriptions, data):
+        self.ids = list(ids)
+        self.descriptions = list(descriptions)
+        self.data = data
+
+    @classmethod
+    def from_strings(cls, ids, descriptions, sequences):
+        lengths = {len(seq) for seq in sequences}
+        if len(lengths) > 1:
+            raise ValueError("Sequences must all be the same length")
+
+        n_columns = lengths.pop() if lengths else 0
+        data = np.frombuffer(''.join(sequences).encode('ascii'), dtype=np.uint8)
+        return cls(ids, descriptions, data.reshape(len(sequences), n_columns).copy())
+
+    @classmethod
+    def read(cls, handle):
+        """Read an aligned FASTA file from an open text handle"""
+        ids, descriptions, sequences = [], [], []
+        for title, sequence in SimpleFastaParser(handle):
+            ids.append(title.split(None, 1)[0] if title else '')
+            descriptions.append(title)
+            sequences.append(sequence)
+
+        if not sequences:
+            raise ValueError("No records found in handle")
+        return cls.from_strings(ids, descriptions, sequences)
+
+    @classmethod
+    def from_alignment(cls, alignment):
+        return cls.from_strings(
+            [record.id for record in alignment],
+            [record.description for record in alignment],
+            [str(record.seq) for record in alignment]
+        )
+
+    @property
+    def n_seqs(self):
+        return self.data.shape[0]
+
+    @property
+    def n_columns(self):
+        return self.data.shape[1]
+
+    def __len__(self):
+        return self.n_seqs
+
+    def gap_mask(self):
+        """True where a cell is a gap or N"""
+        return IS_GAP[self.data]
+
+    def column_gap_fraction(self):
+        """Fraction of gap/N cells in each column"""
+        if self.n_seqs == 0:
+            return np.ones(self.n_columns)
+        return self.gap_mask().mean(axis=0)
+
+    def row_gap_fraction(self):
+        """Fraction of gap/N cells in each sequence (1.0 for an empty alignment)"""
+        if self.n_columns == 0:
+            return np.ones(self.n_seqs)
+        return self.gap_mask().mean(axis=1)
+
+    def edge_bounds(self, gap_threshold, column_gap_fraction=None):
+        """
+        (start, end) of the span between the first and last column whose gap
+        fraction is below gap_threshold, or None if there is no such column.
+        Precomputed column gap fractions may be passed in.
+        """
+        if column_gap_fraction is None:
+            column_gap_fraction = self.column_gap_fraction()
+        good = np.flatnonzero(column_gap_fraction < gap_threshold)
+        if len(good) == 0:
+            return None
+        return int(good[0]), int(good[-1]) + 1
+
+    def select_columns(self, columns):
+        """New matrix with the given columns (slice, boolean mask or indices)"""
+        return AlignmentMatrix(self.ids, self.descriptions, self.data[:, columns])
+
+    def select_rows(self, rows):
+        """New matrix with the given sequences (boolean mask or indices)"""
+        rows = np.flatnonzero(rows) if np.asarray(rows).dtype == bool else np.asarray(rows)
+        return AlignmentMatrix(
+            [self.ids[i] for i in rows],
+            [self.descriptions[i] for i in rows],
+            self.data[rows]
+        )
+
+    def sequence(self, i):
+        return self.data[i].tobytes().decode('ascii')
+
+    def ungapped(self, i):
+        """Sequence i with '-' removed"""
+        row = self.data[i]
+        return row[row != GAP].tobytes().decode('ascii')
+
+    def to_alignment(self):
+        """Materialise as a Biopython MultipleSeqAlignment"""
+        return MultipleSeqAlignment([
+            SeqRecord(Seq(self.sequence(i)), id=record_id, description=description)
+            for i, (record_id, description) in enumerate(zip(self.ids, self.descriptions))
+        ])
+
+    def write(self, path, fmt='fasta'):
+        AlignIO.write(self.to_alignment(), path, fmt)
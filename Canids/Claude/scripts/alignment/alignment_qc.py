@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+alignment_qc.py
+Per-alignment QC metrics from the filter stage, as a typed Parquet table
+
+filter_alignments.py computes one QC row per gene from the FilterPlan it
+already built (no second read of the alignment) and QCTableWriter streams
+the rows to Parquet in row groups, so downstream scripts can join QC onto
+selection results with pd.read_parquet instead of re-reading alignments.
+
+Sizes and fractions refer to the alignment as it leaves the filter: the
+trimmed columns and the sequences that pass the gap filter (all sequences
+if the alignment was rejected before the gap filter).
+"""
+
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+QC_COLUMNS = {
+    'gene': 'string',
+    'status': 'string',
+    'reason': 'string',
+    'n_seqs_in': 'Int32',
+    'length_in': 'Int32',
+    'n_seqs_out': 'Int32',
+    'length_out': 'Int32',
+    'n_seqs_removed': 'Int32',
+    'trimmed_columns': 'Int32',
+    'trimmed_bases': 'Int64',
+    'gap_fraction_in': 'Float64',
+    'gap_fraction_out': 'Float64',
+    'max_seq_gap_fraction': 'Float64',
+    'gc': 'Float64',
+    'gc3': 'Float64',
+    'length_multiple_of_3': 'boolean',
+    'n_internal_stop': 'Int32',
+    'has_internal_stop': 'boolean'
+}
+
+IS_BASE = np.zeros(256, dtype=bool)
+IS_GC = np.zeros(256, dtype=bool)
+for base in 'ACGTacgt':
+    IS_BASE[ord(base)] = True
+for base in 'GCgc':
+    IS_GC[ord(base)] = True
+
+def _fraction(numerator, denominator):
+    return float(numerator) / denominator if denominator else None
+
+def qc_row(gene_name, status, reason='', plan=None, decision=None):
+    """QC metrics for one alignment (only gene/status/reason if it could not be read)"""
+    row = dict.fromkeys(QC_COLUMNS)
+    row.update(gene=gene_name, status=status, reason=reason)
+    if plan is None:
+        return row
+
+    matrix = plan.matrix
+    gaps = matrix.gap_mask()
+    row.update(
+        n_seqs_in=matrix.n_seqs,
+        length_in=matrix.n_columns,
+        gap_fraction_in=_fraction(gaps.sum(), gaps.size)
+    )
+
+    if plan.columns is None:
+        row.update(trimmed_columns=matrix.n_columns,
+                   trimmed_bases=int((~gaps).sum()))
+        return row
+
+    # Original column numbers of the retained columns (codon positions
+    # refer to the untrimmed frame)
+    columns = np.arange(matrix.n_columns)[plan.columns]
+    dropped = np.ones(matrix.n_columns, dtype=bool)
+    dropped[columns] = False
+
+    keep = decision['keep']
+    rows = np.flatnonzero(keep) if keep is not None else np.arange(matrix.n_seqs)
+    retained = matrix.data[np.ix_(rows, columns)]
+    retained_gaps = gaps[np.ix_(rows, columns)]
+
+    bases = IS_BASE[retained]
+    gc = IS_GC[retained]
+    third = (columns % 3) == 2
+
+    stops = plan.stop_rows[rows] if plan.length else np.zeros(len(rows), dtype=bool)
+
+    row.update(
+        n_seqs_out=len(rows),
+        length_out=len(columns),
+        n_seqs_removed=matrix.n_seqs - len(rows),
+        trimmed_columns=int(dropped.sum()),
+        trimmed_bases=int((~gaps[:, dropped]).sum()),
+        gap_fraction_out=_fraction(retained_gaps.sum(), retained_gaps.size),
+        max_seq_gap_fraction=float(plan.row_gap_fraction[rows].max()) if len(rows) else None,
+        gc=_fraction(gc.sum(), bases.sum()),
+        gc3=_fraction(gc[:, third].sum(), bases[:, third].sum()),
+        length_multiple_of_3=len(columns) % 3 == 0,
+        n_internal_stop=int(stops.sum()),
+        has_internal_stop=bool(stops.any())
+    )
+    return row
+
+def qc_frame(rows):
+    """Typed DataFrame of QC rows"""
+    df = pd.DataFrame(rows, columns=list(QC_COLUMNS))
+    return df.astype(QC_COLUMNS)
+
+class QCTableWriter:
+    """
+    Stream QC rows to a Parquet file in row groups of batch_size rows. The
+    file is written under a temporary name and moved into place on close.
+    With path None, or without pyarrow, nothing is written (without pyarrow
+    a note is printed).
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.path = Path(path) if path is not None else None
+        self.batch_size = batch_size
+        self.n_rows = 0
+        self._rows = []
+        self._writer = None
+        self.enabled = path is not None and pa is not None
+        if path is not None and pa is None:
+            print("  Note: pyarrow is not installed, QC table disabled")
+        if self.enabled:
+            self._tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+
+    def append(self, row):
+        if not self.enabled:
+            return
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        table = pa.Table.from_pandas(qc_frame(self._rows), preserve_index=False)
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = pq.ParquetWriter(self._tmp_path, table.schema)
+        self._writer.write_table(table)
+        self.n_rows += len(self._rows)
+        self._rows = []
+
+    def close(self):
+        if not self.enabled:
+            return
+        self._flush()
+        if self._writer is None:
+            # No rows: still write an empty table with the full schema
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(pa.Table.from_pandas(qc_frame([]), preserve_index=False),
+                           self._tmp_path)
+        else:
+            self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+back_translate.py
+Back-translate protein alignments to codon alignments (in-process pal2nal)
+
+Threads each CDS through its aligned protein: every residue column becomes
+the CDS codon for that residue and every gap column becomes '---'. The codon
+positions of all residues of a gene are computed at once from a cumulative
+residue count per row, so a whole alignment is mapped with one indexing
+operation on a uint8 matrix.
+
+Before mapping, every CDS is translated (codon_translation.py) and checked
+against its aligned protein:
+  - the CDS must have one codon per residue, optionally plus a terminal stop
+    codon (which is dropped, as the extraction scripts translate to the stop)
+  - every codon must translate to its residue; 'X' on either side, 'U'
+    (selenocysteine) against a stop codon and an initial 'M' are accepted
+CDS are paired with the aligned proteins by ID. A gene may have several
+records with the same ID (extract_cds.py writes every ortholog of a
+species); those are paired by position, as pal2nal.pl does, when both files
+list the IDs in the same order, and rejected otherwise.
+
+Processes one gene or a whole set per call (a single alignment, a directory
+of alignments or a --file_list), with CDS from per-gene directories or a
+packed ortholog bundle, and writes one summary row per gene. The Snakemake
+codon_align rule runs it once per gene; those jobs share a group so cluster
+runs can submit them in batches.
+"""
+
+import argparse
+import sys
+from collections import Counter
+from pathlib import Path
+import numpy as np
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+from alignment_matrix import GAP, AlignmentMatrix
+from codon_translation import STOP, UNKNOWN, translate_batch
+from fasta_io import fasta_stem, open_fasta
+from ortholog_bundle import BundleReader, is_bundle
+from summary_table import write_summary
+
+PROTEIN_SUFFIX = '.protein_aligned'
+
+# Characters treated as gaps in a protein alignment
+PROTEIN_GAPS = np.zeros(256, dtype=bool)
+PROTEIN_GAPS[list(b'-.')] = True
+
+UPPER = np.frombuffer(bytes(range(256)).upper(), dtype=np.uint8)
+
+SUMMARY_COLUMNS = ['gene', 'status', 'reason', 'n_seqs', 'protein_length',
+                   'codon_length', 'output']
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Back-translate protein alignments to codon alignments'
+    )
+    parser.add_argument(
+        '--protein_aln',
+        type=str,
+        default=None,
+        help='Protein alignment file, or directory of <gene>/<gene>.protein_aligned.fa '
+             '(or flat <gene>.protein_aligned.fa) files'
+    )
+    parser.add_argument(
+        '--file_list',
+        type=str,
+        default=None,
+        help='Text file with one protein alignment path per line (used instead of '
+             '--protein_aln, e.g. for a manual batch run)'
+    )
+    parser.add_argument(
+        '--cds',
+        type=str,
+        required=True,
+        help='CDS source: directory of <gene>/<gene>.cds.fa files, a packed ortholog '
+             'bundle, or a single CDS file (with a single protein alignment)'
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        required=True,
+        help='Output directory for <gene>.codon.fa files'
+    )
+    parser.add_argument(
+        '--summary',
+        type=str,
+        default=None,
+        help='Per-gene summary table (default: <output>/back_translate_summary.tsv)'
+    )
+    parser.add_argument(
+        '--codon_table',
+        type=int,
+        default=1,
+        help='NCBI genetic code used to check the CDS against the protein (default: 1)'
+    )
+    parser.add_argument(
+        '--empty_on_error',
+        action='store_true',
+        help='Write an empty <gene>.codon.fa for genes that fail, so a batch job always '
+             'produces every output (failures are listed in the summary table)'
+    )
+    return parser.parse_args()
+
+def gene_name_of(protein_file):
+    return fasta_stem(protein_file.name).replace(PROTEIN_SUFFIX, '')
+
+class CDSSource:
+    """CDS FASTA text per gene from a directory tree, a bundle or a single file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.bundle = BundleReader(self.path) if is_bundle(self.path) else None
+
+    def read(self, gene_name):
+        """Records of one gene's CDS as (id, sequence) pairs"""
+        if self.bundle is not None:
+            if not self.bundle.has(gene_name, 'cds.fa'):
+                raise FileNotFoundError(f"{gene_name}.cds.fa not in {self.path}")
+            handle = self.bundle.member(gene_name, 'cds.fa').open()
+        elif self.path.is_file():
+            handle = open_fasta(self.path)
+        else:
+            candidates = [self.path / gene_name / f"{gene_name}.cds.fa",
+                          self.path / gene_name / f"{gene_name}.cds.fa.gz",
+                          self.path / f"{gene_name}.cds.fa"]
+            cds_file = next((f for f in candidates if f.exists()), None)
+            if cds_file is None:
+                raise FileNotFoundError(f"no CDS file for {gene_name} in {self.path}")
+            handle = open_fasta(cds_file)
+
+        with handle:
+            return [(title.split(None, 1)[0] if title else '', sequence)
+                    for title, sequence in SimpleFastaParser(handle)]
+
+    def close(self):
+        if self.bundle is not None:
+            self.bundle.close()
+
+def pair_cds(protein_ids, cds_records):
+    """
+    CDS sequence for each aligned protein ID: by ID, or by position where IDs
+    repeat and both lists have the same IDs in the same order. Raises
+    ValueError for missing CDS and for repeated IDs that cannot be paired.
+    """
+    cds_ids = [seq_id for seq_id, _ in cds_records]
+    if cds_ids == list(protein_ids):
+        return [sequence for _, sequence in cds_records]
+
+    cds_counts = Counter(cds_ids)
+    protein_counts = Counter(protein_ids)
+    repeated = sorted(seq_id for seq_id in protein_counts
+                      if protein_counts[seq_id] > 1 or cds_counts[seq_id] > 1)
+    if repeated:
+        raise ValueError(f"repeated sequence IDs not in the same order as the CDS: "
+                         f"{', '.join(repeated)}")
+
+    cds_by_id = dict(cds_records)
+    missing = [seq_id for seq_id in protein_ids if seq_id not in cds_by_id]
+    if missing:
+        raise ValueError(f"no CDS for {', '.join(missing)}")
+    return [cds_by_id[seq_id] for seq_id in protein_ids]
+
+def back_translate(protein, cds_records, table=1):
+    """
+    Codon alignment for an AlignmentMatrix of aligned proteins and a list of
+    (id, CDS) pairs. Raises ValueError naming the offending sequences if a
+    CDS is missing or ambiguous, has the wrong length or does not encode
+    its protein.
+    """
+    sequences = pair_cds(protein.ids, cds_records)
+    translations = translate_batch(sequences, table)
+
+    residue = ~PROTEIN_GAPS[protein.data]
+    n_residues = residue.sum(axis=1)
+
+    # One codon per residue, plus at most a terminal stop codon
+    n_codons = translations.n_codons
+    last = np.zeros(len(n_codons), dtype=np.uint8)
+    last[n_codons > 0] = translations.residues[translations.offsets[1:][n_codons > 0] - 1]
+    terminal_stop = (n_codons == n_residues + 1) & (last == STOP)
+    bad_length = (n_codons != n_residues) & ~terminal_stop
+    if bad_length.any():
+        raise ValueError("CDS length does not match protein: " + ', '.join(
+            f"{protein.ids[i]} ({n_codons[i]} codons, {n_residues[i]} residues)"
+            for i in np.flatnonzero(bad_length)
+        ))
+
+    # Codon number of every residue cell: its rank among the residues of its row
+    rows, columns = np.nonzero(residue)
+    rank = np.cumsum(residue, axis=1)[rows, columns] - 1
+
+    # Check the CDS against the protein, one comparison for the whole gene
+    expected = UPPER[protein.data[rows, columns]]
+    translated = translations.residues[translations.offsets[rows] + rank]
+    match = ((expected == translated) | (expected == UNKNOWN) | (translated == UNKNOWN)
+             | ((expected == ord('U')) & (translated == STOP))
+             | ((expected == ord('M')) & (rank == 0)))
+    if not match.all():
+        counts = np.bincount(rows[~match], minlength=protein.n_seqs)
+        raise ValueError("CDS does not encode the aligned protein: " + ', '.join(
+            f"{protein.ids[i]} ({counts[i]} mismatches)" for i in np.flatnonzero(counts)
+        ))
+
+    # Gather the codon of every residue cell from one buffer of all CDS
+    lengths = np.array([len(seq) for seq in sequences], dtype=np.int64)
+    starts = np.zeros(len(sequences), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    buffer = np.frombuffer(''.join(sequences).encode('ascii'), dtype=np.uint8)
+    source = (starts[rows] + 3 * rank)[:, None] + np.arange(3)
+
+    codons = np.full((protein.n_seqs, protein.n_columns, 3), GAP, dtype=np.uint8)
+    codons[rows, columns] = buffer[source]
+
+    return AlignmentMatrix(protein.ids, protein.descriptions,
+                           codons.reshape(protein.n_seqs, protein.n_columns * 3))
+
+def back_translate_file(protein_file, cds_source, output_dir, args):
+    """Back-translate one gene and return its summary row"""
+    gene_name = gene_name_of(protein_file)
+    result = dict.fromkeys(SUMMARY_COLUMNS, '')
+    result.update(gene=gene_name, status='error')
+    output_file = output_dir / f"{gene_name}.codon.fa"
+
+    try:
+        with open_fasta(protein_file) as handle:
+            protein = AlignmentMatrix.read(handle)
+        result.update(n_seqs=protein.n_seqs, protein_length=protein.n_columns)
+        codon = back_translate(protein, cds_source.read(gene_name), args.codon_table)
+    except Exception as e:
+        print(f"  ERROR {gene_name}: {e}")
+        result['reason'] = str(e)
+        if args.empty_on_error:
+            output_file.write_text('')
+        return result
+
+    codon.write(output_file)
+    result.update(status='ok', codon_length=codon.n_columns, output=str(output_file))
+    return result
+
+def find_protein_alignments(args):
+    """Protein alignments from --file_list or --protein_aln, in a stable order"""
+    if args.file_list:
+        with open(args.file_list) as handle:
+            return [Path(line.strip()) for line in handle if line.strip()]
+
+    input_path = Path(args.protein_aln)
+    if input_path.is_file():
+        return [input_path]
+
+    files = set(input_path.glob(f'*/*{PROTEIN_SUFFIX}.fa')) | set(input_path.glob(f'*{PROTEIN_SUFFIX}.fa'))
+    return sorted(files)
+
+def main():
+    args = parse_arguments()
+
+    if not args.protein_aln and not args.file_list:
+        print("ERROR: Give either --protein_aln or --file_list")
+        sys.exit(1)
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    protein_files = find_protein_alignments(args)
+    if not protein_files:
+        print(f"ERROR: No protein alignments found in {args.protein_aln or args.file_list}")
+        sys.exit(1)
+
+    cds_source = CDSSource(args.cds)
+    if cds_source.bundle is None and cds_source.path.is_file() and len(protein_files) > 1:
+        print("ERROR: A single --cds file needs a single protein alignment")
+        sys.exit(1)
+
+    print(f"Back-translating {len(protein_files)} protein alignments")
+    print(f"  CDS: {args.cds}{' (bundle)' if cds_source.bundle is not None else ''}")
+    print(f"  Output directory: {output_dir}")
+    print()
+
+    results = []
+    for i, protein_file in enumerate(protein_files, 1):
+        results.append(back_translate_file(protein_file, cds_source, output_dir, args))
+        if i % 500 == 0:
+            print(f"  Back-translated {i} alignments...", flush=True)
+    cds_source.close()
+
+    summary_file = args.summary or output_dir / 'back_translate_summary.tsv'
+    write_summary(results, summary_file, SUMMARY_COLUMNS)
+
+    n_status = Counter(result['status'] for result in results)
+    print()
+    print("=== Summary ===")
+    print(f"Codon alignments: {n_status['ok']}")
+    print(f"Failed: {n_status['error']}")
+    print(f"Summary table: {summary_file}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+benchmark_cds_index.py
+Compare memory use and lookup throughput of the original in-memory
+dict-of-dicts CDS loader (every SeqRecord stored under all of its BioMart
+aliases) against the compact on-disk alias index in cds_store.py
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+from Bio import SeqIO
+from cds_store import find_cds_files, open_cds_store, species_from_path
+from fasta_io import open_fasta
+from extract_cds_biomart import biomart_keys
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Benchmark CDS alias index memory and lookup throughput'
+    )
+    parser.add_argument(
+        '--cds_dir',
+        type=str,
+        required=True,
+        help='Directory containing CDS FASTA files (e.g. dog and red fox)'
+    )
+    parser.add_argument(
+        '--n_lookups',
+        type=int,
+        default=200000,
+        help='Number of random alias lookups per species (default: 200000)'
+    )
+    return parser.parse_args()
+
+def load_dict_of_dicts(cds_files):
+    """The original extract_cds_biomart.load_cds_sequences data structure"""
+    cds_db = defaultdict(dict)
+    for cds_file in cds_files:
+        species = species_from_path(cds_file)
+        with open_fasta(cds_file) as handle:
+            records = list(SeqIO.parse(handle, 'fasta'))
+        for record in records:
+            for key in biomart_keys(record.id, record.description):
+                cds_db[species][key] = record
+    return cds_db
+
+def measure(label, build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} build {elapsed:7.2f}s   resident {current / 1e6:8.1f} MB   "
+          f"peak {peak / 1e6:8.1f} MB")
+    return result
+
+def rate(n, elapsed):
+    return f"{n / elapsed:,.0f}/s" if elapsed > 0 else "inf"
+
+def main():
+    args = parse_arguments()
+    cds_files = find_cds_files(args.cds_dir, patterns=('*.cds.fa', '*.fa', '*.cds.fa.gz', '*.fa.gz'))
+
+    print("=== Memory ===")
+    cds_db = measure("dict-of-dicts", lambda: load_dict_of_dicts(cds_files))
+    store = measure("compact alias index", lambda: open_cds_store(cds_files, biomart_keys))
+
+    print("\n=== Lookup throughput ===")
+    for species, aliases in cds_db.items():
+        keys = list(aliases.keys())
+        # Half hits, half misses
+        queries = random.choices(keys, k=args.n_lookups // 2) + \
+                  [f"{key}_missing" for key in random.choices(keys, k=args.n_lookups // 2)]
+        random.shuffle(queries)
+
+        start = time.perf_counter()
+        hits_dict = sum(1 for query in queries if query in aliases)
+        t_dict = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hits_scalar = sum(1 for query in queries if store.has(species, query))
+        t_scalar = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hits_vector = int((store.lookup(species, queries) >= 0).sum())
+        t_vector = time.perf_counter() - start
+
+        assert hits_dict == hits_scalar == hits_vector
+        print(f"{species}: {len(keys)} aliases, {len(queries)} lookups")
+        print(f"  dict-of-dicts          {rate(len(queries), t_dict)}")
+        print(f"  alias index (scalar)   {rate(len(queries), t_scalar)}")
+        print(f"  alias index (batch)    {rate(len(queries), t_vector)}")
+
+    store.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+cds_store.py
+Indexed on-disk access to CDS FASTA files
+
+Each CDS file gets a sidecar index (<file>.idx) listing the byte offset and
+length of every record. The index is built once and reused while the FASTA
+is unchanged, so extraction reads only the sequences it needs instead of
+loading whole genomes into memory.
+
+CDS files may be gzip or BGZF compressed (see fasta_io.py). For BGZF the
+index stores virtual offsets and records are read by seeking to their
+block; plain gzip has no random access, so such a file is decompressed into
+memory the first time one of its records is read.
+"""
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from Bio import SeqIO, bgzf
+from fasta_io import compression, open_bgzf_stream, open_fasta, strip_compression_suffix, virtual_offsets
+
+CDS_PATTERNS = (
+    '*.cds.fa', '*.cds.fasta', '*.fa',
+    '*.cds.fa.gz', '*.cds.fasta.gz', '*.fa.gz'
+)
+INDEX_SUFFIX = '.idx'
+
+def base_id(seq_id):
+    """Strip the version suffix from a sequence ID"""
+    return str(seq_id).split('.')[0]
+
+def transcript_keys(record_id, description):
+    """Default lookup key: the unversioned transcript ID"""
+    return [base_id(record_id)]
+
+def find_cds_files(cds_dir, patterns=CDS_PATTERNS):
+    """List CDS files in cds_dir matching any of the patterns (no duplicates)"""
+    cds_files = set()
+    for pattern in patterns:
+        cds_files.update(Path(cds_dir).glob(pattern))
+    return sorted(cds_files)
+
+def species_from_path(cds_file):
+    """Species name from a file named Species_name.cds.fa[.gz]"""
+    name = strip_compression_suffix(Path(cds_file).name)
+    return Path(name).stem.replace('.cds', '')
+
+def index_path(cds_file):
+    """Location of the sidecar index for a CDS file"""
+    cds_file = Path(cds_file)
+    return cds_file.with_name(cds_file.name + INDEX_SUFFIX)
+
+def scan_fasta(cds_file, threads=None):
+    """
+    Scan a FASTA file once and return (id, description, offset, length)
+    for every record, where offset/length span the header and sequence lines
+    in the uncompressed text. For BGZF files offset is a virtual offset.
+    """
+    entries = []
+    header = None
+    start = 0
+    offset = 0
+
+    block_table = []
+    if compression(cds_file) == 'bgzf':
+        handle = open_bgzf_stream(cds_file, threads, block_table)
+    else:
+        handle = open_fasta(cds_file, 'rb', threads)
+
+    with handle:
+        for line in handle:
+            if line.startswith(b'>'):
+                if header is not None:
+                    entries.append((*header, start, offset - start))
+                description = line[1:].decode().strip()
+                record_id = description.split(None, 1)[0] if description else ''
+                header = (record_id, description)
+                start = offset
+            offset += len(line)
+
+    if header is not None:
+        entries.append((*header, start, offset - start))
+
+    if block_table:
+        starts = virtual_offsets(block_table, [entry[2] for entry in entries])
+        entries = [
+            (record_id, description, start, length)
+            for (record_id, description, _, length), start in zip(entries, starts)
+        ]
+
+    return entries
+
+def _index_stamp(cds_file):
+    stat = Path(cds_file).stat()
+    return f"#{stat.st_size}\t{stat.st_mtime_ns}"
+
+def read_index(cds_file):
+    """Read the sidecar index, or return None if it is missing or stale"""
+    idx_file = index_path(cds_file)
+    if not idx_file.exists():
+        return None
+
+    with open(idx_file) as handle:
+        if handle.readline().rstrip('\n') != _index_stamp(cds_file):
+            return None
+
+        entries = []
+        for line in handle:
+            record_id, offset, length, description = line.rstrip('\n').split('\t', 3)
+            entries.append((record_id, description, int(offset), int(length)))
+
+    return entries
+
+def write_index(cds_file, entries):
+    """Write the sidecar index atomically"""
+    idx_file = index_path(cds_file)
+    tmp_file = idx_file.with_name(idx_file.name + '.tmp')
+
+    with open(tmp_file, 'w') as handle:
+        handle.write(_index_stamp(cds_file) + '\n')
+        for record_id, description, offset, length in entries:
+            handle.write(f"{record_id}\t{offset}\t{length}\t{description}\n")
+
+    os.replace(tmp_file, idx_file)
+
+def load_index(cds_file, rebuild=False):
+    """
+    Return (entries, built) for a CDS file, scanning the FASTA only if the
+    index is missing, stale or a rebuild was requested
+    """
+    entries = None if rebuild else read_index(cds_file)
+    if entries is not None:
+        return entries, False
+
+    entries = scan_fasta(cds_file)
+    write_index(cds_file, entries)
+    return entries, True
+
+class AliasIndex:
+    """
+    Compact two-level index for the records of one species
+
+    Records are kept once in a canonical table of parallel integer arrays
+    (file number, byte offset, length). Lookup keys are interned as a sorted
+    fixed-width byte array with an int32 array pointing each alias at its
+    canonical record, so five aliases per record cost a few dozen bytes
+    rather than five dict entries.
+    """
+
+    def __init__(self, file_ids, offsets, lengths, alias_keys, alias_records):
+        self.file_ids = file_ids
+        self.offsets = offsets
+        self.lengths = lengths
+        self.alias_keys = alias_keys
+        self.alias_records = alias_records
+
+    @classmethod
+    def build(cls, records, aliases):
+        """
+        records: list of (file_id, offset, length)
+        aliases: list of (alias, record number); later records win ties
+        """
+        file_ids = np.array([r[0] for r in records], dtype=np.int16)
+        offsets = np.array([r[1] for r in records], dtype=np.int64)
+        lengths = np.array([r[2] for r in records], dtype=np.int32)
+
+        keys = np.array([alias.encode() for alias, _ in aliases], dtype=np.bytes_)
+        record_numbers = np.array([number for _, number in aliases], dtype=np.int32)
+
+        # Sort by alias, then record number, and keep the last record per alias
+        order = np.lexsort((record_numbers, keys))
+        keys = keys[order]
+        record_numbers = record_numbers[order]
+        last = np.ones(len(keys), dtype=bool)
+        last[:-1] = keys[1:] != keys[:-1]
+
+        return cls(file_ids, offsets, lengths, keys[last], record_numbers[last])
+
+    @property
+    def n_records(self):
+        return len(self.offsets)
+
+    @property
+    def n_keys(self):
+        return len(self.alias_keys)
+
+    def _as_key_dtype(self, keys):
+        """
+        Cast query keys to the alias array's fixed width so searchsorted does
+        not promote (copy) the whole alias array. Keys longer than that width
+        cannot be aliases and are flagged so truncation never yields a match.
+        """
+        fits = np.char.str_len(keys) <= self.alias_keys.itemsize
+        return keys.astype(self.alias_keys.dtype), fits
+
+    def lookup(self, keys):
+        """Canonical record number for each key (-1 where unknown)"""
+        keys = np.asarray(keys, dtype=np.bytes_)
+        if len(self.alias_keys) == 0 or len(keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int32)
+
+        keys, fits = self._as_key_dtype(keys)
+        pos = np.searchsorted(self.alias_keys, keys)
+        pos = np.minimum(pos, len(self.alias_keys) - 1)
+        found = fits & (self.alias_keys[pos] == keys)
+        return np.where(found, self.alias_records[pos], -1).astype(np.int32)
+
+    def lookup_one(self, key):
+        key = str(key).encode()
+        if len(key) > self.alias_keys.itemsize:
+            return -1
+
+        key = np.bytes_(key)
+        pos = int(self.alias_keys.searchsorted(key))
+        if pos < len(self.alias_keys) and self.alias_keys[pos] == key:
+            return int(self.alias_records[pos])
+        return -1
+
+class CDSStore:
+    """
+    Random access to CDS records by species and sequence ID
+
+    Only record locations are kept in memory (one AliasIndex per species);
+    sequences are read from disk when requested. key_function(record_id,
+    description) returns the lookup keys for a record; later records win
+    when two records share a key.
+    """
+
+    def __init__(self, key_function=transcript_keys):
+        self.key_function = key_function
+        self._files = []
+        self._compression = []
+        self._pending = {}
+        self._indexes = {}
+        self._handles = {}
+        self.frozen = False
+
+    def add(self, species, cds_file, entries):
+        """Register the indexed records of one CDS file under a species"""
+        if self.frozen:
+            raise RuntimeError(f"cannot add {cds_file}: the CDS store is frozen")
+        file_id = len(self._files)
+        self._files.append(Path(cds_file))
+        self._compression.append(compression(cds_file))
+
+        records, aliases = self._pending.setdefault(species, ([], []))
+        self._indexes.pop(species, None)
+
+        for record_id, description, offset, length in entries:
+            number = len(records)
+            records.append((file_id, offset, length))
+            aliases.extend((key, number) for key in self.key_function(record_id, description))
+
+    def index(self, species):
+        """AliasIndex for a species (None if the species is unknown)"""
+        if species not in self._indexes and species in self._pending:
+            records, aliases = self._pending[species]
+            self._indexes[species] = AliasIndex.build(records, aliases)
+        return self._indexes.get(species)
+
+    @property
+    def species(self):
+        return list(self._pending.keys())
+
+    def n_records(self, species):
+        index = self.index(species)
+        return index.n_records if index is not None else 0
+
+    def n_keys(self, species):
+        index = self.index(species)
+        return index.n_keys if index is not None else 0
+
+    def lookup(self, species, keys):
+        """Vectorised lookup: canonical record number per key (-1 if unknown)"""
+        index = self.index(species)
+        if index is None:
+            return np.full(len(keys), -1, dtype=np.int32)
+        return index.lookup(keys)
+
+    def has(self, species, key):
+        index = self.index(species)
+        return index is not None and index.lookup_one(key) >= 0
+
+    def get(self, species, key):
+        """Read one record from disk, or return None if the key is unknown"""
+        index = self.index(species)
+        number = index.lookup_one(key) if index is not None else -1
+        if number < 0:
+            return None
+        return self.read(species, number)
+
+    def _open(self, file_id):
+        """Seekable binary handle for a CDS file (offsets as in its index)"""
+        cds_file = self._files[file_id]
+        kind = self._compression[file_id]
+        if kind == 'bgzf':
+            return bgzf.BgzfReader(cds_file, 'rb')
+        if kind == 'gzip':
+            with open_fasta(cds_file, 'rb') as handle:
+                return io.BytesIO(handle.read())
+        return open(cds_file, 'rb')
+
+    def read(self, species, number):
+        """Read canonical record number of a species from disk"""
+        index = self.index(species)
+        file_id = int(index.file_ids[number])
+
+        handle = self._handles.get(file_id)
+        if handle is None:
+            handle = self._open(file_id)
+            self._handles[file_id] = handle
+
+        handle.seek(int(index.offsets[number]))
+        text = handle.read(int(index.lengths[number])).decode()
+        return SeqIO.read(io.StringIO(text), 'fasta')
+
+    def freeze(self):
+        """
+        Build all alias indexes and drop the build-time lists; no files can
+        be added afterwards
+        """
+        for species in self._pending:
+            self.index(species)
+            self._pending[species] = None
+        self.frozen = True
+
+    def close(self):
+        for handle in self._handles.values():
+            handle.close()
+        self._handles.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _load_index_worker(task):
+    cds_file, rebuild = task
+    return load_index(cds_file, rebuild=rebuild)
+
+def open_cds_store(cds_files, key_function=transcript_keys, rebuild=False, workers=1):
+    """
+    Index (or reuse the indexes of) all CDS files and return a CDSStore
+
+    With workers > 1 each species file is scanned and indexed in its own
+    process; the indexes are merged into the store in file order.
+    """
+    store = CDSStore(key_function)
+
+    workers = max(1, min(workers, len(cds_files)))
+    print(f"Indexing CDS sequences from {len(cds_files)} files "
+          f"({workers} worker{'s' if workers > 1 else ''})...")
+
+    tasks = [(cds_file, rebuild) for cds_file in cds_files]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            indexes = list(pool.map(_load_index_worker, tasks))
+    else:
+        indexes = map(_load_index_worker, tasks)
+
+    for cds_file, (entries, built) in zip(cds_files, indexes):
+        species = species_from_path(cds_file)
+        store.add(species, cds_file, entries)
+
+        status = "built index" if built else "cached index"
+        kind = compression(cds_file)
+        if kind == 'gzip':
+            status += ", gzip: bgzip it for random access"
+        elif kind == 'bgzf':
+            status += ", bgzf"
+        print(f"  {species}: {len(entries)} sequences ({status})")
+
+    store.freeze()
+    return store
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+codon_translation.py
+Batched codon translation through a 64-entry lookup table
+
+Sequences are encoded as uint8 arrays of IUPAC base masks (A=1, C=2, G=4,
+T/U=8, R=A|G, ..., N=15, gap=0) and a whole batch is translated at once by
+indexing a codon table with (m1 << 8) | (m2 << 4) | m3. The table is derived
+from the 64 unambiguous codons of the NCBI genetic code. Used by the CDS
+extraction scripts and by the stop-codon check in filter_alignments.py.
+
+Codons that are not plain ACGT are handled explicitly:
+  - '---'                         -> '-'
+  - partial gaps ('A-G', '-TT')   -> 'X'
+  - ambiguous bases               -> the amino acid (or '*') shared by every
+                                     codon they can stand for, else 'X'
+A trailing partial codon is ignored, as in Bio.Seq.translate.
+"""
+
+import numpy as np
+from Bio.Data import CodonTable
+
+NUCLEOTIDES = 'ACGT'
+GAP_MASK = 0
+
+STOP = ord('*')
+GAP = ord('-')
+UNKNOWN = ord('X')
+
+IUPAC_BASES = {
+    'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T', 'U': 'T',
+    'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT', 'M': 'AC',
+    'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG', 'N': 'ACGT'
+}
+
+# Byte -> base mask lookup; unknown characters are treated as N
+BASE_MASK = np.full(256, 15, dtype=np.uint8)
+for symbol, bases in IUPAC_BASES.items():
+    mask = sum(1 << NUCLEOTIDES.index(base) for base in bases)
+    BASE_MASK[ord(symbol)] = mask
+    BASE_MASK[ord(symbol.lower())] = mask
+BASE_MASK[ord('-')] = GAP_MASK
+BASE_MASK[ord('.')] = GAP_MASK
+
+_tables = {}
+
+def _mask_bases(mask):
+    return [i for i in range(4) if mask & (1 << i)]
+
+def codon_lookup(table=1):
+    """
+    Return (codon_lut, mask_lut) for an NCBI translation table
+
+    codon_lut maps the 64 codon indices 16*b1 + 4*b2 + b3 (A=0, C=1, G=2,
+    T=3) to amino-acid bytes. mask_lut extends it to all 4096 combinations
+    of base masks.
+    """
+    if table not in _tables:
+        codon_table = CodonTable.unambiguous_dna_by_id[table]
+
+        codon_lut = np.empty(64, dtype=np.uint8)
+        for i in range(64):
+            codon = NUCLEOTIDES[i >> 4] + NUCLEOTIDES[(i >> 2) & 3] + NUCLEOTIDES[i & 3]
+            codon_lut[i] = ord(codon_table.forward_table.get(codon, '*'))
+
+        mask_lut = np.full(4096, UNKNOWN, dtype=np.uint8)
+        mask_lut[0] = GAP
+        for m1 in range(1, 16):
+            for m2 in range(1, 16):
+                for m3 in range(1, 16):
+                    residues = {
+                        codon_lut[16 * b1 + 4 * b2 + b3]
+                        for b1 in _mask_bases(m1)
+                        for b2 in _mask_bases(m2)
+                        for b3 in _mask_bases(m3)
+                    }
+                    if len(residues) == 1:
+                        mask_lut[(m1 << 8) | (m2 << 4) | m3] = residues.pop()
+
+        _tables[table] = (codon_lut, mask_lut)
+
+    return _tables[table]
+
+def encode(sequence):
+    """Encode one sequence as a uint8 base-mask array"""
+    return BASE_MASK[np.frombuffer(str(sequence).encode('ascii'), dtype=np.uint8)]
+
+class TranslationBatch:
+    """
+    Translations of a batch of sequences
+
+    residues holds all translated codons back to back as uint8 amino-acid
+    bytes; sequence i occupies residues[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, residues, offsets):
+        self.residues = residues
+        self.offsets = offsets
+        self.n_codons = np.diff(offsets)
+
+        # Stop codons as (sequence, codon position) pairs
+        stops = np.flatnonzero(residues == STOP)
+        self._stop_seq = np.searchsorted(offsets, stops, side='right') - 1
+        self._stop_pos = stops - offsets[self._stop_seq]
+
+    def __len__(self):
+        return len(self.n_codons)
+
+    def stop_positions(self, i):
+        """Codon positions of all stop codons in sequence i"""
+        return self._stop_pos[self._stop_seq == i]
+
+    @property
+    def first_stop(self):
+        """Codon position of the first stop per sequence (-1 if none)"""
+        first = np.full(len(self), -1, dtype=np.int64)
+        seqs, index = np.unique(self._stop_seq, return_index=True)
+        first[seqs] = self._stop_pos[index]
+        return first
+
+    @property
+    def internal_stop(self):
+        """True for sequences with a stop codon before their last codon"""
+        internal = self._stop_pos < self.n_codons[self._stop_seq] - 1
+        flags = np.zeros(len(self), dtype=bool)
+        flags[self._stop_seq[internal]] = True
+        return flags
+
+    def protein(self, i, to_stop=False):
+        """Protein string for sequence i, optionally truncated at the first stop"""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if to_stop:
+            stops = self.stop_positions(i)
+            if len(stops):
+                end = start + stops[0]
+        return self.residues[start:end].tobytes().decode('ascii')
+
+    def proteins(self, to_stop=False):
+        return [self.protein(i, to_stop=to_stop) for i in range(len(self))]
+
+def translate_batch(sequences, table=1):
+    """Translate a list of nucleotide sequences (str or Seq) in one pass"""
+    _, mask_lut = codon_lookup(table)
+
+    # Drop trailing partial codons and concatenate into one buffer
+    sequences = [str(seq) for seq in sequences]
+    n_codons = np.array([len(seq) // 3 for seq in sequences], dtype=np.int64)
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum(n_codons, out=offsets[1:])
+
+    joined = ''.join(seq[:n * 3] for seq, n in zip(sequences, n_codons))
+    masks = encode(joined).reshape(-1, 3).astype(np.intp)
+
+    # Gaps map to '-' only when the whole codon is gapped; partial gaps
+    # and unresolvable ambiguity come out of the table as 'X'
+    residues = mask_lut[(masks[:, 0] << 8) | (masks[:, 1] << 4) | masks[:, 2]]
+
+    return TranslationBatch(residues, offsets)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+codon_trimming.py
+Codon-aware column trimming for AlignmentMatrix alignments
+
+Columns are scored and kept or dropped as whole codons (triplets of
+alignment columns), so trimming never shifts the reading frame. A trailing
+partial codon is always dropped. Scores are computed over the whole matrix
+at once:
+
+  gap fraction   - fraction of sequences whose codon contains a gap or N
+  conservation   - frequency of the most common complete codon in the column
+                   (gapped and ambiguous codons count against it)
+
+Trimming modes (trimAl-like):
+  edges        - the original --trim_edges: drop leading/trailing nucleotide
+                 columns with >= 80% gaps (not codon-aware, kept as is)
+  gap          - drop codons with gap fraction > --trim_gap_threshold
+  conservation - drop codons with conservation < --trim_min_conservation
+  gappyout     - automated gap cutoff: the knee of the sorted gap-fraction
+                 curve, so the gappy tail of the distribution is removed
+  strict       - gappyout plus an automated conservation cutoff (knee of the
+                 sorted conservation curve), then drop kept blocks shorter
+                 than MIN_BLOCK codons
+  automated    - strict for poorly conserved alignments (mean conservation
+                 below AUTOMATED_CONSERVATION), else gappyout
+
+Automated cutoffs are never below MIN_KNEE_CUTOFF or one sequence's share
+(1 / n_seqs): when most codons are ungapped the knee sits at 0, which would
+drop every codon with a single gap. AUTOMATED_CONSERVATION is the average
+identity at which trimAl's automated1 heuristic switches between gappyout
+and strict (Capella-Gutierrez et al. 2009); mean codon conservation stands
+in for average pairwise identity here.
+"""
+
+import numpy as np
+from alignment_matrix import IS_GAP
+
+TRIM_MODES = ('edges', 'gap', 'conservation', 'gappyout', 'strict', 'automated')
+EDGE_GAP_THRESHOLD = 0.8
+MIN_BLOCK = 3
+AUTOMATED_CONSERVATION = 0.55
+MIN_KNEE_CUTOFF = 0.1
+
+# Byte -> base index (A=0, C=1, G=2, T=3, anything else 4)
+BASE_INDEX = np.full(256, 4, dtype=np.uint8)
+for i, base in enumerate('ACGT'):
+    BASE_INDEX[ord(base)] = i
+    BASE_INDEX[ord(base.lower())] = i
+
+def codon_view(data):
+    """(n_seqs, n_codons, 3) view of a matrix, without a trailing partial codon"""
+    n_codons = data.shape[1] // 3
+    return data[:, :n_codons * 3].reshape(data.shape[0], n_codons, 3)
+
+def codon_gap_fraction(matrix):
+    """Fraction of sequences whose codon contains a gap or N, per codon column"""
+    gapped = IS_GAP[codon_view(matrix.data)].any(axis=2)
+    if matrix.n_seqs == 0:
+        return np.ones(gapped.shape[1])
+    return gapped.mean(axis=0)
+
+def codon_conservation(matrix):
+    """Frequency of the most common complete codon, per codon column"""
+    bases = codon_view(BASE_INDEX[matrix.data]).astype(np.int64)
+    n_seqs, n_codons, _ = bases.shape
+    if n_seqs == 0 or n_codons == 0:
+        return np.zeros(n_codons)
+
+    # One bincount over (column, codon) pairs; incomplete codons go to a
+    # spare bin past the end
+    valid = (bases < 4).all(axis=2)
+    codes = bases[:, :, 0] * 16 + bases[:, :, 1] * 4 + bases[:, :, 2]
+    codes += 64 * np.arange(n_codons)[None, :]
+    codes[~valid] = 64 * n_codons
+
+    counts = np.bincount(codes.ravel(), minlength=64 * n_codons + 1)[:64 * n_codons]
+    return counts.reshape(n_codons, 64).max(axis=1) / n_seqs
+
+def knee_cutoff(scores, minimum=0.0):
+    """
+    Automated cutoff for a score where higher is worse: sort the scores and
+    return the value at the knee of the curve, i.e. the point farthest below
+    the chord from the smallest to the largest score, but at least minimum
+    """
+    ordered = np.sort(scores)
+    if len(ordered) < 3 or ordered[0] == ordered[-1]:
+        return max(ordered[-1], minimum) if len(ordered) else minimum
+
+    x = np.linspace(0.0, 1.0, len(ordered))
+    y = (ordered - ordered[0]) / (ordered[-1] - ordered[0])
+    return max(ordered[np.argmax(x - y)], minimum)
+
+def drop_short_blocks(keep, min_block):
+    """Clear runs of kept codons shorter than min_block"""
+    padded = np.concatenate(([False], keep, [False]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    starts, ends = edges[::2], edges[1::2]
+
+    keep = keep.copy()
+    for start, end in zip(starts, ends):
+        if end - start < min_block:
+            keep[start:end] = False
+    return keep
+
+def select_codons(matrix, mode, gap_threshold=0.5, min_conservation=0.5):
+    """Boolean mask of codon columns to keep for a codon-aware trimming mode"""
+    gaps = codon_gap_fraction(matrix)
+
+    if mode == 'gap':
+        return gaps <= gap_threshold
+
+    conservation = codon_conservation(matrix)
+
+    if mode == 'conservation':
+        return conservation >= min_conservation
+
+    if mode == 'automated':
+        mean_conservation = conservation.mean() if len(conservation) else 0.0
+        mode = 'strict' if mean_conservation < AUTOMATED_CONSERVATION else 'gappyout'
+
+    # Tolerate at least one gapped (or differing) sequence per codon
+    minimum = max(MIN_KNEE_CUTOFF, 1.0 / matrix.n_seqs) if matrix.n_seqs else MIN_KNEE_CUTOFF
+    keep = gaps <= knee_cutoff(gaps, minimum)
+    if mode == 'gappyout':
+        return keep
+
+    if mode == 'strict':
+        keep &= (1.0 - conservation) <= knee_cutoff(1.0 - conservation, minimum)
+        return drop_short_blocks(keep, MIN_BLOCK)
+
+    raise ValueError(f"Unknown codon trimming mode: {mode}")
+
+def trim_columns(matrix, mode, gap_threshold=0.5, min_conservation=0.5,
+                 edge_gap_threshold=EDGE_GAP_THRESHOLD, gap_mask=None):
+    """
+    Columns to keep for a trimming mode: a slice for 'edges', an index array
+    for the codon-aware modes, or None if no column survives
+    """
+    if mode == 'edges':
+        if gap_mask is None:
+            column_gaps = matrix.column_gap_fraction()
+        else:
+            column_gaps = gap_mask.mean(axis=0) if matrix.n_seqs else np.ones(matrix.n_columns)
+        bounds = matrix.edge_bounds(edge_gap_threshold, column_gaps)
+        return None if bounds is None else slice(*bounds)
+
+    keep = select_codons(matrix, mode, gap_threshold, min_conservation)
+    if not keep.any():
+        return None
+
+    codons = np.flatnonzero(keep)
+    return (3 * codons[:, None] + np.arange(3)[None, :]).ravel()
@@ -5,14 +5,17 @@ Extract orthologous CDS sequences from genome annotations based on Ensembl Compa
 """
 
 import argparse
-import os
 import sys
-from pathlib import Path
-from Bio import SeqIO
+import time
+from itertools import groupby
+from operator import itemgetter
 from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
 import pandas as pd
-from collections import defaultdict
+from cds_store import base_id, find_cds_files, open_cds_store
+from ortholog_bundle import open_ortholog_output
+from codon_translation import translate_batch
+from extraction_manifest import ExtractionManifest, group_digest
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -60,42 +63,173 @@ def parse_arguments():
         default='gene_name',
         help='Column name for gene name/symbol'
     )
+    parser.add_argument(
+        '--rebuild_index',
+        action='store_true',
+        help='Rebuild the on-disk CDS indexes even if they are up to date'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of processes used to index species CDS files in parallel (default: 1)'
+    )
+    parser.add_argument(
+        '--bundle',
+        type=str,
+        default=None,
+        help='Write all ortholog groups into one packed bundle file instead of per-gene directories'
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Only rewrite ortholog groups whose inputs changed since the last run '
+             '(per extraction_manifest.tsv) and delete groups that disappeared'
+    )
+    parser.add_argument(
+        '--grouping',
+        type=str,
+        choices=['columnar', 'iterrows'],
+        default='columnar',
+        help='Ortholog resolution path: columnar (default) or the original groupby/iterrows loop'
+    )
     return parser.parse_args()
 
-def load_cds_sequences(cds_dir):
-    """Load all CDS sequences into memory indexed by transcript ID"""
-    cds_db = defaultdict(dict)
-
-    cds_files = list(Path(cds_dir).glob('*.cds.fa')) + \
-                list(Path(cds_dir).glob('*.cds.fasta')) + \
-                list(Path(cds_dir).glob('*.fa'))
+def load_cds_sequences(cds_dir, rebuild=False, workers=1):
+    """Open an indexed CDS store keyed by species and unversioned transcript ID"""
+    cds_files = find_cds_files(cds_dir)
 
     if not cds_files:
         print(f"ERROR: No CDS files found in {cds_dir}")
         print("Expected naming: Species_name.cds.fa")
         sys.exit(1)
 
-    print(f"Loading CDS sequences from {len(cds_files)} files...")
+    return open_cds_store(cds_files, rebuild=rebuild,
+                          workers=workers)
+
+def resolve_orthologs(df, cds_store, args):
+    """
+    Columnar resolution of ortholog groups
+
+    ID normalisation, the join against the CDS index, per-gene species counts
+    and the --min_species filter run on whole columns. Returns
+    (groups, skipped_few_species, skipped_missing_seqs) where groups is a
+    sorted list of (gene_name, [(species, transcript_id), ...]).
+    """
+    genes = df[args.gene_col]
+    keep = genes.notna() & (genes.astype(str) != '')
+
+    table = pd.DataFrame({
+        'gene': genes[keep],
+        'species': df.loc[keep, args.species_col],
+        'transcript_id': df.loc[keep, args.id_col].astype(str).str.split('.', n=1).str[0]
+    })
+
+    # Join against the sequence index, one species at a time
+    found = pd.Series(False, index=table.index)
+    for species in table['species'].dropna().unique():
+        in_species = table['species'] == species
+        found[in_species] = cds_store.lookup(species, table.loc[in_species, 'transcript_id']) >= 0
+
+    # Per-gene species coverage and number of sequences found
+    n_species = table.groupby('gene')['species'].transform('nunique')
+    n_found = found.groupby(table['gene']).transform('sum')
+    enough_species = n_species >= args.min_species
+    enough_found = n_found >= args.min_species
+
+    skipped_few_species = table.loc[~enough_species, 'gene'].nunique()
+    skipped_missing_seqs = table.loc[enough_species & ~enough_found, 'gene'].nunique()
+
+    missing = table[enough_species & ~found].sort_values('gene', kind='stable')
+    for gene_name, species, transcript_id in zip(missing['gene'], missing['species'],
+                                                 missing['transcript_id']):
+        print(f"  Warning: Could not find {transcript_id} for {species} in {gene_name}")
+
+    selected = table[enough_species & enough_found & found].sort_values('gene', kind='stable')
+    rows = zip(selected['gene'], selected['species'], selected['transcript_id'])
+
+    gene_groups = [
+        (gene_name, [(species, transcript_id) for _, species, transcript_id in members])
+        for gene_name, members in groupby(rows, key=itemgetter(0))
+    ]
+
+    return gene_groups, skipped_few_species, skipped_missing_seqs
+
+def resolve_orthologs_iterrows(df, cds_store, args):
+    """Original per-gene groupby + iterrows resolution, kept for benchmarking"""
+    gene_groups = []
+    skipped_few_species = 0
+    skipped_missing_seqs = 0
 
-    for cds_file in cds_files:
-        # Extract species name from filename
-        species = cds_file.stem.replace('.cds', '')
+    for gene_name, group in df.groupby(args.gene_col):
+        if pd.isna(gene_name) or gene_name == '':
+            continue
 
-        print(f"  Loading {species}...")
-        count = 0
+        # Check minimum species coverage
+        n_species = group[args.species_col].nunique()
+        if n_species < args.min_species:
+            skipped_few_species += 1
+            continue
 
-        for record in SeqIO.parse(cds_file, 'fasta'):
-            # Store by transcript ID
-            # Handle different ID formats (Ensembl, NCBI, etc.)
-            transcript_id = record.id.split('.')[0]  # Remove version numbers
-            cds_db[species][transcript_id] = record
-            count += 1
+        members = []
+        for _, row in group.iterrows():
+            species = row[args.species_col]
+            transcript_id = base_id(row[args.id_col])
 
-        print(f"    Loaded {count} sequences")
+            if cds_store.has(species, transcript_id):
+                members.append((species, transcript_id))
+            else:
+                print(f"  Warning: Could not find {transcript_id} for {species} in {gene_name}")
 
-    return cds_db
+        if len(members) >= args.min_species:
+            gene_groups.append((gene_name, members))
+        else:
+            skipped_missing_seqs += 1
 
-def extract_orthologs(ortholog_table, cds_db, args):
+    return gene_groups, skipped_few_species, skipped_missing_seqs
+
+def write_ortholog_group(gene_name, members, cds_store, output, manifest, args):
+    """
+    Write CDS and protein FASTA for one resolved ortholog group
+
+    Returns False if --incremental found the group unchanged and skipped it.
+    """
+    # Fetch sequences from the indexed store and rename for clarity
+    sequences = []
+    for species, transcript_id in members:
+        seq_record = cds_store.get(species, transcript_id)
+        sequences.append(SeqRecord(
+            seq_record.seq,
+            id=f"{species}",
+            description=f"{gene_name} | {transcript_id}"
+        ))
+
+    # Leave unchanged groups (and their mtimes) alone in incremental mode
+    digest = group_digest(sequences)
+    if manifest is not None:
+        unchanged = args.incremental and manifest.unchanged(gene_name, digest, output)
+        manifest.record(gene_name, digest)
+        if unchanged:
+            return False
+
+    # Save CDS sequences
+    output.write_fasta(gene_name, 'cds.fa', sequences)
+
+    # Also translate to protein for alignment (whole group in one batch)
+    translations = translate_batch([seq_rec.seq for seq_rec in sequences])
+    protein_seqs = [
+        SeqRecord(
+            Seq(translations.protein(i, to_stop=True)),
+            id=seq_rec.id,
+            description=seq_rec.description
+        )
+        for i, seq_rec in enumerate(sequences)
+    ]
+
+    output.write_fasta(gene_name, 'protein.fa', protein_seqs)
+    return True
+
+def extract_orthologs(ortholog_table, cds_store, args):
     """Extract orthologous sequences and organize by gene family"""
 
     print(f"\nReading ortholog table: {args.orthologs}")
@@ -114,97 +248,63 @@ def extract_orthologs(ortholog_table, cds_db, args):
         print("\nPlease specify correct column names using --id_col, --species_col, --gene_col")
         sys.exit(1)
 
-    # Group by gene name
-    gene_groups = df.groupby(args.gene_col)
+    print(f"\nFound {df[args.gene_col].nunique()} ortholog groups")
 
-    print(f"\nFound {len(gene_groups)} ortholog groups")
+    # Resolve which rows have sequences and which genes pass --min_species
+    resolve = resolve_orthologs if args.grouping == 'columnar' else resolve_orthologs_iterrows
 
-    extracted = 0
-    skipped_few_species = 0
-    skipped_missing_seqs = 0
+    start = time.perf_counter()
+    gene_groups, skipped_few_species, skipped_missing_seqs = resolve(df, cds_store, args)
+    elapsed = time.perf_counter() - start
 
-    for gene_name, group in gene_groups:
-        if pd.isna(gene_name) or gene_name == '':
-            continue
+    rate = len(df) / elapsed if elapsed > 0 else float('inf')
+    print(f"Resolved {len(df)} rows in {elapsed:.2f}s "
+          f"({rate:,.0f} rows/sec, {args.grouping} path)")
 
-        # Check minimum species coverage
-        n_species = group[args.species_col].nunique()
-        if n_species < args.min_species:
-            skipped_few_species += 1
-            continue
+    extracted = 0
+    unchanged = 0
 
-        # Create output directory for this gene
-        gene_dir = Path(args.out) / gene_name
-        gene_dir.mkdir(parents=True, exist_ok=True)
+    # The content-hash manifest is kept for per-gene directory output only
+    manifest = None if args.bundle else ExtractionManifest(args.out)
 
-        # Extract sequences
-        sequences = []
-        for _, row in group.iterrows():
-            species = row[args.species_col]
-            transcript_id = str(row[args.id_col]).split('.')[0]
-
-            # Try to find sequence
-            if species in cds_db and transcript_id in cds_db[species]:
-                seq_record = cds_db[species][transcript_id]
-
-                # Rename for clarity
-                new_id = f"{species}"
-                new_record = SeqRecord(
-                    seq_record.seq,
-                    id=new_id,
-                    description=f"{gene_name} | {transcript_id}"
-                )
-                sequences.append(new_record)
-            else:
-                print(f"  Warning: Could not find {transcript_id} for {species} in {gene_name}")
+    with open_ortholog_output(args.out, args.bundle) as output:
+        for gene_name, members in gene_groups:
+            if not write_ortholog_group(gene_name, members, cds_store, output, manifest, args):
+                unchanged += 1
+            extracted += 1
 
-        # Only save if we have enough sequences
-        if len(sequences) >= args.min_species:
-            # Save CDS sequences
-            cds_output = gene_dir / f"{gene_name}.cds.fa"
-            SeqIO.write(sequences, cds_output, 'fasta')
-
-            # Also translate to protein for alignment
-            protein_seqs = []
-            for seq_rec in sequences:
-                try:
-                    # Translate CDS
-                    protein_seq = seq_rec.seq.translate(to_stop=True)
-                    protein_rec = SeqRecord(
-                        protein_seq,
-                        id=seq_rec.id,
-                        description=seq_rec.description
-                    )
-                    protein_seqs.append(protein_rec)
-                except Exception as e:
-                    print(f"  Warning: Could not translate {seq_rec.id} in {gene_name}: {e}")
-
-            if len(protein_seqs) >= args.min_species:
-                protein_output = gene_dir / f"{gene_name}.protein.fa"
-                SeqIO.write(protein_seqs, protein_output, 'fasta')
-                extracted += 1
-
-                if extracted % 100 == 0:
-                    print(f"  Extracted {extracted} ortholog groups...")
-            else:
-                skipped_missing_seqs += 1
-        else:
-            skipped_missing_seqs += 1
+            if extracted % 100 == 0:
+                print(f"  Extracted {extracted} ortholog groups...")
+
+    removed = []
+    if manifest is not None:
+        if args.incremental:
+            removed = manifest.remove_stale()
+        manifest.save()
 
     print(f"\n=== Summary ===")
     print(f"Successfully extracted: {extracted} ortholog groups")
+    if args.incremental:
+        print(f"  Rewritten: {extracted - unchanged}, unchanged: {unchanged}")
+        print(f"Removed (no longer extracted): {len(removed)}")
     print(f"Skipped (too few species): {skipped_few_species}")
     print(f"Skipped (missing sequences): {skipped_missing_seqs}")
-    print(f"\nOutput directory: {args.out}")
+    print(f"\nOutput: {args.bundle or args.out}")
 
 def main():
     args = parse_arguments()
 
-    # Load all CDS sequences
-    cds_db = load_cds_sequences(args.cds_dir)
+    if args.incremental and args.bundle:
+        print("ERROR: --incremental works on per-gene directories, not --bundle output")
+        sys.exit(1)
+
+    # Index CDS files (sequences are read on demand)
+    cds_store = load_cds_sequences(args.cds_dir, rebuild=args.rebuild_index,
+                                   workers=args.workers)
 
     # Extract orthologs
-    extract_orthologs(args.orthologs, cds_db, args)
+    with cds_store:
+        extract_orthologs(args.orthologs, cds_store, args)
 
     print("\nDone!")
 
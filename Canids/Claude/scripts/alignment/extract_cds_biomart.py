@@ -7,13 +7,18 @@ This version is specifically designed for Ensembl BioMart output format
 """
 
 import argparse
-import os
 import sys
-from pathlib import Path
-from Bio import SeqIO
+from itertools import groupby
+from operator import itemgetter
+from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
+import numpy as np
 import pandas as pd
-from collections import defaultdict
+from cds_store import find_cds_files, open_cds_store
+from ortholog_bundle import open_ortholog_output
+from codon_translation import translate_batch
+from extraction_manifest import ExtractionManifest, group_digest
+from ortholog_table import CACHE_FORMATS, iter_gene_chunks, read_ortholog_table, table_columns
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -43,76 +48,132 @@ def parse_arguments():
         default=2,
         help='Minimum number of species required per ortholog group'
     )
+    parser.add_argument(
+        '--species_columns',
+        type=str,
+        default=None,
+        help='Species-to-column mapping (e.g. config/biomart_species_columns.tsv); '
+             'enables the generic N-species extractor'
+    )
+    parser.add_argument(
+        '--group_col',
+        type=str,
+        default='Gene stable ID',
+        help='Column defining ortholog groups in --species_columns mode (default: Gene stable ID)'
+    )
+    parser.add_argument(
+        '--table_cache',
+        choices=CACHE_FORMATS,
+        default=None,
+        help='Cache the column-pruned ortholog table next to the TSV in this format '
+             'so repeat runs skip parsing it (requires pyarrow)'
+    )
+    parser.add_argument(
+        '--chunksize',
+        type=int,
+        default=None,
+        help='Stream the ortholog table in chunks of about this many rows, cut at gene '
+             'boundaries (rows of a gene must be contiguous; not combined with --table_cache)'
+    )
+    parser.add_argument(
+        '--bundle',
+        type=str,
+        default=None,
+        help='Write all ortholog groups into one packed bundle file instead of per-gene directories'
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Only rewrite ortholog groups whose inputs changed since the last run '
+             '(per extraction_manifest.tsv) and delete groups that disappeared'
+    )
+    parser.add_argument(
+        '--rebuild_index',
+        action='store_true',
+        help='Rebuild the on-disk CDS indexes even if they are up to date'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of processes used to index species CDS files in parallel (default: 1)'
+    )
     return parser.parse_args()
 
-def load_cds_sequences(cds_dir):
-    """Load all CDS sequences into memory indexed by various ID formats"""
-    cds_db = defaultdict(dict)
-
-    cds_files = list(Path(cds_dir).glob('*.cds.fa')) + \
-                list(Path(cds_dir).glob('*.fa'))
+def biomart_keys(record_id, description):
+    """All IDs a BioMart row may use to refer to a CDS record"""
+    # Store multiple ID formats for flexible matching
+    # NCBI: lcl|NC_051806.1_cds_XP_038283495.1_1
+    # Ensembl: ENSCAFT00000000001.1
+    base_id = record_id.split('.')[0]  # Remove version
+    keys = [record_id, base_id]
+
+    # If it's an NCBI ID, also store the protein ID part
+    if '|' in record_id:
+        for part in record_id.split('|'):
+            if part.startswith('XP_') or part.startswith('NP_'):
+                keys.append(part.split('.')[0])
+
+    # For Ensembl: parse gene ID from description
+    # Header format: >ENSCAFT00845000002.1 cds ... gene:ENSCAFG00845000001.1 ...
+    if 'gene:' in description:
+        gene_field = description.split('gene:')[1].split()[0]
+        keys.append(gene_field.split('.')[0])  # Remove version
+        keys.append(gene_field)  # Also store with version
+
+    # For Ensembl: convert transcript IDs to potential protein IDs
+    # ENSCAFT (transcript) might map to ENSCAFP (protein)
+    # ENSVVUT (transcript) might map to ENSVVUP (protein)
+    if 'T00' in base_id:
+        keys.append(base_id.replace('T00', 'P00'))
+
+    return keys
+
+def load_cds_sequences(cds_dir, rebuild=False, workers=1):
+    """Open an indexed CDS store keyed by the various ID formats"""
+    cds_files = find_cds_files(cds_dir, patterns=('*.cds.fa', '*.fa', '*.cds.fa.gz', '*.fa.gz'))
 
     if not cds_files:
         print(f"ERROR: No CDS files found in {cds_dir}")
         sys.exit(1)
 
-    print(f"Loading CDS sequences from {len(cds_files)} files...")
-
-    for cds_file in cds_files:
-        # Extract species name from filename
-        species = cds_file.stem.replace('.cds', '')
-
-        print(f"  Loading {species}...")
-        count = 0
-
-        for record in SeqIO.parse(cds_file, 'fasta'):
-            # Store by multiple ID formats
-            # NCBI: lcl|NC_051806.1_cds_XP_038283495.1_1
-            # Ensembl: ENSCAFT00000000001.1
-            full_id = record.id
-            base_id = record.id.split('.')[0]  # Remove version
-
-            # Store multiple ways for flexible matching
-            cds_db[species][full_id] = record
-            cds_db[species][base_id] = record
-
-            # If it's an NCBI ID, also store the protein ID part
-            if '|' in record.id:
-                parts = record.id.split('|')
-                for part in parts:
-                    if part.startswith('XP_') or part.startswith('NP_'):
-                        cds_db[species][part.split('.')[0]] = record
-
-            # For Ensembl: parse gene ID from description
-            # Header format: >ENSCAFT00845000002.1 cds ... gene:ENSCAFG00845000001.1 ...
-            if 'gene:' in record.description:
-                gene_field = record.description.split('gene:')[1].split()[0]
-                gene_id = gene_field.split('.')[0]  # Remove version
-                cds_db[species][gene_id] = record
-                cds_db[species][gene_field] = record  # Also store with version
-
-            # For Ensembl: convert transcript IDs to potential protein IDs
-            # ENSCAFT (transcript) might map to ENSCAFP (protein)
-            # ENSVVUT (transcript) might map to ENSVVUP (protein)
-            if 'T00' in base_id:
-                protein_id = base_id.replace('T00', 'P00')
-                cds_db[species][protein_id] = record
-
-            count += 1
-
-        print(f"    Loaded {count} sequences")
-
-    return cds_db
-
-def extract_orthologs_biomart(biomart_table, cds_db, args):
+    return open_cds_store(cds_files, key_function=biomart_keys, rebuild=rebuild,
+                          workers=workers)
+
+def write_ortholog_group(gene_name, sequences, output, manifest, args):
+    """
+    Write CDS and protein FASTA for one ortholog group
+
+    Returns False if --incremental found the group unchanged and skipped it.
+    """
+    # Leave unchanged groups (and their mtimes) alone in incremental mode
+    digest = group_digest(sequences)
+    if manifest is not None:
+        unchanged = args.incremental and manifest.unchanged(gene_name, digest, output)
+        manifest.record(gene_name, digest)
+        if unchanged:
+            return False
+
+    # Save CDS sequences
+    output.write_fasta(gene_name, 'cds.fa', sequences)
+
+    # Translate to protein (whole group in one batch)
+    translations = translate_batch([seq_rec.seq for seq_rec in sequences])
+    protein_seqs = [
+        SeqRecord(
+            Seq(translations.protein(i, to_stop=True)),
+            id=seq_rec.id,
+            description=seq_rec.description
+        )
+        for i, seq_rec in enumerate(sequences)
+    ]
+
+    output.write_fasta(gene_name, 'protein.fa', protein_seqs)
+    return True
+
+def extract_orthologs_biomart(biomart_table, cds_store, args):
     """Extract orthologous sequences from BioMart format"""
 
-    print(f"\nReading BioMart ortholog table: {args.orthologs}")
-    df = pd.read_csv(biomart_table, sep='\t', low_memory=False)
-
-    print(f"Table shape: {df.shape}")
-    print(f"Columns: {list(df.columns)}")
-
     # Column names from actual BioMart download
     dog_gene_col = 'Gene stable ID'
     dog_transcript_col = 'Transcript stable ID'
@@ -122,165 +183,363 @@ def extract_orthologs_biomart(biomart_table, cds_db, args):
     dingo_gene_col = 'Dingo gene stable ID'
     dingo_protein_col = 'Dingo protein or transcript stable ID'
 
-    # Group by dog gene
-    gene_groups = df.groupby(dog_gene_col)
-    print(f"\nFound {len(gene_groups)} gene groups")
+    id_columns = [dog_gene_col, dog_transcript_col, dog_protein_col, redfox_gene_col,
+                  redfox_protein_col, dingo_gene_col, dingo_protein_col]
+
+    print(f"\nReading BioMart ortholog table: {args.orthologs}")
+    tables = load_ortholog_tables(biomart_table, id_columns, dog_gene_col, args)
 
+    n_groups = 0
     extracted = 0
     skipped_few_species = 0
     skipped_missing_seqs = 0
+    unchanged = 0
+
+    # Per-gene directories, or one packed bundle with --bundle; the
+    # content-hash manifest is kept for per-gene directory output only
+    manifest = None if args.bundle else ExtractionManifest(args.out)
+
+    with open_ortholog_output(args.out, args.bundle) as output:
+        for df in tables:
+            # Group by dog gene
+            gene_groups = df.groupby(dog_gene_col, observed=True)
+            if not args.chunksize:
+                print(f"Table shape: {df.shape}")
+                print(f"Columns: {list(df.columns)}")
+                print(f"\nFound {len(gene_groups)} gene groups")
+            n_groups += len(gene_groups)
+
+            for gene_id, group in gene_groups:
+                if pd.isna(gene_id) or gene_id == '':
+                    continue
 
-    for gene_id, group in gene_groups:
-        if pd.isna(gene_id) or gene_id == '':
-            continue
-
-        # Use gene ID for naming - use full numeric ID to avoid collisions
-        gene_name = f"Gene_{gene_id.split('G')[-1]}"
+                # Use gene ID for naming - use full numeric ID to avoid collisions
+                gene_name = f"Gene_{gene_id.split('G')[-1]}"
 
-        # Collect sequences for this gene
-        sequences = []
-        species_found = set()
+                # Collect sequences for this gene
+                sequences = []
+                species_found = set()
 
-        # Get dog sequence - try different ID columns
-        dog_ids_to_try = []
+                # Get dog sequence - try different ID columns
+                dog_ids_to_try = []
 
-        # Try Query protein ID (most specific)
-        if dog_protein_col in group.columns:
-            dog_ids_to_try.extend(group[dog_protein_col].dropna().unique())
+                # Try Query protein ID (most specific)
+                if dog_protein_col in group.columns:
+                    dog_ids_to_try.extend(group[dog_protein_col].dropna().unique())
 
-        # Try Transcript ID
-        if dog_transcript_col in group.columns:
-            dog_ids_to_try.extend(group[dog_transcript_col].dropna().unique())
+                # Try Transcript ID
+                if dog_transcript_col in group.columns:
+                    dog_ids_to_try.extend(group[dog_transcript_col].dropna().unique())
 
-        # Try Gene ID
-        dog_ids_to_try.append(gene_id)
+                # Try Gene ID
+                dog_ids_to_try.append(gene_id)
 
-        # Try to find dog sequence
-        for seq_id in dog_ids_to_try:
-            if pd.isna(seq_id) or seq_id == '':
-                continue
+                # Try to find dog sequence
+                for seq_id in dog_ids_to_try:
+                    if pd.isna(seq_id) or seq_id == '':
+                        continue
 
-            seq_id_clean = str(seq_id).split('.')[0]
+                    seq_id_clean = str(seq_id).split('.')[0]
 
-            if 'Canis_familiaris' in cds_db and seq_id_clean in cds_db['Canis_familiaris']:
-                record = cds_db['Canis_familiaris'][seq_id_clean]
-                new_record = SeqRecord(
-                    record.seq,
-                    id="Canis_familiaris",
-                    description=f"{gene_name} | {seq_id}"
-                )
-                sequences.append(new_record)
-                species_found.add('Canis_familiaris')
-                break
-
-        # Get Red fox ortholog
-        # Try gene ID first (most reliable), then protein ID
-        redfox_ids_to_try = []
+                    record = cds_store.get('Canis_familiaris', seq_id_clean)
+                    if record is not None:
+                        new_record = SeqRecord(
+                            record.seq,
+                            id="Canis_familiaris",
+                            description=f"{gene_name} | {seq_id}"
+                        )
+                        sequences.append(new_record)
+                        species_found.add('Canis_familiaris')
+                        break
 
-        if redfox_gene_col in group.columns:
-            redfox_ids_to_try.extend(group[redfox_gene_col].dropna().unique())
+                # Get Red fox ortholog
+                # Try gene ID first (most reliable), then protein ID
+                redfox_ids_to_try = []
 
-        if redfox_protein_col in group.columns:
-            redfox_ids_to_try.extend(group[redfox_protein_col].dropna().unique())
+                if redfox_gene_col in group.columns:
+                    redfox_ids_to_try.extend(group[redfox_gene_col].dropna().unique())
 
-        for ortholog_id in redfox_ids_to_try:
-            if pd.isna(ortholog_id) or ortholog_id == '':
-                continue
+                if redfox_protein_col in group.columns:
+                    redfox_ids_to_try.extend(group[redfox_protein_col].dropna().unique())
 
-            ortholog_id_clean = str(ortholog_id).split('.')[0]
-
-            if 'Vulpes_vulpes' in cds_db and ortholog_id_clean in cds_db['Vulpes_vulpes']:
-                record = cds_db['Vulpes_vulpes'][ortholog_id_clean]
-                new_record = SeqRecord(
-                    record.seq,
-                    id="Vulpes_vulpes",
-                    description=f"{gene_name} | {ortholog_id}"
-                )
-                sequences.append(new_record)
-                species_found.add('Vulpes_vulpes')
-                break
-
-        # Get Dingo ortholog (maps to Canis_familiaris CDS)
-        if dingo_protein_col in group.columns:
-            ortholog_ids = group[dingo_protein_col].dropna().unique()
-
-            for ortholog_id in ortholog_ids:
-                if pd.isna(ortholog_id) or ortholog_id == '':
-                    continue
+                for ortholog_id in redfox_ids_to_try:
+                    if pd.isna(ortholog_id) or ortholog_id == '':
+                        continue
 
-                ortholog_id_clean = str(ortholog_id).split('.')[0]
+                    ortholog_id_clean = str(ortholog_id).split('.')[0]
 
-                # Dingo uses Canis_familiaris genome, so look there
-                if 'Canis_familiaris' in cds_db and ortholog_id_clean in cds_db['Canis_familiaris']:
-                    # Only add if we don't already have a dog sequence
-                    if 'Canis_familiaris' not in species_found:
-                        record = cds_db['Canis_familiaris'][ortholog_id_clean]
+                    record = cds_store.get('Vulpes_vulpes', ortholog_id_clean)
+                    if record is not None:
                         new_record = SeqRecord(
                             record.seq,
-                            id="Canis_familiaris",
-                            description=f"{gene_name} | {ortholog_id} (Dingo)"
+                            id="Vulpes_vulpes",
+                            description=f"{gene_name} | {ortholog_id}"
                         )
                         sequences.append(new_record)
-                        species_found.add('Canis_familiaris')
-                    break
-
-        # Only save if we have minimum species
-        if len(sequences) >= args.min_species:
-            # Create output directory
-            gene_dir = Path(args.out) / gene_name
-            gene_dir.mkdir(parents=True, exist_ok=True)
-
-            # Save CDS sequences
-            cds_output = gene_dir / f"{gene_name}.cds.fa"
-            SeqIO.write(sequences, cds_output, 'fasta')
-
-            # Translate to protein
-            protein_seqs = []
-            for seq_rec in sequences:
-                try:
-                    protein_seq = seq_rec.seq.translate(to_stop=True)
-                    protein_rec = SeqRecord(
-                        protein_seq,
-                        id=seq_rec.id,
-                        description=seq_rec.description
-                    )
-                    protein_seqs.append(protein_rec)
-                except Exception as e:
-                    print(f"  Warning: Could not translate {seq_rec.id}: {e}")
-
-            if len(protein_seqs) >= args.min_species:
-                protein_output = gene_dir / f"{gene_name}.protein.fa"
-                SeqIO.write(protein_seqs, protein_output, 'fasta')
+                        species_found.add('Vulpes_vulpes')
+                        break
+
+                # Get Dingo ortholog (maps to Canis_familiaris CDS)
+                if dingo_protein_col in group.columns:
+                    ortholog_ids = group[dingo_protein_col].dropna().unique()
+
+                    for ortholog_id in ortholog_ids:
+                        if pd.isna(ortholog_id) or ortholog_id == '':
+                            continue
+
+                        ortholog_id_clean = str(ortholog_id).split('.')[0]
+
+                        # Dingo uses Canis_familiaris genome, so look there
+                        if cds_store.has('Canis_familiaris', ortholog_id_clean):
+                            # Only add if we don't already have a dog sequence
+                            if 'Canis_familiaris' not in species_found:
+                                record = cds_store.get('Canis_familiaris', ortholog_id_clean)
+                                new_record = SeqRecord(
+                                    record.seq,
+                                    id="Canis_familiaris",
+                                    description=f"{gene_name} | {ortholog_id} (Dingo)"
+                                )
+                                sequences.append(new_record)
+                                species_found.add('Canis_familiaris')
+                            break
+
+                # Only save if we have minimum species
+                if len(sequences) >= args.min_species:
+                    if not write_ortholog_group(gene_name, sequences, output, manifest, args):
+                        unchanged += 1
+                    extracted += 1
+
+                    if extracted % 100 == 0:
+                        print(f"  Extracted {extracted} ortholog groups...")
+                else:
+                    if len(sequences) > 0:
+                        skipped_few_species += 1
+                    else:
+                        skipped_missing_seqs += 1
+
+    if args.chunksize:
+        print(f"\nProcessed {n_groups} gene groups")
+
+    removed = []
+    if manifest is not None:
+        if args.incremental:
+            removed = manifest.remove_stale()
+        manifest.save()
+
+    print(f"\n=== Summary ===")
+    print(f"Successfully extracted: {extracted} ortholog groups")
+    if args.incremental:
+        print(f"  Rewritten: {extracted - unchanged}, unchanged: {unchanged}")
+        print(f"Removed (no longer extracted): {len(removed)}")
+    print(f"Skipped (too few species): {skipped_few_species}")
+    print(f"Skipped (missing sequences): {skipped_missing_seqs}")
+    print(f"\nOutput: {args.bundle or args.out}")
+
+def load_ortholog_tables(biomart_table, columns, group_col, args):
+    """
+    The ortholog table pruned to `columns` with IDs as categoricals: one
+    DataFrame (optionally cached with --table_cache), or with --chunksize a
+    stream of DataFrames each holding complete gene groups
+    """
+    if args.chunksize:
+        print(f"  Streaming in chunks of ~{args.chunksize} rows")
+        return iter_gene_chunks(biomart_table, group_col, columns, columns, args.chunksize)
+    return [read_ortholog_table(biomart_table, columns, columns, cache=args.table_cache)]
+
+ID_COLUMNS = ['protein_col', 'transcript_col', 'gene_col']  # priority order
+
+def load_species_columns(path):
+    """Read the species-to-column mapping; blank cells mean 'no such column'"""
+    species_columns = pd.read_csv(path, sep='\t', dtype=str, comment='#').fillna('')
+
+    required = ['species', 'cds_species'] + ID_COLUMNS
+    missing = [col for col in required if col not in species_columns.columns]
+    if missing:
+        print(f"ERROR: {path} is missing columns: {missing}")
+        sys.exit(1)
+
+    if 'tag' not in species_columns.columns:
+        species_columns['tag'] = ''
+
+    return species_columns
+
+def resolve_biomart_orthologs(df, cds_store, species_columns, group_col):
+    """
+    Resolve one sequence per species for every ortholog group in bulk
+
+    All candidate IDs of all species are stacked into one long table with a
+    rank (config row, then protein > transcript > gene, then table order),
+    looked up against each CDS species' alias index in a single vectorised
+    call, and the best-ranked hit per (group, species label) is kept.
+    Returns the chosen hits sorted by group and species order.
+    """
+    df = df[df[group_col].notna() & (df[group_col].astype(str) != '')]
+
+    label_order = {label: i for i, label in enumerate(dict.fromkeys(species_columns['species']))}
+
+    parts = []
+    for row_number, spec in enumerate(species_columns.itertuples(index=False)):
+        for priority, id_column in enumerate(ID_COLUMNS):
+            col = getattr(spec, id_column)
+            if not col or col not in df.columns:
+                continue
+
+            parts.append(pd.DataFrame({
+                'group': df[group_col].values,
+                'candidate': df[col].values,
+                'position': np.arange(len(df)),
+                'rank': row_number * len(ID_COLUMNS) + priority,
+                'label_order': label_order[spec.species],
+                'species': spec.species,
+                'cds_species': spec.cds_species,
+                'tag': spec.tag
+            }))
+
+    if not parts:
+        configured = [getattr(spec, id_column) for spec in species_columns.itertuples(index=False)
+                      for id_column in ID_COLUMNS if getattr(spec, id_column)]
+        raise ValueError(f"none of the configured ID columns are in the ortholog table: "
+                         f"{', '.join(dict.fromkeys(configured))}")
+
+    candidates = pd.concat(parts, ignore_index=True)
+    candidates = candidates[candidates['candidate'].notna()]
+    candidates['candidate'] = candidates['candidate'].astype(str)
+    candidates = candidates[candidates['candidate'] != '']
+    clean_ids = candidates['candidate'].str.split('.', n=1).str[0]
+
+    # One bulk join per CDS species against its alias index
+    record = np.full(len(candidates), -1, dtype=np.int64)
+    cds_species = candidates['cds_species'].values
+    for species in np.unique(cds_species):
+        in_species = cds_species == species
+        record[in_species] = cds_store.lookup(species, clean_ids.values[in_species])
+    candidates['record'] = record
+
+    # Ranked merge: best-ranked hit per group and species label
+    hits = candidates[candidates['record'] >= 0]
+    hits = hits.sort_values(['group', 'label_order', 'rank', 'position'], kind='stable')
+    return hits.drop_duplicates(['group', 'species'], keep='first')
+
+def extract_orthologs_generic(biomart_table, cds_store, args):
+    """Extract ortholog groups for any number of species from a column mapping"""
+
+    species_columns = load_species_columns(args.species_columns)
+    print(f"Species blocks: {len(species_columns)} "
+          f"({', '.join(dict.fromkeys(species_columns['species']))})")
+
+    available = set(table_columns(biomart_table))
+    if args.group_col not in available:
+        print(f"ERROR: Group column '{args.group_col}' not in ortholog table")
+        sys.exit(1)
+
+    columns = [args.group_col]
+    missing = []
+    for spec in species_columns.itertuples(index=False):
+        for id_column in ID_COLUMNS:
+            col = getattr(spec, id_column)
+            if col and col not in available:
+                print(f"  Warning: column '{col}' ({spec.species}) not in ortholog table")
+                missing.append(col)
+            elif col:
+                columns.append(col)
+
+    if len(columns) == 1:
+        print(f"ERROR: None of the ID columns in {args.species_columns} are in the ortholog table "
+              f"(missing: {', '.join(dict.fromkeys(missing)) or 'no ID columns configured'})")
+        sys.exit(1)
+
+    print(f"\nReading BioMart ortholog table: {args.orthologs}")
+    tables = load_ortholog_tables(biomart_table, columns, args.group_col, args)
+
+    n_groups = 0
+    extracted = 0
+    unchanged = 0
+    skipped_few_species = 0
+    skipped_missing_seqs = 0
+
+    manifest = None if args.bundle else ExtractionManifest(args.out)
+
+    with open_ortholog_output(args.out, args.bundle) as output:
+        for df in tables:
+            if not args.chunksize:
+                print(f"Table shape: {df.shape}")
+
+            chosen = resolve_biomart_orthologs(df, cds_store, species_columns, args.group_col)
+
+            all_groups = df[args.group_col].dropna().astype(str)
+            all_groups = all_groups[all_groups != ''].unique()
+            n_found = chosen.groupby('group', observed=True).size()
+            n_groups += len(all_groups)
+            if not args.chunksize:
+                print(f"\nFound {len(all_groups)} gene groups")
+
+            skipped_few_species += int(((n_found > 0) & (n_found < args.min_species)).sum())
+            skipped_missing_seqs += len(all_groups) - len(n_found)
+
+            selected = chosen[chosen['group'].map(n_found).astype(int) >= args.min_species]
+            rows = zip(selected['group'], selected['species'], selected['cds_species'],
+                       selected['record'], selected['candidate'], selected['tag'])
+
+            for gene_id, members in groupby(rows, key=itemgetter(0)):
+                gene_name = f"Gene_{str(gene_id).split('G')[-1]}"
+
+                sequences = []
+                for _, species, cds_species, record_number, candidate, tag in members:
+                    record = cds_store.read(cds_species, record_number)
+                    description = f"{gene_name} | {candidate}" + (f" ({tag})" if tag else "")
+                    sequences.append(SeqRecord(record.seq, id=species, description=description))
+
+                if not write_ortholog_group(gene_name, sequences, output, manifest, args):
+                    unchanged += 1
                 extracted += 1
 
                 if extracted % 100 == 0:
                     print(f"  Extracted {extracted} ortholog groups...")
-            else:
-                skipped_missing_seqs += 1
-        else:
-            if len(sequences) > 0:
-                skipped_few_species += 1
-            else:
-                skipped_missing_seqs += 1
+
+    if args.chunksize:
+        print(f"\nProcessed {n_groups} gene groups")
+
+    removed = []
+    if manifest is not None:
+        if args.incremental:
+            removed = manifest.remove_stale()
+        manifest.save()
 
     print(f"\n=== Summary ===")
     print(f"Successfully extracted: {extracted} ortholog groups")
+    if args.incremental:
+        print(f"  Rewritten: {extracted - unchanged}, unchanged: {unchanged}")
+        print(f"Removed (no longer extracted): {len(removed)}")
     print(f"Skipped (too few species): {skipped_few_species}")
     print(f"Skipped (missing sequences): {skipped_missing_seqs}")
-    print(f"\nOutput directory: {args.out}")
+    print(f"\nOutput: {args.bundle or args.out}")
 
 def main():
     args = parse_arguments()
 
-    # Load all CDS sequences
-    cds_db = load_cds_sequences(args.cds_dir)
+    if args.incremental and args.bundle:
+        print("ERROR: --incremental works on per-gene directories, not --bundle output")
+        sys.exit(1)
+
+    if args.chunksize and args.table_cache:
+        print("ERROR: --chunksize streams the TSV and cannot be combined with --table_cache")
+        sys.exit(1)
+
+    # Index CDS files (sequences are read on demand)
+    cds_store = load_cds_sequences(args.cds_dir, rebuild=args.rebuild_index,
+                                   workers=args.workers)
 
     print(f"\nAvailable species in CDS database:")
-    for species in cds_db.keys():
-        print(f"  - {species}: {len(cds_db[species])} sequences")
+    for species in cds_store.species:
+        print(f"  - {species}: {cds_store.n_records(species)} sequences "
+              f"({cds_store.n_keys(species)} IDs)")
 
     # Extract orthologs
-    extract_orthologs_biomart(args.orthologs, cds_db, args)
+    with cds_store:
+        if args.species_columns:
+            extract_orthologs_generic(args.orthologs, cds_store, args)
+        else:
+            extract_orthologs_biomart(args.orthologs, cds_store, args)
 
     print("\nDone!")
 
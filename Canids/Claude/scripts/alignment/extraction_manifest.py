@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+extraction_manifest.py
+Content-hash manifest for incremental ortholog extraction
+
+The manifest (<out>/extraction_manifest.tsv) records one hash per ortholog
+group, computed from the record IDs, descriptions and sequence checksums
+that go into the group's FASTA files. With --incremental the extractors
+rewrite only groups whose hash changed and delete groups that disappeared,
+so unchanged gene directories keep their mtimes and Snakemake does not rerun
+MAFFT/HyPhy on them. Groups from earlier runs that a run neither extracted
+nor deleted stay in the manifest, so a later --incremental run still
+removes their directories. Only plain directory names directly under the
+output directory are ever deleted.
+"""
+
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+MANIFEST_NAME = 'extraction_manifest.tsv'
+
+def group_digest(records):
+    """Hash of the IDs, descriptions and sequence checksums of a group"""
+    digest = hashlib.sha1()
+    for record in records:
+        seq_checksum = hashlib.sha1(str(record.seq).upper().encode()).hexdigest()
+        digest.update(f"{record.id}\t{record.description}\t{seq_checksum}\n".encode())
+    return digest.hexdigest()
+
+class ExtractionManifest:
+    """Previous and current group hashes for one per-gene output directory"""
+
+    def __init__(self, out_dir):
+        self.out_dir = Path(out_dir)
+        self.path = self.out_dir / MANIFEST_NAME
+        self.previous = {}
+        self.current = {}
+        self.removed = set()
+
+        if self.path.exists():
+            with open(self.path) as handle:
+                next(handle, None)  # header
+                for line in handle:
+                    gene, digest = line.rstrip('\n').split('\t')
+                    self.previous[gene] = digest
+
+    def unchanged(self, gene, digest, output):
+        """True if the group hash matches the last run and its files still exist"""
+        return (
+            self.previous.get(gene) == digest
+            and output.path(gene, 'cds.fa').exists()
+            and output.path(gene, 'protein.fa').exists()
+        )
+
+    def record(self, gene, digest):
+        self.current[gene] = digest
+
+    def gene_dir(self, gene):
+        """
+        Directory of a gene under out_dir, or None if the name is not a plain
+        directory name (path separators, '..') or resolves outside out_dir
+        """
+        if not gene or '..' in gene or '/' in gene or '\\' in gene:
+            return None
+        gene_dir = self.out_dir / gene
+        if gene_dir.resolve().parent != self.out_dir.resolve():
+            return None
+        return gene_dir
+
+    def remove_stale(self):
+        """Delete gene directories that were extracted in an earlier run but not this time"""
+        stale = sorted(set(self.previous) - set(self.current))
+        removed = []
+        for gene in stale:
+            gene_dir = self.gene_dir(gene)
+            if gene_dir is None:
+                # Never delete outside out_dir; drop the entry instead
+                print(f"  WARNING: Ignoring manifest entry '{gene}': not a directory name "
+                      f"under {self.out_dir}")
+                self.removed.add(gene)
+                continue
+            if gene_dir.is_dir():
+                shutil.rmtree(gene_dir)
+            self.removed.add(gene)
+            removed.append(gene)
+        return removed
+
+    def save(self):
+        """
+        Write this run's groups, plus earlier groups that are still on disk
+        (not extracted this time and not removed)
+        """
+        entries = {gene: digest for gene, digest in self.previous.items()
+                   if gene not in self.removed}
+        entries.update(self.current)
+
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as handle:
+            handle.write("gene\tdigest\n")
+            for gene in sorted(entries):
+                handle.write(f"{gene}\t{entries[gene]}\n")
+        os.replace(tmp_path, self.path)
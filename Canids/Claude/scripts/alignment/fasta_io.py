@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+fasta_io.py
+Reading plain, gzip and BGZF-compressed FASTA files
+
+Ensembl and NCBI ship CDS sets as .fa.gz; bgzip (htslib) writes BGZF, a
+gzip variant made of independent <=64 KB blocks. Both are valid gzip, so
+every reader can open them as a decompressed stream. BGZF additionally
+allows random access: cds_store.py records BGZF virtual offsets
+(compressed block start << 16 | offset within the block) in its index and
+seeks straight to a record's block.
+
+Decompression is multi-threaded where possible:
+  - BGZF blocks are inflated in batches by a thread pool (zlib releases the
+    GIL), so no extra packages are needed
+  - plain gzip uses python-isal's threaded reader if it is installed, else
+    pigz if it is on PATH, else the gzip module
+"""
+
+import gzip
+import io
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from isal import igzip_threaded
+except ImportError:
+    igzip_threaded = None
+
+COMPRESSED_SUFFIXES = ('.gz', '.bgz')
+FASTA_PATTERNS = ('*.fa', '*.fa.gz', '*.fa.bgz')
+CHUNK_SIZE = 1 << 22
+BGZF_BATCH = 64  # blocks per thread per round (~4 MB uncompressed)
+
+GZIP_MAGIC = b'\x1f\x8b'
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+
+def default_threads():
+    return min(4, os.cpu_count() or 1)
+
+def compression(path):
+    """'bgzf', 'gzip' or None, from the first bytes of the file"""
+    with open(path, 'rb') as handle:
+        header = handle.read(18)
+
+    if not header.startswith(GZIP_MAGIC):
+        return None
+    if header.startswith(BGZF_MAGIC) and header[12:14] == b'BC':
+        return 'bgzf'
+    return 'gzip'
+
+def strip_compression_suffix(name):
+    """Gene_1.codon.fa.gz -> Gene_1.codon.fa"""
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def fasta_stem(path):
+    """File name without the compression suffix and the final extension"""
+    return Path(strip_compression_suffix(Path(path).name)).stem
+
+def _read_bgzf_blocks(handle):
+    """Yield (compressed offset, raw deflate data) for every BGZF block"""
+    while True:
+        start = handle.tell()
+        header = handle.read(12)
+        if not header:
+            return
+        if len(header) < 12 or not header.startswith(BGZF_MAGIC):
+            raise ValueError(f"Not a BGZF block at offset {start}")
+
+        xlen = struct.unpack('<H', header[10:12])[0]
+        extra = handle.read(xlen)
+
+        block_size = None
+        pos = 0
+        while pos + 4 <= xlen:
+            subfield_len = struct.unpack('<H', extra[pos + 2:pos + 4])[0]
+            if extra[pos:pos + 2] == b'BC' and subfield_len == 2:
+                block_size = struct.unpack('<H', extra[pos + 4:pos + 6])[0] + 1
+            pos += 4 + subfield_len
+        if block_size is None:
+            raise ValueError(f"BGZF block at offset {start} has no BC field")
+
+        data = handle.read(block_size - 12 - xlen - 8)
+        handle.read(8)  # CRC32, ISIZE
+        yield start, data
+
+def _inflate(data):
+    return zlib.decompress(data, -15)
+
+def iter_bgzf_blocks(path, threads=None):
+    """
+    Yield (compressed offset, uncompressed data) for every BGZF block in
+    file order, inflating batches of blocks on a thread pool
+    """
+    threads = threads or default_threads()
+
+    with open(path, 'rb') as handle:
+        blocks = _read_bgzf_blocks(handle)
+        if threads == 1:
+            for start, data in blocks:
+                yield start, _inflate(data)
+            return
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            batch = []
+            for block in blocks:
+                batch.append(block)
+                if len(batch) >= BGZF_BATCH * threads:
+                    yield from zip([s for s, _ in batch], pool.map(_inflate, [d for _, d in batch]))
+                    batch = []
+            yield from zip([s for s, _ in batch], pool.map(_inflate, [d for _, d in batch]))
+
+class _ChunkStream(io.RawIOBase):
+    """Read-only raw stream over an iterator of bytes chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk)
+
+        n = min(len(buffer), len(self._buffer))
+        buffer[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if hasattr(self._chunks, 'close'):
+            self._chunks.close()
+        super().close()
+
+def open_bgzf_stream(path, threads=None, block_table=None):
+    """
+    Decompressed binary stream of a BGZF file. If block_table is a list,
+    (compressed offset, uncompressed offset) is appended for each block as
+    it is read, which is what virtual_offsets() needs.
+    """
+    def chunks():
+        uncompressed = 0
+        for start, data in iter_bgzf_blocks(path, threads):
+            if block_table is not None:
+                block_table.append((start, uncompressed))
+            uncompressed += len(data)
+            yield data
+
+    return io.BufferedReader(_ChunkStream(chunks()), buffer_size=CHUNK_SIZE)
+
+class _PigzStream(io.RawIOBase):
+    """Decompressed output of a pigz subprocess"""
+
+    def __init__(self, path, threads):
+        self._process = subprocess.Popen(
+            ['pigz', '-dc', '-p', str(threads), str(path)],
+            stdout=subprocess.PIPE
+        )
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._process.stdout.readinto(buffer)
+
+    def close(self):
+        if not self.closed:
+            self._process.stdout.close()
+            # A negative return code is SIGPIPE from closing before EOF
+            if self._process.wait() > 0:
+                raise OSError(f"pigz failed with exit code {self._process.returncode}")
+        super().close()
+
+def open_gzip_stream(path, threads=None):
+    """Decompressed binary stream of a gzip file, multi-threaded where available"""
+    threads = threads or default_threads()
+    if threads > 1 and igzip_threaded is not None:
+        return igzip_threaded.open(path, 'rb', threads=threads)
+    if threads > 1 and shutil.which('pigz'):
+        return io.BufferedReader(_PigzStream(path, threads), buffer_size=CHUNK_SIZE)
+    return gzip.open(path, 'rb')
+
+def open_fasta(path, mode='r', threads=None):
+    """
+    Open a plain, gzip or BGZF FASTA file for reading. mode 'r' returns a
+    text handle, 'rb' a binary one.
+    """
+    kind = compression(path)
+    if kind == 'bgzf':
+        handle = open_bgzf_stream(path, threads)
+    elif kind == 'gzip':
+        handle = open_gzip_stream(path, threads)
+    else:
+        handle = open(path, 'rb')
+
+    if 'b' in mode:
+        return handle
+    return io.TextIOWrapper(handle)
+
+def fasta_headers(path, threads=None):
+    """
+    Yield the header line of every record (bytes, without '>' and trailing
+    whitespace) of a plain, gzip or BGZF FASTA file. The file is read in large
+    chunks and only the positions of '\\n>' are searched, so sequence lines
+    are skipped without being split into lines or decoded.
+    """
+    with open_fasta(path, 'rb', threads) as handle:
+        # A leading newline lets a header on the first line match too
+        buffer = b'\n'
+        while True:
+            chunk = handle.read(CHUNK_SIZE)
+            if chunk:
+                buffer += chunk
+            pos = 0
+            while True:
+                start = buffer.find(b'\n>', pos)
+                if start < 0:
+                    # Keep the last byte: it may be the newline before a '>'
+                    buffer = buffer[-1:]
+                    break
+                end = buffer.find(b'\n', start + 2)
+                if end < 0:
+                    if chunk:
+                        # Header continues in the next chunk
+                        buffer = buffer[start:]
+                        break
+                    end = len(buffer)
+                yield buffer[start + 2:end].rstrip()
+                pos = end
+            if not chunk:
+                return
+
+def virtual_offsets(block_table, offsets):
+    """
+    Convert uncompressed offsets into BGZF virtual offsets using the
+    (compressed offset, uncompressed offset) table from open_bgzf_stream
+    """
+    compressed = [c for c, _ in block_table]
+    uncompressed = [u for _, u in block_table]
+
+    result = []
+    block = 0
+    for offset in offsets:
+        # offsets arrive in file order, so the block pointer only moves forward
+        while block + 1 < len(uncompressed) and uncompressed[block + 1] <= offset:
+            block += 1
+        result.append((compressed[block] << 16) | (offset - uncompressed[block]))
+    return result
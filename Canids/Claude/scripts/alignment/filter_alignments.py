@@ -2,16 +2,37 @@
 """
 filter_alignments.py
 Filter and trim codon alignments for quality control
+
+Filters a directory, bundle or list of alignments in one process (or a
+process pool with --workers) and writes a per-alignment summary table, so a
+whole gene set is filtered by one job instead of one interpreter per gene.
+
+Each alignment is read once into an AlignmentMatrix and evaluated by a
+FilterPlan (trimming, sequence and length filters, stop-codon check) before
+a single write. --dry_run evaluates a grid of --max_gap_fraction and
+--min_alignment_length values per alignment and writes only the decisions;
+--qc_only applies the filter but writes only the summary and QC tables.
 """
 
 import argparse
-import os
+import io
+import sys
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout
 from pathlib import Path
-from Bio import AlignIO
-from Bio.Align import MultipleSeqAlignment
-from Bio.SeqRecord import SeqRecord
-from Bio.Seq import Seq
 import numpy as np
+from alignment_matrix import AlignmentMatrix
+from ortholog_bundle import BundleMember, BundleReader, is_bundle
+from fasta_io import FASTA_PATTERNS, fasta_stem, open_fasta
+from codon_translation import translate_batch
+from codon_trimming import TRIM_MODES, trim_columns
+from alignment_qc import QCTableWriter, pa, qc_row
+from summary_table import write_summary
+
+CODON_MEMBERS = ('codon.fa', 'codon.fa.gz', 'codon.fa.bgz')
+FILTERED_SUFFIXES = ('.filtered.fa', '.filtered.fa.gz', '.filtered.fa.bgz')
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -20,8 +41,16 @@ def parse_arguments():
     parser.add_argument(
         '--input',
         type=str,
-        required=True,
-        help='Directory containing codon alignments'
+        default=None,
+        help='Directory containing codon alignments (.fa, .fa.gz), a packed alignment bundle, '
+             'or a single alignment file'
+    )
+    parser.add_argument(
+        '--file_list',
+        type=str,
+        default=None,
+        help='Text file with one alignment path per line (used instead of --input, e.g. by '
+             'the batch Snakemake rule)'
     )
     parser.add_argument(
         '--output',
@@ -32,8 +61,10 @@ def parse_arguments():
     parser.add_argument(
         '--max_gap_fraction',
         type=float,
-        default=0.5,
-        help='Maximum fraction of gaps allowed per sequence (default: 0.5)'
+        nargs='+',
+        default=[0.5],
+        help='Maximum fraction of gaps allowed per sequence (default: 0.5); '
+             'several values with --dry_run'
     )
     parser.add_argument(
         '--min_species',
@@ -44,193 +75,524 @@ def parse_arguments():
     parser.add_argument(
         '--trim_edges',
         action='store_true',
-        help='Trim poorly aligned edges using automated trimming'
+        help='Trim poorly aligned edges using automated trimming (same as --trim_mode edges)'
+    )
+    parser.add_argument(
+        '--trim_mode',
+        choices=TRIM_MODES,
+        default=None,
+        help='Column trimming: edges, or codon-aware gap, conservation, gappyout, strict or '
+             'automated (see codon_trimming.py; default: no trimming)'
+    )
+    parser.add_argument(
+        '--trim_gap_threshold',
+        type=float,
+        default=0.5,
+        help='--trim_mode gap: drop codon columns gapped in more than this fraction of '
+             'sequences (default: 0.5)'
+    )
+    parser.add_argument(
+        '--trim_min_conservation',
+        type=float,
+        default=0.5,
+        help='--trim_mode conservation: drop codon columns whose most common codon is in '
+             'fewer than this fraction of sequences (default: 0.5)'
     )
     parser.add_argument(
         '--min_alignment_length',
         type=int,
-        default=150,
-        help='Minimum alignment length in bp after trimming (default: 150)'
+        nargs='+',
+        default=[150],
+        help='Minimum alignment length in bp after trimming (default: 150); '
+             'several values with --dry_run'
     )
-    return parser.parse_args()
-
-def calculate_gap_fraction(sequence):
-    """Calculate fraction of gaps in a sequence"""
-    gaps = sequence.count('-') + sequence.count('N')
-    return gaps / len(sequence) if len(sequence) > 0 else 1.0
+    parser.add_argument(
+        '--dry_run',
+        action='store_true',
+        help='Write no alignments; record the decision for every combination of the '
+             '--max_gap_fraction and --min_alignment_length values in a sweep table '
+             '(default: <output>/filter_sweep.tsv)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of processes filtering alignments in parallel (default: 1)'
+    )
+    parser.add_argument(
+        '--summary',
+        type=str,
+        default=None,
+        help='Per-alignment summary table (default: <output>/filter_summary.tsv, or '
+             '<output>/filter_sweep.tsv with --dry_run)'
+    )
+    parser.add_argument(
+        '--qc_table',
+        type=str,
+        default=None,
+        help='Typed per-alignment QC table in Parquet format: gap fractions, trimmed bases, '
+             'GC/GC3, stop codons, rejection reason (default: <output>/filter_qc.parquet)'
+    )
+    parser.add_argument(
+        '--no_qc_table',
+        action='store_true',
+        help='Write no QC table (e.g. per-gene jobs, where the QC table comes from one '
+             '--qc_only pass over all genes)'
+    )
+    parser.add_argument(
+        '--qc_only',
+        action='store_true',
+        help='Filter as usual but write no alignments, only the summary and QC tables'
+    )
+    args = parser.parse_args()
+    if args.trim_edges and not args.trim_mode:
+        args.trim_mode = 'edges'
+    return args
 
-def trim_alignment_edges(alignment, gap_threshold=0.8):
-    """
-    Trim poorly aligned edges where >gap_threshold positions are gaps
+class FilterPlan:
     """
-    alignment_array = np.array([list(str(rec.seq)) for rec in alignment])
-
-    # Calculate gap fraction per column
-    n_seqs = len(alignment)
-    gap_fractions = np.array([
-        np.sum((alignment_array[:, i] == '-') | (alignment_array[:, i] == 'N')) / n_seqs
-        for i in range(alignment_array.shape[1])
-    ])
-
-    # Find first and last positions with acceptable gap content
-    good_positions = np.where(gap_fractions < gap_threshold)[0]
-
-    if len(good_positions) == 0:
-        return None  # Entire alignment is too gappy
-
-    start = good_positions[0]
-    end = good_positions[-1] + 1
-
-    # Trim alignment
-    trimmed_records = []
-    for record in alignment:
-        trimmed_seq = record.seq[start:end]
-        trimmed_records.append(
-            SeqRecord(trimmed_seq, id=record.id, description=record.description)
-        )
+    All filter decisions for one alignment from a single pass over its matrix
 
-    return MultipleSeqAlignment(trimmed_records)
-
-def filter_alignment(alignment, max_gap_fraction, min_species):
-    """
-    Filter sequences with too many gaps
+    The gap mask is computed once; the trimmed columns (see codon_trimming.py),
+    the gap fraction of every sequence within them and (on demand) an
+    internal-stop flag per sequence are derived from it. decide() then applies
+    one set of thresholds without touching the sequences again, so one plan
+    serves a whole parameter sweep, and only an accepted plan is materialised.
     """
-    filtered_records = []
 
-    for record in alignment:
-        gap_frac = calculate_gap_fraction(str(record.seq))
+    def __init__(self, matrix, trim_mode=None, trim_gap_threshold=0.5,
+                 trim_min_conservation=0.5):
+        self.matrix = matrix
+        self.trim_mode = trim_mode
+        self._stop_rows = None
 
-        if gap_frac <= max_gap_fraction:
-            filtered_records.append(record)
+        gaps = matrix.gap_mask()
+        if trim_mode:
+            self.columns = trim_columns(matrix, trim_mode, trim_gap_threshold,
+                                        trim_min_conservation, gap_mask=gaps)
         else:
-            print(f"  Removing {record.id} (gap fraction: {gap_frac:.2f})")
-
-    if len(filtered_records) < min_species:
-        return None
+            self.columns = slice(0, matrix.n_columns)
 
-    return MultipleSeqAlignment(filtered_records)
-
-def validate_codon_alignment(alignment):
-    """
-    Check if alignment is valid (length divisible by 3, no stop codons except at end)
-    """
-    aln_length = alignment.get_alignment_length()
+        if self.columns is None:
+            self.length = 0
+            self.row_gap_fraction = np.ones(matrix.n_seqs)
+            return
 
-    # Check divisible by 3
-    if aln_length % 3 != 0:
-        print(f"  WARNING: Alignment length {aln_length} not divisible by 3")
-        return False
-
-    # Check for internal stop codons
-    for record in alignment:
-        seq_str = str(record.seq).replace('-', '')
-        if len(seq_str) % 3 != 0:
-            continue
-
-        try:
-            protein = Seq(seq_str).translate(to_stop=False)
-            if '*' in str(protein)[:-1]:  # Stop codons except at end
-                print(f"  WARNING: Internal stop codon in {record.id}")
-                return False
-        except Exception as e:
-            print(f"  WARNING: Translation error in {record.id}: {e}")
-            return False
+        trimmed_gaps = gaps[:, self.columns]
+        self.length = trimmed_gaps.shape[1]
+        if self.length:
+            self.row_gap_fraction = trimmed_gaps.mean(axis=1)
+        else:
+            self.row_gap_fraction = np.ones(matrix.n_seqs)
+
+    @property
+    def stop_rows(self):
+        """True for sequences that are in frame once ungapped and contain an internal stop"""
+        if self._stop_rows is None:
+            trimmed = self.matrix.select_columns(self.columns)
+            ungapped = [trimmed.ungapped(i) for i in range(trimmed.n_seqs)]
+            in_frame = np.array([len(seq) % 3 == 0 for seq in ungapped], dtype=bool)
+
+            # Translate all in-frame sequences in one batch
+            translations = translate_batch([seq for seq, ok in zip(ungapped, in_frame) if ok])
+            self._stop_rows = np.zeros(len(ungapped), dtype=bool)
+            self._stop_rows[in_frame] = translations.internal_stop
+        return self._stop_rows
+
+    def decide(self, max_gap_fraction, min_species, min_alignment_length):
+        """
+        Outcome for one set of thresholds, checked in the original order:
+        edge trimming, gappy sequences, length, codon validity
+        """
+        decision = {'status': 'filtered', 'reason': '', 'keep': None, 'stop_row': None,
+                    'n_seqs_out': '', 'length_out': ''}
+
+        if self.columns is None:
+            edge = 'edge ' if self.trim_mode == 'edges' else ''
+            decision['reason'] = f'too gappy after {edge}trimming'
+            return decision
+
+        keep = self.row_gap_fraction <= max_gap_fraction
+        decision['keep'] = keep
+
+        if keep.sum() < min_species:
+            decision['reason'] = 'too few sequences'
+        elif self.length < min_alignment_length:
+            decision['reason'] = 'too short'
+        elif self.length % 3 != 0:
+            decision['reason'] = 'invalid codon alignment'
+        else:
+            stops = np.flatnonzero(self.stop_rows & keep)
+            if len(stops):
+                decision['reason'] = 'invalid codon alignment'
+                decision['stop_row'] = int(stops[0])
+            else:
+                decision.update(status='passed', n_seqs_out=int(keep.sum()),
+                                length_out=self.length)
+
+        return decision
+
+    def apply(self, decision):
+        """The filtered alignment for an accepted decision"""
+        return self.matrix.select_columns(self.columns).select_rows(decision['keep'])
+
+def report_decision(plan, decision):
+    """Print the per-step log lines for a decision"""
+    if plan.trim_mode:
+        if plan.columns is None:
+            print(f"  FILTERED: {decision['reason'].capitalize()}")
+            return
+        print(f"  After trimming: {plan.length} bp")
+
+    for i in np.flatnonzero(~decision['keep']):
+        print(f"  Removing {plan.matrix.ids[i]} (gap fraction: {plan.row_gap_fraction[i]:.2f})")
+
+    reason = decision['reason']
+    if reason == 'too few sequences':
+        print(f"  FILTERED: Too few sequences after gap filtering")
+    elif reason == 'too short':
+        print(f"  FILTERED: Alignment too short ({plan.length} bp)")
+    elif reason == 'invalid codon alignment':
+        if decision['stop_row'] is None:
+            print(f"  WARNING: Alignment length {plan.length} not divisible by 3")
+        else:
+            print(f"  WARNING: Internal stop codon in {plan.matrix.ids[decision['stop_row']]}")
+        print(f"  FILTERED: Invalid codon alignment")
 
-    return True
+SUMMARY_COLUMNS = ['gene', 'status', 'reason', 'n_seqs_in', 'length_in',
+                   'n_seqs_out', 'length_out', 'output']
+SWEEP_COLUMNS = ['gene', 'max_gap_fraction', 'min_alignment_length', 'status', 'reason',
+                 'n_seqs_in', 'length_in', 'n_seqs_out', 'length_out']
+
+def filter_result(gene_name, status, reason='', qc=None, **fields):
+    """One row of the summary table, carrying its QC row under 'qc'"""
+    result = dict.fromkeys(SUMMARY_COLUMNS, '')
+    result.update(gene=gene_name, status=status, reason=reason, **fields)
+    result['qc'] = qc if qc is not None else qc_row(gene_name, status, reason)
+    return result
+
+def gene_name_of(input_file):
+    return fasta_stem(input_file.name).replace('.codon', '')
+
+def read_alignment(input_file):
+    if isinstance(input_file, BundleMember):
+        handle = input_file.open()
+    else:
+        handle = open_fasta(input_file)
+    with handle:
+        return AlignmentMatrix.read(handle)
 
 def process_alignment_file(input_file, output_dir, args):
     """
-    Process a single alignment file
+    Process a single alignment file and return its summary row
     """
-    gene_name = input_file.stem.replace('.codon', '')
+    gene_name = gene_name_of(input_file)
 
     try:
-        alignment = AlignIO.read(input_file, 'fasta')
+        alignment = read_alignment(input_file)
     except Exception as e:
         print(f"  ERROR reading {gene_name}: {e}")
-        return False
-
-    original_length = alignment.get_alignment_length()
-    original_n_seqs = len(alignment)
+        return filter_result(gene_name, 'error', f"read error: {e}")
 
-    print(f"  Original: {original_n_seqs} sequences, {original_length} bp")
+    counts = {'n_seqs_in': alignment.n_seqs, 'length_in': alignment.n_columns}
+    print(f"  Original: {alignment.n_seqs} sequences, {alignment.n_columns} bp")
 
-    # Step 1: Trim edges if requested
-    if args.trim_edges:
-        alignment = trim_alignment_edges(alignment)
-        if alignment is None:
-            print(f"  FILTERED: Too gappy after edge trimming")
-            return False
-        print(f"  After trimming: {alignment.get_alignment_length()} bp")
+    # Trim, filter sequences, check length and codons in one plan
+    plan = FilterPlan(alignment, args.trim_mode, args.trim_gap_threshold,
+                      args.trim_min_conservation)
+    decision = plan.decide(args.max_gap_fraction[0], args.min_species,
+                           args.min_alignment_length[0])
+    report_decision(plan, decision)
 
-    # Step 2: Filter gappy sequences
-    alignment = filter_alignment(alignment, args.max_gap_fraction, args.min_species)
-    if alignment is None:
-        print(f"  FILTERED: Too few sequences after gap filtering")
-        return False
+    status = 'passed' if decision['status'] == 'passed' else 'filtered'
+    qc = qc_row(gene_name, status, decision['reason'], plan, decision)
 
-    # Step 3: Check minimum length
-    if alignment.get_alignment_length() < args.min_alignment_length:
-        print(f"  FILTERED: Alignment too short ({alignment.get_alignment_length()} bp)")
-        return False
+    if status != 'passed':
+        return filter_result(gene_name, 'filtered', decision['reason'], qc=qc, **counts)
 
-    # Step 4: Validate codon alignment
-    if not validate_codon_alignment(alignment):
-        print(f"  FILTERED: Invalid codon alignment")
-        return False
+    if args.qc_only:
+        return filter_result(gene_name, 'passed', n_seqs_out=decision['n_seqs_out'], qc=qc,
+                             length_out=decision['length_out'], **counts)
 
     # Save filtered alignment
+    alignment = plan.apply(decision)
     output_file = output_dir / f"{gene_name}.filtered.fa"
-    AlignIO.write(alignment, output_file, 'fasta')
-
-    final_length = alignment.get_alignment_length()
-    final_n_seqs = len(alignment)
+    alignment.write(output_file)
 
-    print(f"  Final: {final_n_seqs} sequences, {final_length} bp")
+    print(f"  Final: {alignment.n_seqs} sequences, {alignment.n_columns} bp")
     print(f"  Saved: {output_file}")
 
-    return True
+    return filter_result(gene_name, 'passed', n_seqs_out=alignment.n_seqs, qc=qc,
+                         length_out=alignment.n_columns, output=str(output_file), **counts)
+
+def sweep_alignment_file(input_file, args):
+    """
+    Dry run: decisions for every combination of --max_gap_fraction and
+    --min_alignment_length values, without writing any alignment
+    """
+    gene_name = gene_name_of(input_file)
+
+    try:
+        alignment = read_alignment(input_file)
+    except Exception as e:
+        return [filter_result(gene_name, 'error', f"read error: {e}")]
+
+    plan = FilterPlan(alignment, args.trim_mode, args.trim_gap_threshold,
+                      args.trim_min_conservation)
+    rows = []
+    for max_gap_fraction in args.max_gap_fraction:
+        for min_length in args.min_alignment_length:
+            decision = plan.decide(max_gap_fraction, args.min_species, min_length)
+            rows.append({
+                'gene': gene_name,
+                'max_gap_fraction': max_gap_fraction,
+                'min_alignment_length': min_length,
+                'status': decision['status'],
+                'reason': decision['reason'],
+                'n_seqs_in': alignment.n_seqs,
+                'length_in': alignment.n_columns,
+                'n_seqs_out': decision['n_seqs_out'],
+                'length_out': decision['length_out']
+            })
+    return rows
+
+def _filter_worker(task):
+    """Filter one alignment in a worker process, capturing its log lines"""
+    input_file, output_dir, args = task
+    log = io.StringIO()
+    with redirect_stdout(log):
+        try:
+            if args.dry_run:
+                result = sweep_alignment_file(input_file, args)
+            else:
+                result = process_alignment_file(input_file, output_dir, args)
+        except Exception as e:
+            print(f"  ERROR: {type(e).__name__}: {e}")
+            result = filter_result(gene_name_of(input_file), 'error', f"{type(e).__name__}: {e}")
+    return result, log.getvalue()
+
+def _task(input_file, output_dir, args):
+    # Bundle members hold an open file handle; send their contents instead
+    if isinstance(input_file, BundleMember):
+        input_file = input_file.load()
+    return input_file, output_dir, args
+
+def _run_pool(indices, alignment_files, output_dir, args, workers):
+    """
+    Filter the given files on a process pool, keeping at most a few tasks per
+    worker in flight. Returns (results, in_flight_at_crash, not_started); the
+    last two are non-empty only if a worker died and broke the pool.
+    """
+    results = {}
+    crashed = []
+    queue = list(indices)[::-1]
+    pending = {}
+    broken = False
+    reported = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit_next():
+            nonlocal broken
+            if broken or not queue:
+                return
+            i = queue.pop()
+            try:
+                future = pool.submit(_filter_worker, _task(alignment_files[i], output_dir, args))
+            except BrokenProcessPool:
+                broken = True
+                queue.append(i)
+                return
+            pending[future] = i
+
+        for _ in range(workers * 4):
+            submit_next()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                try:
+                    results[i] = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    crashed.append(i)
+                    continue
+                submit_next()
+
+            if len(results) // 500 > reported:
+                reported = len(results) // 500
+                print(f"  Filtered {len(results)} alignments...", flush=True)
+
+    return results, crashed, queue[::-1]
+
+def run_parallel(alignment_files, output_dir, args):
+    """
+    Filter all files on a process pool and return (result, log) per file in
+    input order. Files that were in flight when a worker crashed are retried
+    one at a time in their own process, so only the file that actually kills
+    its worker is reported as crashed.
+    """
+    results = {}
+    suspects = []
+    todo = list(range(len(alignment_files)))
+
+    while todo:
+        done, crashed, todo = _run_pool(todo, alignment_files, output_dir, args, args.workers)
+        results.update(done)
+        suspects.extend(crashed)
+
+    for i in sorted(suspects):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            try:
+                results[i] = pool.submit(_filter_worker, _task(alignment_files[i], output_dir, args)).result()
+            except BrokenProcessPool:
+                gene_name = gene_name_of(alignment_files[i])
+                results[i] = (filter_result(gene_name, 'crashed', 'worker process died'),
+                              "  ERROR: worker process died\n")
+
+    return [results[i] for i in range(len(alignment_files))]
+
+def find_alignment_files(args):
+    """Alignment files from --file_list or --input, de-duplicated and in a stable order"""
+    if args.file_list:
+        with open(args.file_list) as handle:
+            return [Path(line.strip()) for line in handle if line.strip()]
+
+    input_path = Path(args.input)
+
+    # Bundle members are read in place; only codon alignments, like the
+    # pipeline's codon_alignments/ directory holds
+    if is_bundle(input_path):
+        members = BundleReader(input_path).glob(CODON_MEMBERS)
+        return [m for m in members if not m.name.endswith(FILTERED_SUFFIXES)]
+
+    if input_path.is_file():
+        return [input_path]
+
+    # Skip this script's own outputs if they share the directory
+    alignment_files = {f for pattern in FASTA_PATTERNS for f in input_path.glob(pattern)}
+    return sorted(f for f in alignment_files if not f.name.endswith(FILTERED_SUFFIXES))
 
 def main():
     args = parse_arguments()
 
-    input_dir = Path(args.input)
+    if not args.input and not args.file_list:
+        print("ERROR: Give either --input or --file_list")
+        sys.exit(1)
+
+    if args.qc_table and pa is None:
+        print("ERROR: pyarrow is required for --qc_table (or use --no_qc_table)")
+        sys.exit(1)
+    if args.qc_only and args.no_qc_table:
+        print("ERROR: --qc_only writes only tables; it cannot be combined with --no_qc_table")
+        sys.exit(1)
+
+    sweep = len(args.max_gap_fraction) > 1 or len(args.min_alignment_length) > 1
+    if sweep and not args.dry_run:
+        print("ERROR: Several --max_gap_fraction/--min_alignment_length values need --dry_run")
+        sys.exit(1)
+
     output_dir = Path(args.output)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Find all codon alignment files
-    alignment_files = list(input_dir.glob('*.codon.fa')) + \
-                     list(input_dir.glob('*.fa'))
+    alignment_files = find_alignment_files(args)
 
     if not alignment_files:
-        print(f"ERROR: No alignment files found in {input_dir}")
+        print(f"ERROR: No alignment files found in {args.input or args.file_list}")
         return
 
+    workers = max(1, min(args.workers, len(alignment_files)))
+
     print(f"Found {len(alignment_files)} alignments to filter")
     print(f"Parameters:")
-    print(f"  Max gap fraction: {args.max_gap_fraction}")
+    print(f"  Max gap fraction: {', '.join(map(str, args.max_gap_fraction))}")
     print(f"  Min species: {args.min_species}")
-    print(f"  Min length: {args.min_alignment_length} bp")
-    print(f"  Trim edges: {args.trim_edges}")
+    print(f"  Min length: {', '.join(map(str, args.min_alignment_length))} bp")
+    print(f"  Trim edges: {args.trim_mode == 'edges'}")
+    if args.trim_mode and args.trim_mode != 'edges':
+        print(f"  Trim mode: {args.trim_mode} (codon-aware)")
+    print(f"  Workers: {workers}")
+    if args.dry_run:
+        print(f"  Dry run: no alignments are written")
+    elif args.qc_only:
+        print(f"  QC only: no alignments are written")
     print()
 
-    passed = 0
-    failed = 0
-
-    for i, aln_file in enumerate(alignment_files, 1):
-        print(f"[{i}/{len(alignment_files)}] Processing {aln_file.stem}")
-
-        if process_alignment_file(aln_file, output_dir, args):
-            passed += 1
+    results = []
+    if args.dry_run:
+        if workers > 1:
+            args.workers = workers
+            for result, _ in run_parallel(alignment_files, output_dir, args):
+                results.extend(result if isinstance(result, list) else [result])
         else:
-            failed += 1
+            for aln_file in alignment_files:
+                results.extend(sweep_alignment_file(aln_file, args))
+    else:
+        # QC rows are streamed to Parquet in input order
+        qc_file = None if args.no_qc_table else args.qc_table or output_dir / 'filter_qc.parquet'
+        with QCTableWriter(qc_file) as qc_writer:
+            if workers > 1:
+                args.workers = workers
+                # Per-file logs are replayed in input order once all workers finish
+                for i, (result, log) in enumerate(run_parallel(alignment_files, output_dir, args), 1):
+                    print(f"[{i}/{len(alignment_files)}] Processing {result['gene']}")
+                    print(log)
+                    qc_writer.append(result['qc'])
+                    results.append(result)
+            else:
+                for i, aln_file in enumerate(alignment_files, 1):
+                    print(f"[{i}/{len(alignment_files)}] Processing {gene_name_of(aln_file)}")
+                    result = process_alignment_file(aln_file, output_dir, args)
+                    qc_writer.append(result['qc'])
+                    results.append(result)
+                    print()
+
+    if args.dry_run:
+        summary_file = args.summary or output_dir / 'filter_sweep.tsv'
+        write_summary(results, summary_file, SWEEP_COLUMNS)
+        print_sweep(results, args)
+        print(f"Sweep table: {summary_file}")
+        return
 
-        print()
+    summary_file = args.summary or output_dir / 'filter_summary.tsv'
+    write_summary(results, summary_file, SUMMARY_COLUMNS)
+
+    n_status = Counter(result['status'] for result in results)
 
     print("=== Summary ===")
-    print(f"Passed filter: {passed}")
-    print(f"Failed filter: {failed}")
+    print(f"Passed filter: {n_status['passed']}")
+    print(f"Failed filter: {len(results) - n_status['passed']}")
+    if n_status['error'] or n_status['crashed']:
+        print(f"  of which errors: {n_status['error']}, worker crashes: {n_status['crashed']}")
     print(f"Output directory: {output_dir}")
+    print(f"Summary table: {summary_file}")
+    if qc_writer.enabled:
+        print(f"QC table: {qc_file} ({qc_writer.n_rows} rows)")
+
+def print_sweep(rows, args):
+    """Passed / failed counts and retained sizes per parameter combination"""
+    print("=== Sweep (dry run) ===")
+    reasons = ['too gappy', 'too few sequences', 'too short',
+               'invalid codon alignment']
+    print(f"{'max_gap':>8} {'min_len':>8} {'passed':>8} {'gappy':>8} {'few_seqs':>8} "
+          f"{'short':>8} {'invalid':>8} {'errors':>8} {'mean_len':>9}")
+
+    errors = sum(1 for row in rows if row['status'] in ('error', 'crashed'))
+    for max_gap_fraction in args.max_gap_fraction:
+        for min_length in args.min_alignment_length:
+            combo = [row for row in rows
+                     if row.get('max_gap_fraction') == max_gap_fraction
+                     and row.get('min_alignment_length') == min_length]
+            n_reason = Counter(
+                'too gappy' if row['reason'].startswith('too gappy') else row['reason']
+                for row in combo if row['status'] == 'filtered'
+            )
+            lengths = [row['length_out'] for row in combo if row['status'] == 'passed']
+            mean_length = sum(lengths) / len(lengths) if lengths else 0
+            print(f"{max_gap_fraction:>8} {min_length:>8} {len(lengths):>8} "
+                  + ' '.join(f"{n_reason[reason]:>8}" for reason in reasons)
+                  + f" {errors:>8} {mean_length:>9.1f}")
+    print()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+ortholog_bundle.py
+Packed per-gene file bundles with an offset index
+
+A bundle is one data file holding the text of many small per-gene files
+(<gene>.cds.fa, <gene>.protein.fa, <gene>.codon.fa, <gene>.json, ...) plus a
+sidecar index (<bundle>.idx) mapping gene and member name to a byte offset,
+so a single file can be fetched without scanning the archive.
+
+Command line use (extraction shim for the Snakefile and external tools):
+    ortholog_bundle.py list BUNDLE
+    ortholog_bundle.py extract BUNDLE GENE MEMBER [-o OUT]
+    ortholog_bundle.py export BUNDLE OUT_DIR [--flat]
+    ortholog_bundle.py pack INPUT_DIR BUNDLE [--pattern GLOB]
+"""
+
+import argparse
+import io
+import os
+import sys
+from pathlib import Path
+from Bio import SeqIO
+
+INDEX_SUFFIX = '.idx'
+
+# Member names written by the pipeline, longest first, so that a gene name
+# containing dots is not split at its first dot
+MEMBER_SUFFIXES = ('protein_aligned.fa', 'filtered.fa', 'codon.fa', 'cds.fa',
+                   'protein.fa', 'json', 'log', 'fa')
+COMPRESSED_SUFFIXES = ('.gz', '.bgz')
+
+def index_path(bundle_path):
+    """Location of the sidecar index for a bundle"""
+    bundle_path = Path(bundle_path)
+    return bundle_path.with_name(bundle_path.name + INDEX_SUFFIX)
+
+def is_bundle(path):
+    """True if path is a bundle data file with an index next to it"""
+    path = Path(path)
+    return path.is_file() and index_path(path).exists()
+
+def fasta_text(records):
+    """Format SeqRecords exactly as SeqIO.write would write them to a file"""
+    handle = io.StringIO()
+    SeqIO.write(records, handle, 'fasta')
+    return handle.getvalue()
+
+def split_member_name(file_name, gene=None):
+    """
+    Gene_1.codon.fa -> ('Gene_1', 'codon.fa'). The gene is the given one if
+    the name starts with it (e.g. the per-gene directory name), else the
+    name is split before a known member suffix, else at its last dot.
+    """
+    if gene and file_name.startswith(gene + '.') and len(file_name) > len(gene) + 1:
+        return gene, file_name[len(gene) + 1:]
+
+    base = file_name
+    for suffix in COMPRESSED_SUFFIXES:
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+            break
+    for member in MEMBER_SUFFIXES:
+        if base.endswith('.' + member) and len(base) > len(member) + 1:
+            split = len(base) - len(member) - 1
+            return file_name[:split], file_name[split + 1:]
+
+    gene, _, member = file_name.rpartition('.')
+    return (gene, member) if gene else (file_name, '')
+
+class BundleWriter:
+    """
+    Append per-gene files to a bundle; the index is written on close. Used
+    as a context manager, an exception discards the partial bundle instead
+    of committing it.
+    """
+
+    def __init__(self, bundle_path):
+        self.bundle_path = Path(bundle_path)
+        self.bundle_path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp_path = self.bundle_path.with_name(self.bundle_path.name + '.tmp')
+        self._handle = open(self._tmp_path, 'wb')
+        self._entries = []
+        self._offset = 0
+
+    def write(self, gene, member, text):
+        data = text.encode() if isinstance(text, str) else text
+        self._handle.write(data)
+        self._entries.append((gene, member, self._offset, len(data)))
+        self._offset += len(data)
+
+    def write_fasta(self, gene, member, records):
+        self.write(gene, member, fasta_text(records))
+
+    def close(self):
+        if self._handle is None:
+            return
+        self._handle.close()
+        self._handle = None
+
+        idx_tmp = self._tmp_path.with_name(self._tmp_path.name + INDEX_SUFFIX)
+        with open(idx_tmp, 'w') as handle:
+            for gene, member, offset, length in self._entries:
+                handle.write(f"{gene}\t{member}\t{offset}\t{length}\n")
+
+        os.replace(self._tmp_path, self.bundle_path)
+        os.replace(idx_tmp, index_path(self.bundle_path))
+
+    def abort(self):
+        """Discard the partial bundle; an existing bundle at bundle_path is kept"""
+        if self._handle is None:
+            return
+        self._handle.close()
+        self._handle = None
+        self._tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is not None:
+            self.abort()
+        else:
+            self.close()
+
+class OrthologDirectory:
+    """Per-gene directory layout: <root>/<gene>/<gene>.<member>"""
+
+    def __init__(self, root, flat=False):
+        self.root = Path(root)
+        self.flat = flat
+
+    def path(self, gene, member):
+        gene_dir = self.root if self.flat else self.root / gene
+        return gene_dir / f"{gene}.{member}"
+
+    def write(self, gene, member, text):
+        path = self.path(gene, member)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        mode = 'w' if isinstance(text, str) else 'wb'
+        with open(path, mode) as handle:
+            handle.write(text)
+
+    def write_fasta(self, gene, member, records):
+        self.write(gene, member, fasta_text(records))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def open_ortholog_output(out_dir, bundle=None):
+    """Writer for extracted ortholog groups: a bundle if given, else per-gene directories"""
+    if bundle:
+        return BundleWriter(bundle)
+    return OrthologDirectory(out_dir)
+
+class BundleMember:
+    """
+    One file inside a bundle
+
+    Offers the small part of the pathlib.Path interface the pipeline scripts
+    use (name, stem, open, read_text), so they accept bundle members and
+    plain files alike.
+    """
+
+    def __init__(self, reader, gene, member):
+        self.reader = reader
+        self.gene = gene
+        self.member = member
+        self.name = f"{gene}.{member}"
+        self.stem = Path(self.name).stem
+
+    def read_bytes(self):
+        return self.reader.read_bytes(self.gene, self.member)
+
+    def read_text(self):
+        return self.read_bytes().decode()
+
+    def open(self, mode='r'):
+        if 'b' in mode:
+            return io.BytesIO(self.read_bytes())
+        return io.StringIO(self.read_text())
+
+    def load(self):
+        """Read the member into a LoadedMember that can be sent to another process"""
+        return LoadedMember(self.name, self.read_bytes())
+
+    def __repr__(self):
+        return f"{self.reader.bundle_path}:{self.name}"
+
+class LoadedMember(BundleMember):
+    """A bundle member held in memory (picklable, unlike a BundleMember)"""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.stem = Path(name).stem
+        self.data = data
+
+    def read_bytes(self):
+        return self.data
+
+    def load(self):
+        return self
+
+    def __repr__(self):
+        return self.name
+
+class BundleReader:
+    """Random access to the files in a bundle by gene and member name"""
+
+    def __init__(self, bundle_path):
+        self.bundle_path = Path(bundle_path)
+        self._index = {}
+
+        with open(index_path(self.bundle_path)) as handle:
+            for line in handle:
+                gene, member, offset, length = line.rstrip('\n').split('\t')
+                self._index.setdefault(gene, {})[member] = (int(offset), int(length))
+
+        self._handle = open(self.bundle_path, 'rb')
+
+    def genes(self):
+        return list(self._index.keys())
+
+    def members(self, gene):
+        return list(self._index.get(gene, {}).keys())
+
+    def has(self, gene, member):
+        return member in self._index.get(gene, {})
+
+    def length(self, gene, member):
+        """Size of a member in bytes"""
+        return self._index[gene][member][1]
+
+    def read_bytes(self, gene, member):
+        offset, length = self._index[gene][member]
+        self._handle.seek(offset)
+        return self._handle.read(length)
+
+    def read_text(self, gene, member):
+        return self.read_bytes(gene, member).decode()
+
+    def member(self, gene, member):
+        return BundleMember(self, gene, member)
+
+    def glob(self, member_suffix):
+        """All members whose name ends with member_suffix (or one of a tuple), in bundle order"""
+        return [
+            BundleMember(self, gene, member)
+            for gene, members in self._index.items()
+            for member in members
+            if member.endswith(member_suffix)
+        ]
+
+    def export(self, out_dir, flat=False):
+        """Write every member back out as a per-gene directory tree"""
+        output = OrthologDirectory(out_dir, flat=flat)
+        n_files = 0
+        for gene, members in self._index.items():
+            for member in members:
+                output.write(gene, member, self.read_bytes(gene, member))
+                n_files += 1
+        return n_files
+
+    def close(self):
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def pack_directory(input_dir, bundle_path, pattern='**/*'):
+    """Pack every file under input_dir matching pattern into a bundle"""
+    input_dir = Path(input_dir)
+    files = sorted(f for f in input_dir.glob(pattern) if f.is_file())
+
+    with BundleWriter(bundle_path) as writer:
+        for path in files:
+            # In the per-gene layout the directory names the gene
+            gene_dir = path.parent.name if path.parent != input_dir else None
+            gene, member = split_member_name(path.name, gene_dir)
+            writer.write(gene, member, path.read_bytes())
+
+    return len(files)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Inspect, extract from and create packed ortholog bundles'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = subparsers.add_parser('list', help='List genes and members in a bundle')
+    list_parser.add_argument('bundle', type=str)
+
+    extract_parser = subparsers.add_parser('extract', help='Extract one file from a bundle')
+    extract_parser.add_argument('bundle', type=str)
+    extract_parser.add_argument('gene', type=str)
+    extract_parser.add_argument('member', type=str, help='Member name, e.g. cds.fa or protein.fa')
+    extract_parser.add_argument('-o', '--output', type=str, default=None,
+                                help='Output file (default: stdout)')
+
+    export_parser = subparsers.add_parser('export', help='Export a bundle as per-gene files')
+    export_parser.add_argument('bundle', type=str)
+    export_parser.add_argument('out_dir', type=str)
+    export_parser.add_argument('--flat', action='store_true',
+                               help='Write <out_dir>/<gene>.<member> instead of <out_dir>/<gene>/<gene>.<member>')
+
+    pack_parser = subparsers.add_parser('pack', help='Pack a directory of per-gene files')
+    pack_parser.add_argument('input_dir', type=str)
+    pack_parser.add_argument('bundle', type=str)
+    pack_parser.add_argument('--pattern', type=str, default='**/*',
+                             help="Glob of files to pack (default: '**/*')")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+
+    if args.command == 'pack':
+        n_files = pack_directory(args.input_dir, args.bundle, args.pattern)
+        print(f"Packed {n_files} files into {args.bundle}")
+        return
+
+    if not is_bundle(args.bundle):
+        print(f"ERROR: {args.bundle} is not a bundle (missing {index_path(args.bundle)})")
+        sys.exit(1)
+
+    with BundleReader(args.bundle) as reader:
+        if args.command == 'list':
+            for gene in reader.genes():
+                print(f"{gene}\t{','.join(reader.members(gene))}")
+
+        elif args.command == 'extract':
+            if not reader.has(args.gene, args.member):
+                print(f"ERROR: {args.gene}.{args.member} not found in {args.bundle}", file=sys.stderr)
+                sys.exit(1)
+
+            data = reader.read_bytes(args.gene, args.member)
+            if args.output:
+                Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+                with open(args.output, 'wb') as handle:
+                    handle.write(data)
+            else:
+                sys.stdout.buffer.write(data)
+
+        elif args.command == 'export':
+            n_files = reader.export(args.out_dir, flat=args.flat)
+            print(f"Exported {n_files} files to {args.out_dir}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+ortholog_table.py
+Column-pruned, typed reading of BioMart / Compara ortholog tables
+
+BioMart exports carry dozens of columns per species, most of which the
+extractors never look at. The readers here parse only the requested
+columns, keep every cell as a string (no per-column type guessing) and
+store stable-ID columns as pandas categoricals, which holds millions of
+repeated IDs in a fraction of the memory of object columns.
+
+  read_ortholog_table  - whole pruned table, optionally cached next to the
+                         TSV as Parquet (or Feather) so repeat runs skip
+                         the TSV parse; needs pyarrow and falls back to
+                         an uncached read without it
+  iter_gene_chunks     - stream the TSV in chunks that always contain
+                         complete gene groups (rows of one gene must be
+                         contiguous, as in BioMart exports)
+"""
+
+import hashlib
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (Parquet / Feather engine)
+except ImportError:
+    pyarrow = None
+
+CACHE_FORMATS = ('parquet', 'feather')
+
+def table_columns(path):
+    """Column names from the header line of a TSV table"""
+    return list(pd.read_csv(path, sep='\t', nrows=0).columns)
+
+def _prune(path, columns):
+    """Requested columns that exist in the table, in table order"""
+    available = table_columns(path)
+    if columns is None:
+        return available
+    wanted = set(columns)
+    return [col for col in available if col in wanted]
+
+def _as_categories(df, id_columns):
+    for col in id_columns:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def cache_path(path, columns, fmt='parquet'):
+    """
+    Cache file for a pruned table. The name hashes the source size, mtime
+    and column list, so editing the TSV or asking for other columns never
+    picks up a stale cache.
+    """
+    path = Path(path)
+    stat = path.stat()
+    key = f"{stat.st_size}\t{stat.st_mtime_ns}\t" + '\t'.join(columns)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    return path.with_name(f"{path.name}.{digest}.{fmt}")
+
+def _read_cache(cache_file, fmt):
+    if fmt == 'parquet':
+        return pd.read_parquet(cache_file)
+    return pd.read_feather(cache_file)
+
+def _write_cache(df, path, cache_file, fmt):
+    """Write the cache atomically and drop caches of older versions of the table"""
+    tmp_file = cache_file.with_name(cache_file.name + '.tmp')
+    if fmt == 'parquet':
+        df.to_parquet(tmp_file, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(tmp_file)
+    tmp_file.replace(cache_file)
+
+    for old in cache_file.parent.glob(f"{Path(path).name}.*.{fmt}"):
+        if old != cache_file:
+            old.unlink()
+
+def read_ortholog_table(path, columns=None, id_columns=(), cache=None):
+    """
+    Read an ortholog TSV keeping only `columns` (those missing from the
+    table are skipped), with all cells as strings and `id_columns` as
+    categoricals. cache='parquet' or 'feather' stores the pruned table next
+    to the TSV and reuses it while the TSV is unchanged.
+    """
+    usecols = _prune(path, columns)
+
+    if cache and pyarrow is None:
+        print("  Note: pyarrow is not installed, ortholog table cache disabled")
+        cache = None
+
+    if cache:
+        cache_file = cache_path(path, usecols, cache)
+        if cache_file.exists():
+            print(f"  Using cached table: {cache_file}")
+            return _read_cache(cache_file, cache)
+
+    df = pd.read_csv(path, sep='\t', usecols=usecols, dtype=str)
+    df = _as_categories(df[usecols], id_columns)
+
+    if cache:
+        _write_cache(df, path, cache_file, cache)
+        print(f"  Cached table: {cache_file}")
+
+    return df
+
+def iter_gene_chunks(path, group_col, columns=None, id_columns=(), chunksize=500000):
+    """
+    Stream an ortholog TSV as DataFrames of about `chunksize` rows, cut only
+    at gene boundaries so every group is complete within one chunk
+    """
+    usecols = _prune(path, columns)
+    if group_col not in usecols:
+        raise ValueError(f"Group column '{group_col}' not in {path}")
+
+    seen = set()
+    carry = None
+    reader = pd.read_csv(path, sep='\t', usecols=usecols, dtype=str,
+                         chunksize=chunksize)
+
+    for chunk in reader:
+        chunk = chunk[usecols]
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+
+        # Hold back the last gene: its rows may continue in the next chunk
+        groups = chunk[group_col]
+        last = groups.iloc[-1]
+        tail = (groups == last) if pd.notna(last) else groups.isna()
+        before_tail = np.flatnonzero(~tail.values)
+        cut = before_tail[-1] + 1 if len(before_tail) else 0
+
+        complete, carry = chunk.iloc[:cut], chunk.iloc[cut:]
+        if len(complete):
+            yield _checked(complete, group_col, seen, id_columns)
+
+    if carry is not None and len(carry):
+        yield _checked(carry, group_col, seen, id_columns)
+
+def _checked(chunk, group_col, seen, id_columns):
+    """Fail if a gene reappears in a later chunk (table not grouped by gene)"""
+    groups = set(chunk[group_col].dropna().unique())
+    repeated = groups & seen
+    if repeated:
+        raise ValueError(
+            f"Rows of gene {sorted(repeated)[0]} are not contiguous; sort the table by "
+            f"'{group_col}' or read it without chunking"
+        )
+    seen.update(groups)
+    return _as_categories(chunk.reset_index(drop=True), id_columns)
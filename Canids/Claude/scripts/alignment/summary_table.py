@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+summary_table.py
+Per-gene summary tables of the batch alignment scripts
+
+filter_alignments.py and back_translate.py write one row per gene with its
+status and the reason it failed; both go through write_summary().
+"""
+
+import os
+from pathlib import Path
+
+def write_summary(results, summary_file, columns):
+    """Write one row per result dict (the given columns, tab-separated) atomically"""
+    summary_file = Path(summary_file)
+    summary_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = summary_file.with_name(summary_file.name + '.tmp')
+    with open(tmp_file, 'w') as handle:
+        handle.write('\t'.join(columns) + '\n')
+        for result in results:
+            handle.write('\t'.join(str(result.get(col, '')) for col in columns) + '\n')
+    os.replace(tmp_file, summary_file)
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
-import pandas as pd
 import random
+import sys
+from pathlib import Path
 
-df = pd.read_csv('data/orthologs/ensembl_compara_table.tsv', sep='\t', low_memory=False)
-ids = df['Gene stable ID'].unique()
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'alignment'))
+from ortholog_table import read_ortholog_table
+
+# Only the gene ID column is needed; the pruned table is cached as Parquet
+df = read_ortholog_table('data/orthologs/ensembl_compara_table.tsv', ['Gene stable ID'],
+                         id_columns=['Gene stable ID'], cache='parquet')
+ids = df['Gene stable ID'].dropna().unique()
 
 print(f'Total unique gene IDs: {len(ids)}')
 print('\nFirst 20 gene IDs with their directory names:')
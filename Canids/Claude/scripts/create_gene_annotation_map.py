@@ -1,32 +1,38 @@
 #!/usr/bin/env python3
 """
 Create gene annotation map from Ensembl CDS files
+
+Only the FASTA headers are read: fasta_headers() skips the sequence lines
+at the byte level (plain or gzipped files), and the Ensembl fields of each
+header are picked out with one compiled pattern.
 """
 
-from Bio import SeqIO
 import json
-import gzip
+import re
+import sys
 from pathlib import Path
 
-def parse_ensembl_header(description):
-    """Extract gene symbol and description from Ensembl header"""
-    info = {}
-
-    if 'gene:' in description:
-        gene_id = description.split('gene:')[1].split()[0].split('.')[0]
-        info['gene_id'] = gene_id
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'alignment'))
+from fasta_io import fasta_headers
 
-    if 'gene_symbol:' in description:
-        symbol = description.split('gene_symbol:')[1].split()[0]
-        info['symbol'] = symbol
+# Ensembl header fields: gene:ID.version, transcript:ID.version, gene_symbol:SYMBOL,
+# and description:free text [Source:...], which runs to the end of the header
+HEADER_FIELD = re.compile(
+    rb'(?<!\S)(?:(gene|transcript):([^\s.]+)\S*|gene_symbol:(\S+)|description:(.*?)\s*(?:\[Source|$))'
+)
 
-    if 'description:' in description:
-        desc = description.split('description:')[1].split('[Source')[0].strip()
-        info['description'] = desc
+def parse_ensembl_header(description):
+    """Extract gene symbol and description from Ensembl header (bytes)"""
+    info = {}
 
-    if 'transcript:' in description:
-        transcript_id = description.split('transcript:')[1].split()[0].split('.')[0]
-        info['transcript_id'] = transcript_id
+    for match in HEADER_FIELD.finditer(description):
+        name, value, symbol, desc = match.groups()
+        if name is not None:
+            info.setdefault(f"{name.decode()}_id", value.decode())
+        elif symbol is not None:
+            info.setdefault('symbol', symbol.decode())
+        else:
+            info.setdefault('description', desc.decode().strip())
 
     return info
 
@@ -34,29 +40,30 @@ def main():
     # Parse dog CDS
     print("Parsing Canis familiaris CDS...")
     dog_cds = Path('data/cds/Canis_familiaris.cds.fa')
+    if not dog_cds.exists() and dog_cds.with_name(dog_cds.name + '.gz').exists():
+        dog_cds = dog_cds.with_name(dog_cds.name + '.gz')
 
     gene_map = {}
 
-    with open(dog_cds, 'r') as handle:
-        for record in SeqIO.parse(handle, 'fasta'):
-            info = parse_ensembl_header(record.description)
+    for header in fasta_headers(dog_cds):
+        info = parse_ensembl_header(header)
 
-            if 'gene_id' in info:
-                gene_id = info['gene_id']
+        if 'gene_id' in info:
+            gene_id = info['gene_id']
 
-                # Create gene name as used in directories
-                gene_name = f"Gene_{gene_id.split('G')[-1]}"
+            # Create gene name as used in directories
+            gene_name = f"Gene_{gene_id.split('G')[-1]}"
 
-                if gene_name not in gene_map:
-                    gene_map[gene_name] = {
-                        'gene_id': gene_id,
-                        'symbol': info.get('symbol', 'Unknown'),
-                        'description': info.get('description', 'No description'),
-                        'transcripts': []
-                    }
+            if gene_name not in gene_map:
+                gene_map[gene_name] = {
+                    'gene_id': gene_id,
+                    'symbol': info.get('symbol', 'Unknown'),
+                    'description': info.get('description', 'No description'),
+                    'transcripts': []
+                }
 
-                if 'transcript_id' in info:
-                    gene_map[gene_name]['transcripts'].append(info['transcript_id'])
+            if 'transcript_id' in info:
+                gene_map[gene_name]['transcripts'].append(info['transcript_id'])
 
     print(f"Mapped {len(gene_map)} genes")
 
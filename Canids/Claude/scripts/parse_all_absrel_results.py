@@ -1,48 +1,177 @@
 #!/usr/bin/env python3
 """
 Parse all aBSREL results and identify genes under positive selection
+
+Each HyPhy log is memory-mapped and read from the last "Testing selected
+branches" table onward: one pass over that table and the summary block
+after it yields every tested branch's rate classes, omega, LRT, EBF site
+count and uncorrected and Holm-corrected p-values. Table columns are
+matched by their header (LOG_COLUMNS), so the layout of HyPhy versions with
+or without extra columns is read alike. Logs are scanned on a process pool.
+
+Genes are called at a Benjamini-Hochberg FDR of FDR_THRESHOLD across all
+genes, using each gene's smallest corrected branch p-value. Only finished
+runs enter the correction (their JSON exists in the matching results
+directory, or the log reached its summary block); running and failed runs
+are counted and reported, in one-shot and --watch mode alike.
+
+With --watch the script keeps running while HyPhy does: every --interval
+seconds it polls --logs_dir for new or changed logs, parses only those that
+are finished, prints the running totals (genes done,
+failed, significant genes, genes/hour, ETA) and rewrites the summary files
+atomically, so they are current at any time without a full rescan. An
+incomplete log that has not changed for --stale_hours is counted as a
+failed run.
 """
 
+import argparse
+import mmap
 import os
 import re
 import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from collections import defaultdict
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'selection'))
+from multiple_testing import adjust
+
+# selection: fdr_threshold in config/analysis_config.yaml
+FDR_THRESHOLD = 0.1
+
+# Genes in the full analysis (as in monitor_progress.sh)
+TOTAL_GENES = 18008
+
+TEST_BLOCK = b'### Testing selected branches for selection'
+SUMMARY_BLOCK = b'### Adaptive branch site random effects likelihood test'
+TABLE_ROW = re.compile(rb'^\|(.*)\|[ \t\r]*$', re.M)
+TABLE_RULE = re.compile(rb'^[-|: ]+$')
+SUMMARY_PVALUE = re.compile(rb'^\*\s+(.+?), p-value =\s+([\d.]+)', re.M)
+EBF_LINE = re.compile(rb'Sites @ EBF>=100 \|\s+(\d+)')
+OMEGA_CELL = re.compile(r'([>\d.]+)\s*(?:\(([\d.]+)%\))?')
+
+def _omega(cell):
+    """'>1000 (0.50%)' -> '>1000' (the largest dN/dS class, as printed)"""
+    match = OMEGA_CELL.match(cell)
+    return match.group(1) if match else None
+
+# Header prefix of a log table column -> (field, converter)
+LOG_COLUMNS = [
+    ('Branch', 'branch', str),
+    ('Rates', 'rate_classes', int),
+    ('Max. dN/dS', 'omega', _omega),
+    ('Test LRT', 'LRT', float),
+    ('Uncorrected p-value', 'uncorrected_pvalue', float),
+    ('Sites @ EBF', 'sites', int)
+]
+
+BRANCH_FIELDS = ['branch', 'rate_classes', 'omega', 'LRT', 'uncorrected_pvalue',
+                 'pvalue', 'sites']
+
+def _cells(row):
+    return [cell.strip() for cell in row.decode('utf-8', 'replace').split('|')]
+
+def _header_fields(header):
+    """(cell index, field, converter) for the recognized columns of a header row"""
+    fields = []
+    for i, label in enumerate(_cells(header)):
+        for prefix, field, convert in LOG_COLUMNS:
+            if label.startswith(prefix):
+                fields.append((i, field, convert))
+                break
+    return fields
+
+def _convert(convert, cell):
+    try:
+        return convert(cell)
+    except ValueError:
+        return None
+
+def scan_log(buffer):
+    """
+    (branches, gene-level EBF site count, complete) from the text of an
+    aBSREL log: one {field: value} dict per tested branch, in table order,
+    and whether the log reached its final summary block
+    """
+    start = buffer.rfind(TEST_BLOCK)
+    if start < 0:
+        return [], None, False
+
+    branches = {}
+    fields = None
+    pos = buffer.find(b'\n', start) + 1
+    for match in TABLE_ROW.finditer(buffer, pos):
+        # The table is the first run of consecutive '|' lines after the heading
+        if fields is not None and match.start() != pos:
+            break
+        pos = match.end() + 1
+        row = match.group(1)
+        if fields is None:
+            fields = _header_fields(row)
+        elif not TABLE_RULE.match(row):
+            cells = _cells(row)
+            branch = {field: _convert(convert, cells[i])
+                      for i, field, convert in fields if i < len(cells)}
+            if branch.get('branch'):
+                branches[branch['branch']] = branch
+
+    # Summary: Holm-corrected p-values of the branches found under selection
+    for match in SUMMARY_PVALUE.finditer(buffer, pos):
+        name = match.group(1).decode('utf-8', 'replace').strip()
+        branches.setdefault(name, {'branch': name})['pvalue'] = float(match.group(2))
+
+    ebf = EBF_LINE.search(buffer, start)
+    complete = buffer.find(SUMMARY_BLOCK, start) >= 0
+    return list(branches.values()), int(ebf.group(1)) if ebf else None, complete
+
 def parse_log_file(log_path):
     """Parse HyPhy log file for selection results"""
-    with open(log_path, 'r') as f:
-        content = f.read()
-
     result = {
         'gene': Path(log_path).stem,
         'significant': False,
         'omega': None,
         'pvalue': None,
-        'sites': None
+        'qvalue': None,
+        'sites': None,
+        'branches': [],
+        'complete': False,
+        'finished': None
     }
 
-    # Check for significant selection
-    if 'p-value =  0.00000' in content or 'p-value = 0.00000' in content:
-        result['significant'] = True
-
-        # Extract omega value
-        omega_match = re.search(r'\|\s+Vulpes_vulpes\s+\|\s+\d+\s+\|\s+([\d.>]+)\s+\(', content)
-        if omega_match:
-            result['omega'] = omega_match.group(1)
-
-        # Extract sites under selection
-        sites_match = re.search(r'Sites @ EBF>=100 \|\s+(\d+)', content)
-        if sites_match:
-            result['sites'] = int(sites_match.group(1))
-
-        # Extract p-value
-        pvalue_match = re.search(r'p-value =\s+([\d.]+)', content)
-        if pvalue_match:
-            result['pvalue'] = float(pvalue_match.group(1))
+    with open(log_path, 'rb') as handle:
+        stat = os.fstat(handle.fileno())
+        result['finished'] = stat.st_mtime
+        if stat.st_size == 0:
+            return result
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            branches, gene_sites, result['complete'] = scan_log(buffer)
+
+    result['branches'] = branches
+    result['sites'] = gene_sites
+
+    # Gene-level values from the most significant branch; aBSREL only lists
+    # corrected p-values of branches with p <= 0.05, so genes without any
+    # are treated as p = 1 for the correction
+    reported = [branch for branch in branches if branch.get('pvalue') is not None]
+    if reported:
+        best = min(reported, key=lambda branch: branch['pvalue'])
+        result['pvalue'] = best['pvalue']
+        result['omega'] = best.get('omega')
+        if best.get('sites') is not None:
+            result['sites'] = best['sites']
 
     return result
 
+def parse_log_files(log_files, workers=1):
+    """parse_log_file() of every log, in order, on a process pool if workers > 1"""
+    if workers <= 1:
+        return [parse_log_file(log_file) for log_file in log_files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(parse_log_file, log_files,
+                             chunksize=max(1, len(log_files) // (workers * 8))))
+
 def load_gene_annotations():
     """Load gene annotations from JSON file"""
     annotation_file = Path('data/gene_annotations.json')
@@ -62,9 +191,214 @@ def get_gene_info(gene_name, gene_annotations):
 
     return 'Unknown', 'No description'
 
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Summarize aBSREL logs and list genes under positive selection'
+    )
+    parser.add_argument(
+        '--logs_dir',
+        type=str,
+        default='logs/hyphy/absrel',
+        help='Directory of HyPhy aBSREL logs (default: logs/hyphy/absrel)'
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='results_summary.tsv',
+        help='Summary of the genes under selection (default: results_summary.tsv)'
+    )
+    parser.add_argument(
+        '--branches_output',
+        type=str,
+        default='results_branches.tsv',
+        help='Every tested branch of every gene (default: results_branches.tsv)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='Number of processes scanning logs in parallel (default: all CPUs)'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep polling --logs_dir while HyPhy runs, parse only new outputs and '
+             'rewrite the summary files as results arrive (stop with Ctrl-C)'
+    )
+    parser.add_argument(
+        '--results_dir',
+        type=str,
+        default=None,
+        help='HyPhy JSON outputs of the --logs_dir runs, which mark a run as finished '
+             '(default: from --logs_dir, logs/hyphy_X/absrel -> hyphy_results_X/absrel)'
+    )
+    parser.add_argument(
+        '--interval',
+        type=int,
+        default=300,
+        help='Seconds between polls in --watch mode (default: 300)'
+    )
+    parser.add_argument(
+        '--total_genes',
+        type=int,
+        default=TOTAL_GENES,
+        help=f'Genes in the analysis, for the ETA in --watch mode (default: {TOTAL_GENES})'
+    )
+    parser.add_argument(
+        '--stale_hours',
+        type=float,
+        default=12,
+        help='An incomplete log unchanged for this long is a failed run, not a running '
+             'one (default: 12)'
+    )
+    return parser.parse_args()
+
+def select_genes(all_results, gene_annotations):
+    """
+    Correct gene p-values across all results at once and return the
+    significant genes, annotated and sorted by omega (descending)
+    """
+    selected_genes = []
+
+    # Multiple-testing correction across all genes at once
+    qvalues = adjust([1.0 if r['pvalue'] is None else r['pvalue'] for r in all_results], 'bh')
+    for result, qvalue in zip(all_results, qvalues):
+        result['qvalue'] = qvalue
+        result['significant'] = qvalue <= FDR_THRESHOLD
+
+        if result['significant']:
+            # Get gene annotation
+            symbol, description = get_gene_info(result['gene'], gene_annotations)
+
+            result['symbol'] = symbol
+            result['description'] = description
+            selected_genes.append(result)
+
+    # Sort by omega value (descending)
+    selected_genes.sort(key=lambda x: float(x['omega'].replace('>', '')) if x['omega'] and x['omega'].replace('>', '').replace('.', '').isdigit() else 0, reverse=True)
+    return selected_genes
+
+def write_summary(selected_genes, output_file):
+    """Summary of the selected genes, written under a temporary name and moved into place"""
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        f.write("Gene_ID\tGene_Symbol\tOmega\tSites\tP_value\tQ_value\tDescription\n")
+        for gene in selected_genes:
+            f.write(f"{gene['gene']}\t")
+            f.write(f"{gene['symbol'] or 'Unknown'}\t")
+            f.write(f"{gene['omega'] or 'NA'}\t")
+            f.write(f"{gene['sites'] or 'NA'}\t")
+            f.write(f"{gene['pvalue'] if gene['pvalue'] is not None else 'NA'}\t")
+            f.write(f"{gene['qvalue']:.6g}\t")
+            f.write(f"{gene['description'] or 'No description'}\n")
+    os.replace(tmp_file, output_file)
+
+def write_branches(all_results, output_file):
+    """One row per tested branch of every gene (written atomically)"""
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        f.write("Gene_ID\tBranch\tRate_classes\tOmega\tLRT\tUncorrected_P\tCorrected_P\tSites\n")
+        for result in all_results:
+            for branch in result['branches']:
+                values = [branch.get(field) for field in BRANCH_FIELDS]
+                f.write(result['gene'] + '\t' +
+                        '\t'.join('NA' if value is None else str(value) for value in values) + '\n')
+    os.replace(tmp_file, output_file)
+
+def default_results_dir(logs_dir):
+    """HyPhy JSON directory of a logs directory (logs/hyphy_X/absrel -> hyphy_results_X/absrel)"""
+    logs_dir = Path(logs_dir)
+    suffix = logs_dir.parent.name[len('hyphy'):]
+    return Path(f"hyphy_results{suffix}") / logs_dir.name
+
+def poll_logs(seen, logs_dir, results_dir, workers, stale_seconds):
+    """
+    Parse the logs in logs_dir that are new or changed since the last poll
+    (or whose JSON output has appeared since) and record them in seen, as
+    {log: ((size, mtime_ns), state, result)} with state 'done', 'running'
+    or 'failed' (incomplete and unchanged for stale_seconds; result None
+    unless done). Returns the number of logs parsed.
+    """
+    now = time.time()
+    finished = {path.stem for path in results_dir.glob('*.json')}
+
+    todo = []
+    for log_file in sorted(logs_dir.glob('*.log')):
+        try:
+            stat = log_file.stat()
+        except FileNotFoundError:
+            continue
+        key = (stat.st_size, stat.st_mtime_ns)
+        stale = now - stat.st_mtime > stale_seconds
+        entry = seen.get(log_file)
+        if entry is not None and entry[0] == key:
+            if entry[1] == 'done' or log_file.stem not in finished:
+                if entry[1] == 'running' and stale:
+                    seen[log_file] = (key, 'failed', None)
+                continue
+        todo.append((log_file, key, stale))
+
+    results = parse_log_files([log_file for log_file, _, _ in todo], min(workers, max(1, len(todo))))
+    for (log_file, key, stale), result in zip(todo, results):
+        if result['complete'] or log_file.stem in finished:
+            seen[log_file] = (key, 'done', result)
+        else:
+            seen[log_file] = (key, 'failed' if stale else 'running', None)
+    return len(todo)
+
+def _duration(hours):
+    return f"{int(hours)}h {int(hours % 1 * 60):02d}m"
+
+def watch(args, gene_annotations):
+    """Poll for new outputs, keep the running aggregates and summary files current"""
+    logs_dir = Path(args.logs_dir)
+    results_dir = Path(args.results_dir) if args.results_dir else default_results_dir(logs_dir)
+    seen = {}
+    n_selected = 0
+    print(f"Watching {logs_dir} (results: {results_dir}) every {args.interval}s (Ctrl-C to stop)\n")
+
+    try:
+        while True:
+            n_parsed = poll_logs(seen, logs_dir, results_dir, args.workers,
+                                 args.stale_hours * 3600)
+            all_results = [result for _, state, result in seen.values() if state == 'done']
+            n_running = sum(1 for _, state, _ in seen.values() if state == 'running')
+            n_failed = len(seen) - len(all_results) - n_running
+
+            if n_parsed:
+                selected_genes = select_genes(all_results, gene_annotations)
+                write_summary(selected_genes, args.output)
+                write_branches(all_results, args.branches_output)
+            n_selected = sum(1 for result in all_results if result['significant'])
+
+            # Rate from the completion times of the finished runs
+            status = (f"[{time.strftime('%H:%M:%S')}] {len(all_results)} / {args.total_genes} genes "
+                      f"done, {n_running} running, {n_failed} failed, {n_selected} significant "
+                      f"(q <= {FDR_THRESHOLD}), {n_parsed} new")
+            finished = [result['finished'] for result in all_results]
+            if len(finished) > 1:
+                hours = (max(time.time(), max(finished)) - min(finished)) / 3600
+                rate = (len(finished) - 1) / hours if hours > 0 else 0.0
+                remaining = max(args.total_genes - len(finished) - n_failed, 0)
+                status += f", {rate:,.0f} genes/h"
+                if rate > 0:
+                    status += f", ETA {_duration(remaining / rate)}"
+            print(status, flush=True)
+
+            if seen and len(seen) >= args.total_genes and not n_running:
+                print(f"\nAll genes done ({n_failed} failed)")
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\nStopped")
+
+    print(f"Summary: {args.output} ({n_selected} genes), branches: {args.branches_output}")
+
 def main():
+    args = parse_arguments()
+
     # Directories
-    logs_dir = Path('logs/hyphy/absrel')
+    logs_dir = Path(args.logs_dir)
 
     print("=== aBSREL Results Summary ===\n")
 
@@ -73,30 +407,29 @@ def main():
     gene_annotations = load_gene_annotations()
     print(f"Loaded annotations for {len(gene_annotations)} genes\n")
 
+    if args.watch:
+        watch(args, gene_annotations)
+        return
+
     # Find all log files
-    log_files = list(logs_dir.glob('*.log'))
+    log_files = sorted(logs_dir.glob('*.log'))
     print(f"Total log files found: {len(log_files)}")
 
     if len(log_files) == 0:
         print("No log files found. Analysis may still be running.")
         return
 
-    # Parse all logs
+    # Parse all logs; only finished runs enter the correction, as in --watch mode
     print("Parsing results...\n")
-    all_results = []
-    selected_genes = []
-
-    for log_file in log_files:
-        result = parse_log_file(log_file)
-        all_results.append(result)
-
-        if result['significant']:
-            # Get gene annotation
-            symbol, description = get_gene_info(result['gene'], gene_annotations)
-
-            result['symbol'] = symbol
-            result['description'] = description
-            selected_genes.append(result)
+    results_dir = Path(args.results_dir) if args.results_dir else default_results_dir(logs_dir)
+    seen = {}
+    poll_logs(seen, logs_dir, results_dir, args.workers, args.stale_hours * 3600)
+    all_results = [result for _, state, result in seen.values() if state == 'done']
+    n_running = sum(1 for _, state, _ in seen.values() if state == 'running')
+    n_failed = len(seen) - len(all_results) - n_running
+    if n_running or n_failed:
+        print(f"Not finished (left out of the correction): {n_running} running, {n_failed} failed\n")
+    selected_genes = select_genes(all_results, gene_annotations)
 
     # Summary statistics
     total_analyzed = len(all_results)
@@ -104,12 +437,10 @@ def main():
     percent_selected = (total_selected / total_analyzed * 100) if total_analyzed > 0 else 0
 
     print(f"Total genes analyzed: {total_analyzed}")
-    print(f"Genes under positive selection: {total_selected} ({percent_selected:.1f}%)")
+    print(f"Genes under positive selection (BH q <= {FDR_THRESHOLD}): "
+          f"{total_selected} ({percent_selected:.1f}%)")
     print()
 
-    # Sort by omega value (descending)
-    selected_genes.sort(key=lambda x: float(x['omega'].replace('>', '')) if x['omega'] and x['omega'].replace('>', '').replace('.', '').isdigit() else 0, reverse=True)
-
     # Print selected genes
     if selected_genes:
         print("=" * 100)
@@ -126,20 +457,15 @@ def main():
             print(f"{gene_id:<20} {symbol:<15} {omega:<15} {sites:<10} {desc:<40}")
 
     # Save detailed results to file
-    output_file = 'results_summary.tsv'
-    with open(output_file, 'w') as f:
-        f.write("Gene_ID\tGene_Symbol\tOmega\tSites\tP_value\tDescription\n")
-        for gene in selected_genes:
-            f.write(f"{gene['gene']}\t")
-            f.write(f"{gene['symbol'] or 'Unknown'}\t")
-            f.write(f"{gene['omega'] or 'NA'}\t")
-            f.write(f"{gene['sites'] or 'NA'}\t")
-            f.write(f"{gene['pvalue'] or 'NA'}\t")
-            f.write(f"{gene['description'] or 'No description'}\n")
+    output_file = args.output
+    write_summary(selected_genes, output_file)
 
     print()
     print(f"Detailed results saved to: {output_file}")
 
+    write_branches(all_results, args.branches_output)
+    print(f"Branch-level results saved to: {args.branches_output}")
+
     # Functional category analysis
     print("\n=== Functional Categories (Top Keywords) ===")
     keywords = defaultdict(int)
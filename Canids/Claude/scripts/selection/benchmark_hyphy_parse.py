@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+benchmark_hyphy_parse.py
+Compare the original serial json.load loop of parse_hyphy_results.py with
+the orjson decoder and the process-pool parse mode, on a synthetic
+directory of HyPhy JSON outputs (or an existing results directory)
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+import parse_hyphy_results as phr
+
+SPECIES = ['Canis_familiaris', 'Canis_lupus', 'Canis_dingo', 'Vulpes_vulpes',
+           'Lycaon_pictus', 'Cuon_alpinus', 'Chrysocyon_brachyurus', 'Otocyon_megalotis']
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Benchmark serial vs parallel HyPhy JSON parsing'
+    )
+    parser.add_argument(
+        '--input',
+        type=str,
+        default=None,
+        help='Existing directory of HyPhy JSON files (default: generate a synthetic one)'
+    )
+    parser.add_argument(
+        '--test',
+        type=str,
+        choices=list(phr.PARSERS),
+        default='absrel',
+        help='Parser to benchmark (default: absrel)'
+    )
+    parser.add_argument(
+        '--n_files',
+        type=int,
+        default=2000,
+        help='Number of synthetic JSON files (default: 2000)'
+    )
+    parser.add_argument(
+        '--n_sites',
+        type=int,
+        default=500,
+        help='Codon sites per synthetic file, sets the file size (default: 500)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=min(8, os.cpu_count() or 1),
+        help='Workers for the parallel runs (default: min(8, CPUs))'
+    )
+    return parser.parse_args()
+
+def test_results(test, n_tested, rng):
+    """'test results' section: aBSREL reports no gene-level p-value, only counts"""
+    if test == 'absrel':
+        return {'P-value threshold': 0.05,
+                'positive test results': rng.randint(0, n_tested),
+                'tested': n_tested}
+    return {
+        'p-value': rng.random(),
+        'LRT': rng.random() * 10,
+        'relaxation or intensification parameter': rng.random() * 2
+    }
+
+def synthetic_result(n_sites, rng, test='absrel'):
+    """One HyPhy-sized result in the layout parse_hyphy_results.py reads"""
+    branches = SPECIES + [f"Node{i}" for i in range(1, len(SPECIES) - 1)]
+    return {
+        'branch attributes': {
+            branch: {
+                'Corrected P-value': rng.random(),
+                'original name': {'P-value': rng.random()},
+                'Rate classes': {'omega': rng.random() * 3}
+            }
+            for branch in branches
+        },
+        'tested': {branch: int(branch in SPECIES) for branch in branches},
+        'test results': test_results(test, len(SPECIES), rng),
+        'fits': {
+            'Unconstrained model': {
+                'Rate Distributions': {'background': rng.random(), 'test': rng.random() * 2},
+                'Log Likelihood': -rng.random() * 1e4
+            }
+        },
+        'MLE': {
+            'headers': [['alpha', ''], ['beta', ''], ['p-value', '']],
+            'content': {
+                str(site): {'alpha': rng.random(), 'beta': rng.random() * 2,
+                            'p-value': rng.random()}
+                for site in range(n_sites)
+            }
+        },
+        # Stand-in for the optimizer traces and per-site likelihoods that
+        # make real outputs large
+        'trace': [rng.random() for _ in range(n_sites * 20)]
+    }
+
+def write_synthetic(directory, n_files, n_sites, test='absrel'):
+    rng = random.Random(0)
+    for i in range(n_files):
+        with open(directory / f"Gene_{i:05d}.json", 'w') as handle:
+            json.dump(synthetic_result(n_sites, rng, test), handle)
+
+def legacy_parse(json_files, test):
+    """The original main loop: json.load per file, one list, one DataFrame"""
+    phr.set_json_options('json', streaming=False)
+    results = [phr.PARSERS[test](json_file) for json_file in json_files]
+    for result in results:
+        if result is not None:
+            # Per-site results go to the long table, not the summary
+            result.pop('site_results', None)
+    return pd.DataFrame([result for result in results if result is not None])
+
+def timed(label, run, n_files, baseline=None):
+    start = time.perf_counter()
+    df = run()
+    elapsed = time.perf_counter() - start
+    speedup = f"{baseline / elapsed:5.1f}x" if baseline else "     "
+    print(f"{label:<28} {elapsed:8.2f}s   {n_files / elapsed:8,.0f} files/s   {speedup}")
+    return df, elapsed
+
+def main():
+    args = parse_arguments()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.input:
+            input_dir = Path(args.input)
+        else:
+            input_dir = Path(tmp_dir)
+            print(f"Writing {args.n_files} synthetic {args.test} results ({args.n_sites} sites)...")
+            write_synthetic(input_dir, args.n_files, args.n_sites, args.test)
+
+        json_files = sorted(input_dir.glob('*.json'))
+        total_mb = sum(f.stat().st_size for f in json_files) / 1e6
+        print(f"{len(json_files)} files, {total_mb:,.0f} MB")
+        print()
+
+        baseline_df, baseline = timed("serial json (original)",
+                                      lambda: legacy_parse(json_files, args.test), len(json_files))
+
+        runs = [('json', 1)]
+        if phr.orjson is not None:
+            runs.append(('orjson', 1))
+        if args.workers > 1:
+            runs += [(decoder, args.workers) for decoder, _ in runs]
+
+        for decoder, workers in runs:
+            label = f"{'serial' if workers == 1 else f'{workers} workers'} {decoder}"
+            df, _ = timed(label, lambda: phr.collect_results(json_files, args.test, workers,
+                                                             decoder, progress=False)[0],
+                          len(json_files), baseline)
+            pd.testing.assert_frame_equal(df, baseline_df)
+
+        if phr.orjson is None:
+            print("\norjson is not installed; only the json module was benchmarked")
+
+if __name__ == '__main__':
+    main()
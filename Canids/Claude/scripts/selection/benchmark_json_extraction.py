@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+benchmark_json_extraction.py
+Peak RSS and time of whole-file JSON decoding versus section extraction
+(json_sections.py) for the MEME/FEL parsers, on the largest files of a
+results directory or on synthetic outputs in HyPhy's site-level layout
+
+Each mode runs in a fresh process so its peak RSS is measured on its own;
+'baseline' only imports the parser, to show the interpreter's share.
+"""
+
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import parse_hyphy_results as phr
+
+MODES = {
+    'baseline': None,
+    'full json': ('json', False),
+    'full orjson': ('orjson', False),
+    'sections json': ('json', True),
+    'sections orjson': ('orjson', True)
+}
+
+BRANCHES = ['Canis_familiaris', 'Canis_lupus', 'Canis_dingo', 'Vulpes_vulpes',
+            'Lycaon_pictus', 'Cuon_alpinus', 'Node1', 'Node2', 'Node3', 'Node4']
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Benchmark peak RSS and time of HyPhy JSON section extraction'
+    )
+    parser.add_argument(
+        '--input',
+        type=str,
+        default=None,
+        help='Directory of MEME/FEL JSON outputs (default: generate synthetic ones)'
+    )
+    parser.add_argument(
+        '--test',
+        choices=['meme', 'fel'],
+        default='meme',
+        help='Parser to benchmark (default: meme)'
+    )
+    parser.add_argument(
+        '--n_largest',
+        type=int,
+        default=20,
+        help='Number of largest files from --input to parse (default: 20)'
+    )
+    parser.add_argument(
+        '--n_files',
+        type=int,
+        default=10,
+        help='Number of synthetic files (default: 10)'
+    )
+    parser.add_argument(
+        '--n_sites',
+        type=int,
+        default=5000,
+        help='Codon sites per synthetic file (default: 5000)'
+    )
+    parser.add_argument(
+        '--run',
+        choices=list(MODES),
+        default=None,
+        help=argparse.SUPPRESS
+    )
+    parser.add_argument(
+        '--file_list',
+        type=str,
+        default=None,
+        help=argparse.SUPPRESS
+    )
+    return parser.parse_args()
+
+def synthetic_site_result(n_sites, rng):
+    """A MEME-like output: MLE rows plus the fit and likelihood sections the parser skips"""
+    headers = [['alpha', ''], ['beta-', ''], ['p-', ''], ['beta+', ''], ['p+', ''], ['LRT', ''],
+               ['p-value', ''], ['# branches under selection', ''], ['Total branch length', ''],
+               ['MEME LogL', ''], ['FEL LogL', '']]
+    return {
+        'analysis': {'info': 'MEME', 'version': '3.0'},
+        'branch attributes': {
+            '0': {branch: {'original name': branch, 'Nucleotide GTR': rng.random()}
+                  for branch in BRANCHES}
+        },
+        'fits': {
+            model: {'Log Likelihood': -rng.random() * 1e5,
+                    'Rate Distributions': {str(i): rng.random() for i in range(50)}}
+            for model in ('Nucleotide GTR', 'Global MG94xREV')
+        },
+        'MLE': {
+            'headers': headers,
+            'content': {'0': [[rng.random() for _ in headers] for _ in range(n_sites)]}
+        },
+        # Per-site, per-branch likelihood profiles: the bulk of real outputs
+        'Site Log Likelihood': {
+            'tested': {branch: [rng.random() for _ in range(n_sites)] for branch in BRANCHES},
+            'unconstrained': [[rng.random() for _ in range(n_sites)] for _ in range(4)]
+        },
+        'tested': {'0': {branch: 'test' for branch in BRANCHES}}
+    }
+
+def run_mode(mode, test, file_list):
+    """Child process: parse the listed files in one mode, print time and peak RSS"""
+    with open(file_list) as handle:
+        json_files = [Path(line.strip()) for line in handle if line.strip()]
+
+    start = time.perf_counter()
+    if MODES[mode] is not None:
+        decoder, streaming = MODES[mode]
+        phr.set_json_options(decoder, streaming)
+        for json_file in json_files:
+            phr.PARSERS[test](json_file)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{elapsed}\t{peak_kb}")
+
+def main():
+    args = parse_arguments()
+    if args.run:
+        run_mode(args.run, args.test, args.file_list)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        if args.input:
+            json_files = sorted(Path(args.input).glob('*.json'),
+                                key=lambda f: f.stat().st_size, reverse=True)[:args.n_largest]
+        else:
+            print(f"Writing {args.n_files} synthetic {args.test} outputs ({args.n_sites} sites)...")
+            rng = random.Random(0)
+            json_files = []
+            for i in range(args.n_files):
+                json_file = tmp_dir / f"Gene_{i:05d}.json"
+                with open(json_file, 'w') as handle:
+                    json.dump(synthetic_site_result(args.n_sites, rng), handle)
+                json_files.append(json_file)
+
+        file_list = tmp_dir / 'files.txt'
+        file_list.write_text('\n'.join(map(str, json_files)) + '\n')
+        largest_mb = max(f.stat().st_size for f in json_files) / 1e6
+        total_mb = sum(f.stat().st_size for f in json_files) / 1e6
+        print(f"{len(json_files)} files, {total_mb:,.1f} MB (largest {largest_mb:,.1f} MB)")
+        print()
+
+        print(f"{'mode':<18} {'time':>8} {'MB/s':>8} {'peak RSS':>10} {'above baseline':>15}")
+        baseline_kb = None
+        for mode, options in MODES.items():
+            if options is not None and options[0] == 'orjson' and phr.orjson is None:
+                continue
+            output = subprocess.run(
+                [sys.executable, __file__, '--run', mode, '--test', args.test,
+                 '--file_list', str(file_list)],
+                check=True, capture_output=True, text=True
+            ).stdout.split()
+            elapsed, peak_kb = float(output[-2]), int(output[-1])
+            if baseline_kb is None:
+                baseline_kb = peak_kb
+                print(f"{mode:<18} {'':>8} {'':>8} {peak_kb / 1024:>8.1f}MB")
+                continue
+            print(f"{mode:<18} {elapsed:>7.2f}s {total_mb / elapsed:>8,.0f} "
+                  f"{peak_kb / 1024:>8.1f}MB {(peak_kb - baseline_kb) / 1024:>13.1f}MB")
+
+        if phr.orjson is None:
+            print("\norjson is not installed; only the json module was benchmarked")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+build_selection_matrix.py
+Parse every HyPhy test in one pass into a gene x test selection matrix
+
+Walks the test directories of a results directory (absrel, busted, relax,
+meme, fel, and per-theme directories such as busted_sociality or packed
+bundles of them), parses all of them concurrently on one process pool and
+writes one row per gene with typed per-test columns: p-value, LRT, omega or
+k, q-values and FDR counts, site/branch counts, and a <test>_available flag that is False (with null
+values) where a gene has no result for that test.
+
+The per-test summary CSVs, branch/site Parquet tables and parse caches of
+parse_hyphy_results.py are written next to the matrix, so one invocation
+replaces the separate per-test passes.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+import pandas as pd
+import sys
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'alignment'))
+from ortholog_bundle import is_bundle
+from parse_cache import CACHE_SUFFIX, ParseCache
+from multiple_testing import METHODS
+from parse_hyphy_results import (JSON_DECODERS, PARSERS, add_qvalues, collect_results,
+                                 detail_writer, find_json_files, orjson, parser_pool)
+
+# Summary column -> (matrix column, dtype) per test; gene-level LRT and omega
+# of aBSREL come from its most significant branch
+MATRIX_FIELDS = {
+    'absrel': {
+        'pvalue': ('pvalue', 'Float64'),
+        'qvalue': ('qvalue', 'Float64'),
+        'LRT': ('LRT', 'Float64'),
+        'omega': ('omega', 'Float64'),
+        'n_branches_tested': ('n_branches', 'Int32'),
+        'n_significant': ('n_significant', 'Int32'),
+        'n_significant_fdr': ('n_significant_fdr', 'Int32')
+    },
+    'busted': {
+        'pvalue': ('pvalue', 'Float64'),
+        'qvalue': ('qvalue', 'Float64'),
+        'LRT': ('LRT', 'Float64'),
+        'test_omega': ('omega', 'Float64'),
+        'background_omega': ('background_omega', 'Float64')
+    },
+    'relax': {
+        'pvalue': ('pvalue', 'Float64'),
+        'qvalue': ('qvalue', 'Float64'),
+        'LRT': ('LRT', 'Float64'),
+        'k_value': ('k', 'Float64')
+    },
+    'meme': {
+        'n_sites_tested': ('n_sites', 'Int32'),
+        'n_significant_sites': ('n_significant', 'Int32'),
+        'n_significant_sites_fdr': ('n_significant_fdr', 'Int32')
+    },
+    'fel': {
+        'n_sites': ('n_sites', 'Int32'),
+        'positive_selection_sites': ('n_positive', 'Int32'),
+        'negative_selection_sites': ('n_negative', 'Int32'),
+        'n_significant_sites_fdr': ('n_significant_fdr', 'Int32')
+    }
+}
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Parse all HyPhy results into one gene x test selection matrix'
+    )
+    parser.add_argument(
+        '--input',
+        type=str,
+        default='hyphy_results',
+        help='Results directory with one subdirectory (or bundle) per test, e.g. absrel/, '
+             'busted_sociality/ (default: hyphy_results)'
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='selection_tables/selection_matrix.parquet',
+        help='Output matrix: Parquet, or CSV if the name ends in .csv '
+             '(default: selection_tables/selection_matrix.parquet)'
+    )
+    parser.add_argument(
+        '--tests',
+        nargs='+',
+        choices=list(PARSERS),
+        default=list(PARSERS),
+        help='Tests to include (default: all found)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of processes parsing JSON files in parallel, shared by all tests (default: 1)'
+    )
+    parser.add_argument(
+        '--json_decoder',
+        choices=JSON_DECODERS,
+        default=JSON_DECODERS[0],
+        help='JSON decoder (default: orjson if installed, else the json module)'
+    )
+    parser.add_argument(
+        '--full_json',
+        action='store_true',
+        help='Decode whole JSON files instead of only the sections each test reads'
+    )
+    parser.add_argument(
+        '--correction',
+        choices=METHODS,
+        default='bh',
+        help='Multiple-testing correction for q-values (default: bh)'
+    )
+    parser.add_argument(
+        '--fdr_threshold',
+        type=float,
+        default=0.1,
+        help='Q-value threshold for significance (default: 0.1)'
+    )
+    parser.add_argument(
+        '--no_cache',
+        action='store_true',
+        help='Parse every file and do not read or write the parse caches'
+    )
+    return parser.parse_args()
+
+def test_directories(results_dir, tests):
+    """
+    (name, test, path) for each subdirectory or bundle of results_dir named
+    after a test, alone or with a theme suffix (busted_sociality -> busted)
+    """
+    found = []
+    for path in sorted(results_dir.iterdir()):
+        if not (path.is_dir() or is_bundle(path)):
+            continue
+        name = path.name.split('.')[0]
+        test = name.split('_')[0]
+        if test in tests:
+            found.append((name, test, path))
+    return found
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def weighted_omega(classes):
+    """
+    Largest omega with non-zero weight from [[omega, weight], ...] or
+    {class: {'omega': ..., 'proportion': ...}}; a number is returned as is
+    """
+    if isinstance(classes, dict):
+        classes = [(c.get('omega'), c.get('proportion', 1)) for c in classes.values()
+                   if isinstance(c, dict)]
+    if isinstance(classes, list):
+        weighted = [_number(omega) for omega, weight in classes if (_number(weight) or 0) > 0]
+        weighted = [omega for omega in weighted if omega is not None]
+        return max(weighted) if weighted else None
+    return _number(classes)
+
+def strongest_branch(branch_results):
+    """The tested aBSREL branch with the smallest corrected p-value"""
+    return min(branch_results, default={},
+               key=lambda result: _number(result.get('pvalue')) or 1.0)
+
+def matrix_columns(name, test, df):
+    """The test's summary rows as typed matrix columns, prefixed with name and indexed by gene"""
+    df = df.drop_duplicates('gene').set_index('gene')
+    if test == 'absrel':
+        strongest = [strongest_branch(branches) for branches in df['branch_results']]
+        df['LRT'] = [branch.get('LRT') for branch in strongest]
+        df['omega'] = [branch.get('omega') for branch in strongest]
+    elif test == 'busted':
+        for column in ('test_omega', 'background_omega'):
+            df[column] = [weighted_omega(value) for value in df[column]]
+
+    columns = pd.DataFrame(index=df.index)
+    columns[f"{name}_available"] = True
+    for source, (column, dtype) in MATRIX_FIELDS[test].items():
+        values = df[source] if source in df else pd.Series(None, index=df.index, dtype=object)
+        # HyPhy writes 'NA' (or a structure) where a value is missing
+        values = values.map(_number).astype(object)
+        columns[f"{name}_{column}"] = pd.to_numeric(values, errors='coerce').astype(dtype)
+    return columns
+
+def build_matrix(parts):
+    """Outer-join the per-test columns on gene; missing tests are unavailable"""
+    matrix = pd.concat(parts, axis=1, join='outer').sort_index()
+    for column in matrix.columns:
+        if column.endswith('_available'):
+            matrix[column] = matrix[column].fillna(False).astype('boolean')
+    matrix.index.name = 'gene'
+    return matrix.reset_index().astype({'gene': 'string'})
+
+def write_matrix(matrix, output):
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output.with_name(f"{output.name}.{os.getpid()}.tmp")
+    if output.suffix == '.csv':
+        matrix.to_csv(tmp_path, index=False)
+    else:
+        matrix.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, output)
+
+def parse_test(name, test, path, output_dir, args, pool):
+    """Parse one test directory; write its summary CSV and detail table, return its summary"""
+    json_files = find_json_files(path)
+    output = output_dir / f"{name}_results.csv"
+    cache = None
+    if not args.no_cache:
+        cache = ParseCache(str(output) + CACHE_SUFFIX, test)
+
+    detail_table = detail_writer(test, output)
+    df, failed = collect_results(json_files, test, args.workers, args.json_decoder,
+                                 progress=False, cache=cache, detail_table=detail_table,
+                                 streaming=not args.full_json, pool=pool,
+                                 correction=args.correction, fdr_threshold=args.fdr_threshold)
+    df = add_qvalues(df, test, args.correction, args.fdr_threshold)
+    if detail_table is not None:
+        detail_table.close()
+    if cache is not None:
+        cache.save()
+    # Written even without results (header only): every per-test CSV is a
+    # declared output of the selection_matrix Snakemake rule
+    if len(df.columns):
+        df.to_csv(output, index=False)
+    else:
+        pd.DataFrame(columns=['gene', *MATRIX_FIELDS[test]]).to_csv(output, index=False)
+    return json_files, df, failed, cache
+
+def main():
+    args = parse_arguments()
+
+    results_dir = Path(args.input)
+    output = Path(args.output)
+    if not results_dir.is_dir():
+        print(f"ERROR: Results directory not found: {results_dir}")
+        sys.exit(1)
+    if output.suffix != '.csv' and pyarrow is None:
+        print("ERROR: pyarrow is required for Parquet output (or give a .csv --output)")
+        sys.exit(1)
+
+    directories = test_directories(results_dir, args.tests)
+    if not directories:
+        print(f"ERROR: No test directories ({', '.join(args.tests)}) found in {results_dir}")
+        sys.exit(1)
+
+    print(f"Results directory: {results_dir}")
+    print(f"Tests: {', '.join(name for name, _, _ in directories)}")
+    print(f"JSON decoder: {args.json_decoder}" +
+          (" (install orjson for faster parsing)" if orjson is None else ""))
+    print(f"JSON sections: {'all' if args.full_json else 'per test'}")
+    print(f"Correction: {args.correction} (q <= {args.fdr_threshold})")
+    print(f"Workers: {args.workers}")
+    print()
+
+    output_dir = output.parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+
+    # One thread per test directory feeding one shared process pool, so the
+    # tests are parsed concurrently and the pool never idles between them
+    pool_context = (parser_pool(args.workers, args.json_decoder, not args.full_json)
+                    if args.workers > 1 else nullcontext())
+    with pool_context as pool, ThreadPoolExecutor(max_workers=len(directories)) as threads:
+        futures = [threads.submit(parse_test, name, test, path, output_dir, args, pool)
+                   for name, test, path in directories]
+
+        parts = []
+        for (name, test, _), future in zip(directories, futures):
+            json_files, df, failed, cache = future.result()
+            status = f"  {name}: {len(df)} genes parsed, {failed} failed"
+            if cache is not None:
+                status += f" ({cache.n_reused} cached, {cache.n_unchanged} unchanged)"
+            print(status)
+            if len(df):
+                parts.append(matrix_columns(name, test, df))
+
+    if not parts:
+        print("ERROR: No results parsed successfully")
+        sys.exit(1)
+
+    matrix = build_matrix(parts)
+    write_matrix(matrix, output)
+
+    print()
+    print("=== Summary ===")
+    print(f"Genes: {len(matrix)}")
+    print(f"Tests: {len(parts)}")
+    print(f"Time: {time.perf_counter() - start:.1f}s")
+    print(f"Output saved: {output}")
+
+    for column in matrix.columns:
+        if column.endswith('_pvalue'):
+            name = column[:-len('_pvalue')]
+            n_sig = int((matrix[column] < 0.05).sum())
+            n_fdr = int((matrix[f"{name}_qvalue"] <= args.fdr_threshold).sum())
+            n_tested = int(matrix[column].notna().sum())
+            print(f"  {name}: p < 0.05 in {n_sig}, q <= {args.fdr_threshold} in {n_fdr} "
+                  f"/ {n_tested} genes")
+
+if __name__ == '__main__':
+    main()
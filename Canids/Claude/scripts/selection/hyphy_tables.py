@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+hyphy_tables.py
+Long-format branch-level and site-level HyPhy result tables
+
+parse_hyphy_results.py keeps one summary row per gene in its CSV. The
+per-branch (aBSREL) and per-site (MEME, FEL) results behind those rows are
+streamed here into typed Parquet tables with one row per gene and branch or
+gene and site, so cross-gene queries are column filters, e.g.
+
+    sites = pd.read_parquet('selection_tables/meme_results.sites.parquet',
+                            filters=[('pvalue', '<', 0.05)])
+
+The gene column is dictionary-encoded (read back as a pandas categorical)
+and rows follow the input file order, so row-group statistics on gene
+allow reading single genes without a scan.
+"""
+
+import os
+from pathlib import Path
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+BRANCH_COLUMNS = {
+    'gene': 'category',
+    'branch': 'string',
+    'pvalue': 'Float64',
+    'uncorrected_pvalue': 'Float64',
+    'LRT': 'Float64',
+    'omega': 'Float64',
+    'rate_classes': 'Int32'
+}
+
+# MLE header name -> site table column, per site-level test
+SITE_FIELDS = {
+    'meme': {
+        'alpha': 'alpha',
+        'beta-': 'beta_minus',
+        'p-': 'p_minus',
+        'beta+': 'beta_plus',
+        'p+': 'p_plus',
+        'LRT': 'LRT',
+        'p-value': 'pvalue',
+        '# branches under selection': 'n_branches_selected',
+        'Total branch length': 'branch_length'
+    },
+    'fel': {
+        'alpha': 'alpha',
+        'beta': 'beta',
+        'alpha=beta': 'alpha_eq_beta',
+        'LRT': 'LRT',
+        'p-value': 'pvalue',
+        'Total branch length': 'branch_length'
+    }
+}
+
+def site_columns(test):
+    columns = {'gene': 'category', 'partition': 'Int32', 'site': 'Int32'}
+    columns.update({column: 'Float64' for column in SITE_FIELDS[test].values()})
+    # Within-gene adjusted p-value (parse_hyphy_results.adjust_sites)
+    columns['qvalue'] = 'Float64'
+    return columns
+
+def branch_values(branch_results):
+    """aBSREL branch_results (list of dicts) as column lists"""
+    return {column: [result.get(column) for result in branch_results]
+            for column in BRANCH_COLUMNS if column != 'gene'}
+
+class LongTableWriter:
+    """
+    Stream per-gene column lists to a typed Parquet file in row groups of
+    about batch_rows rows. The file is written under a temporary name and
+    moved into place on close. Without pyarrow nothing is written (a note is
+    printed).
+    """
+
+    def __init__(self, path, columns, batch_rows=200000):
+        self.path = Path(path)
+        self.columns = columns
+        self.batch_rows = batch_rows
+        self.n_rows = 0
+        self._buffer = {column: [] for column in columns}
+        self._pending = 0
+        self._writer = None
+        self._schema = None
+        self._tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        self.enabled = pa is not None
+        if not self.enabled:
+            print(f"  Note: pyarrow is not installed, {self.path.name} disabled")
+
+    def append(self, gene, values):
+        """Add one gene's rows, given as {column: list}; missing columns are null"""
+        if not self.enabled:
+            return
+        n = max((len(column) for column in values.values()), default=0)
+        if n == 0:
+            return
+        self._buffer['gene'].extend([gene] * n)
+        for column in self.columns:
+            if column != 'gene':
+                self._buffer[column].extend(values.get(column) or [None] * n)
+        self._pending += n
+        if self._pending >= self.batch_rows:
+            self._flush()
+
+    def _frame(self):
+        df = pd.DataFrame(self._buffer, columns=list(self.columns))
+        for column, dtype in self.columns.items():
+            if dtype in ('Float64', 'Int32'):
+                # HyPhy writes 'NA' or omits values; both become nulls
+                df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+            else:
+                df[column] = df[column].astype(dtype)
+        return df
+
+    def _table(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._schema is None:
+            # One dictionary index width for gene across all row groups
+            gene_field = pa.field('gene', pa.dictionary(pa.int32(), pa.string()))
+            self._schema = table.schema.set(table.schema.get_field_index('gene'), gene_field)
+        return table.cast(self._schema)
+
+    def _flush(self):
+        if not self._pending:
+            return
+        table = self._table(self._frame())
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = pq.ParquetWriter(self._tmp_path, self._schema)
+        self._writer.write_table(table)
+        self.n_rows += self._pending
+        self._buffer = {column: [] for column in self.columns}
+        self._pending = 0
+
+    def close(self):
+        if not self.enabled:
+            return
+        self._flush()
+        if self._writer is None:
+            # No rows: still write an empty table with the full schema
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(self._table(self._frame()), self._tmp_path)
+        else:
+            self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
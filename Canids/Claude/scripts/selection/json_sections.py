@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+json_sections.py
+Decode selected top-level members of a large JSON object
+
+HyPhy site-level outputs (MEME, FEL) are dominated by sections the parsers
+never read: model fits, optimizer traces, per-site likelihood profiles. This
+module walks the top-level object of a file (memory-mapped) or byte string
+and decodes only the members it is asked for. The extent of every member is
+found without building Python objects: NumPy locates the brackets and
+quotes in the raw bytes one chunk at a time, and the bracket depth outside
+of strings is a cumulative sum over those positions only. Scanning stops
+as soon as all requested members have been seen.
+"""
+
+import json
+import mmap
+import re
+import numpy as np
+
+SCAN_CHUNK = 1 << 22
+
+STRING_BODY = re.compile(rb'(?:[^"\\]|\\.)*"', re.S)
+SCALAR_END = re.compile(rb'[,}\]\s]')
+WHITESPACE = re.compile(rb'\s*')
+
+QUOTE, COLON, COMMA, BACKSLASH = ord('"'), ord(':'), ord(','), ord('\\')
+OPEN = frozenset(b'{[')
+CLOSE_OBJECT = ord('}')
+
+# Setting bit 0x20 folds '[' and ']' onto '{' and '}'
+FOLD_CASE = 0x20
+OPEN_BRACE, CLOSE_BRACE = ord('{'), ord('}')
+
+def _string_end(buffer, pos):
+    """End of the JSON string starting at pos (the opening quote)"""
+    match = STRING_BODY.match(buffer, pos + 1)
+    if match is None:
+        raise ValueError(f"Unterminated string at byte {pos}")
+    return match.end()
+
+def _unescaped(data, quotes):
+    """Drop quotes preceded by an odd number of backslashes"""
+    candidates = np.flatnonzero(data[quotes - 1] == BACKSLASH)
+    if len(candidates) == 0:
+        return quotes
+
+    escaped = np.zeros(len(quotes), dtype=bool)
+    for i in candidates:
+        run = 1
+        while data[quotes[i] - run - 1] == BACKSLASH:
+            run += 1
+        escaped[i] = run % 2 == 1
+    return quotes[~escaped]
+
+def _container_end(buffer, pos):
+    """End of the object or array starting at pos"""
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    depth = 0
+    in_string = 0
+
+    for start in range(pos, len(data), SCAN_CHUNK):
+        chunk = data[start:start + SCAN_CHUNK]
+        folded = chunk | FOLD_CASE
+        brackets = np.flatnonzero((folded == OPEN_BRACE) | (folded == CLOSE_BRACE))
+
+        # A bracket is inside a string if an odd number of quotes precede it
+        quotes = start + np.flatnonzero(chunk == QUOTE)
+        quotes = _unescaped(data, quotes[quotes > 0])
+        if len(quotes) or in_string:
+            preceding = np.searchsorted(quotes, start + brackets)
+            brackets = brackets[((preceding + in_string) & 1) == 0]
+
+        steps = np.where(folded[brackets] == OPEN_BRACE, 1, -1)
+        depths = depth + np.cumsum(steps)
+        closed = np.flatnonzero(depths == 0)
+        if len(closed):
+            return start + int(brackets[closed[0]]) + 1
+
+        if len(depths):
+            depth = int(depths[-1])
+        in_string = (in_string + len(quotes)) & 1
+
+    raise ValueError("Unbalanced brackets")
+
+def skip_value(buffer, pos):
+    """End of the JSON value starting at pos, without decoding it"""
+    first = buffer[pos]
+    if first == QUOTE:
+        return _string_end(buffer, pos)
+    if first in OPEN:
+        return _container_end(buffer, pos)
+
+    match = SCALAR_END.search(buffer, pos)
+    return match.start() if match else len(buffer)
+
+def extract_sections(buffer, names, decode=json.loads):
+    """
+    {name: decoded value} for the top-level members of the JSON object in
+    buffer (bytes or mmap) that are listed in names
+    """
+    wanted = set(names)
+    sections = {}
+    pos = WHITESPACE.match(buffer, 0).end()
+    if pos >= len(buffer) or buffer[pos] != ord('{'):
+        raise ValueError("Not a JSON object")
+    pos += 1
+
+    while wanted - sections.keys():
+        pos = WHITESPACE.match(buffer, pos).end()
+        if pos >= len(buffer) or buffer[pos] == CLOSE_OBJECT:
+            break
+
+        key_end = _string_end(buffer, pos)
+        key = json.loads(buffer[pos:key_end])
+        pos = WHITESPACE.match(buffer, key_end).end()
+        if buffer[pos] != COLON:
+            raise ValueError(f"Expected ':' at byte {pos}")
+        pos = WHITESPACE.match(buffer, pos + 1).end()
+
+        end = skip_value(buffer, pos)
+        if key in wanted:
+            sections[key] = decode(buffer[pos:end])
+
+        pos = WHITESPACE.match(buffer, end).end()
+        if pos < len(buffer) and buffer[pos] == COMMA:
+            pos += 1
+
+    return sections
+
+def read_sections(path, names, decode=json.loads):
+    """extract_sections() on a memory-mapped file"""
+    with open(path, 'rb') as handle, \
+            mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        return extract_sections(buffer, names, decode)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+multiple_testing.py
+Vectorized multiple-testing corrections for HyPhy p-values
+
+adjust() returns adjusted p-values for a whole array at once (all genes, all
+tested branches or all sites of a run), optionally within groups (e.g. the
+sites of each gene) in the same single pass:
+  - bh:     Benjamini-Hochberg step-up FDR
+  - by:     Benjamini-Yekutieli, FDR under arbitrary dependence
+  - holm:   Holm step-down family-wise error rate
+  - storey: Storey q-values, BH scaled by the estimated null proportion pi0
+Values match R's p.adjust() (and qvalue() for storey with a given pi0).
+NaN p-values are left out of the number of tests and stay NaN.
+
+hierarchical_fdr() is the two-level procedure for aBSREL: genes are selected
+by BH on their gene-level p-values, and the tested branches of selected genes
+are then tested at the level scaled by the fraction of genes selected
+(Benjamini & Bogomolov 2014).
+"""
+
+import numpy as np
+import pandas as pd
+
+METHODS = ['bh', 'by', 'holm', 'storey']
+
+# Storey's pi0: tuning grid of lambda
+PI0_LAMBDAS = np.arange(0.05, 0.951, 0.05)
+
+def _group_codes(groups, n):
+    """Integer code (0..n_groups-1) per value; one group if groups is None"""
+    if groups is None:
+        return np.zeros(n, dtype=np.int64)
+    return pd.factorize(np.asarray(groups))[0]
+
+def _sorted_within(pvalues, codes):
+    """
+    (order, codes, rank, n): the order that sorts p-values within groups,
+    and the group code, 1-based rank within the group and group size of
+    each sorted value
+    """
+    order = np.lexsort((pvalues, codes))
+    codes = codes[order]
+    counts = np.bincount(codes)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.arange(1, len(codes) + 1) - starts[codes]
+    return order, codes, rank.astype(np.float64), counts[codes].astype(np.float64)
+
+def _cumulative(values, codes, ufunc, reverse=False):
+    """Running minimum/maximum of values, restarted at every group"""
+    if reverse:
+        values = values[::-1]
+        codes = codes[::-1]
+    if codes[0] == codes[-1]:
+        result = ufunc.accumulate(values)
+    else:
+        grouped = pd.Series(values).groupby(codes, sort=False)
+        result = (grouped.cummin() if ufunc is np.minimum else grouped.cummax()).to_numpy()
+    return result[::-1] if reverse else result
+
+def storey_pi0(pvalues, groups=None, lambdas=PI0_LAMBDAS):
+    """
+    Proportion of true null hypotheses by Storey's bootstrap choice of lambda
+    (Storey, Taylor & Siegmund 2004); one value per group (in order of first
+    appearance) if groups are given. Resampled counts above lambda are
+    binomial, so the bootstrap mean squared error is computed exactly
+    instead of by resampling: deterministic, and independent of the other
+    groups in the call.
+    """
+    p = np.asarray(pvalues, dtype=np.float64)
+    valid = ~np.isnan(p)
+    codes = _group_codes(None if groups is None else np.asarray(groups)[valid], valid.sum())
+    p = p[valid]
+    if len(p) == 0:
+        return 1.0 if groups is None else np.ones(0)
+
+    # Number of p-values above each lambda, per group
+    n_bins = len(lambdas) + 1
+    n_groups = codes.max() + 1
+    bins = np.searchsorted(lambdas, p, side='left')
+    counts = np.bincount(codes * n_bins + bins, minlength=n_groups * n_bins).reshape(n_groups, n_bins)
+    m = counts.sum(axis=1)[:, None]
+    above = np.cumsum(counts[:, :0:-1], axis=1)[:, ::-1] / m
+    pi0 = above / (1 - lambdas)
+
+    # Bootstrap MSE against the 10% quantile of the estimates (as in qvalue):
+    # variance plus squared bias
+    reference = np.quantile(pi0, 0.1, axis=1, keepdims=True)
+    mse = above * (1 - above) / (m * (1 - lambdas) ** 2) + (pi0 - reference) ** 2
+
+    # A lambda with no p-values above it estimates pi0 = 0, which would make
+    # every q-value 0 (qvalue rejects pi0 <= 0); groups left without any
+    # usable lambda, e.g. small ones with all p-values below 0.05, get pi0 = 1
+    mse = np.where(above > 0, mse, np.inf)
+    best = pi0[np.arange(n_groups), np.argmin(mse, axis=1)]
+    best = np.where(np.isinf(mse).all(axis=1), 1.0, np.minimum(best, 1.0))
+    return float(best[0]) if groups is None else best
+
+def adjust(pvalues, method='bh', groups=None, pi0=None):
+    """
+    Adjusted p-values (same shape and order as pvalues) for one of METHODS.
+    With groups (one label per p-value) each group is corrected on its own.
+    For storey, pi0 defaults to storey_pi0() of the p-values (of each group).
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown correction method: {method}")
+
+    p = np.asarray(pvalues, dtype=np.float64)
+    adjusted = np.full(p.shape, np.nan)
+    valid = ~np.isnan(p)
+    if not valid.any():
+        return adjusted
+
+    values = p[valid]
+    codes = _group_codes(None if groups is None else np.asarray(groups)[valid], len(values))
+    order, sorted_codes, rank, n = _sorted_within(values, codes)
+    ranked = values[order]
+
+    if method == 'holm':
+        ranked = _cumulative(ranked * (n - rank + 1), sorted_codes, np.maximum)
+    else:
+        ranked = ranked * n / rank
+        if method == 'by':
+            # Harmonic number of each group's size
+            harmonic = np.cumsum(1.0 / np.arange(1, n.max() + 1))
+            ranked = ranked * harmonic[n.astype(np.int64) - 1]
+        elif method == 'storey':
+            if pi0 is None:
+                pi0 = np.atleast_1d(storey_pi0(values, codes))[sorted_codes]
+            ranked = ranked * pi0
+        ranked = _cumulative(ranked, sorted_codes, np.minimum, reverse=True)
+
+    result = np.empty(len(values))
+    result[order] = np.minimum(ranked, 1.0)
+    adjusted[valid] = result
+    return adjusted
+
+def hierarchical_fdr(gene_pvalues, branch_pvalues, branch_genes, alpha, method='bh'):
+    """
+    Two-level FDR for per-gene tests of several branches. Returns
+    (gene_qvalues, gene_selected, branch_significant): genes are selected
+    where the adjusted gene p-value is <= alpha, and a branch (branch_genes
+    holds the index of its gene) is significant where its gene is selected
+    and its p-value, already corrected within the gene, is <= alpha * R / m
+    for R selected genes out of m.
+    """
+    gene_qvalues = adjust(gene_pvalues, method)
+    gene_selected = gene_qvalues <= alpha
+    n_tested = np.count_nonzero(~np.isnan(gene_qvalues))
+    level = alpha * gene_selected.sum() / n_tested if n_tested else 0.0
+
+    branch_pvalues = np.asarray(branch_pvalues, dtype=np.float64)
+    branch_genes = np.asarray(branch_genes, dtype=np.int64)
+    branch_significant = gene_selected[branch_genes] & (branch_pvalues <= level)
+    return gene_qvalues, gene_selected, branch_significant
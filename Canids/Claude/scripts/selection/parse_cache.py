@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+parse_cache.py
+Incremental cache of parsed HyPhy results
+
+One entry per input file (or bundle member): its path, size, mtime and
+SHA-1 content hash, and the row the parser returned for it. On a rerun:
+  - files whose size and mtime match their entry are not read at all
+  - files whose mtime changed are read and hashed, but only decoded if the
+    hash differs (e.g. a results directory that was copied or touched)
+  - new files are parsed
+so re-summarizing while HyPhy is still producing results only decodes the
+new outputs. Entries for files that are gone are dropped on save. The cache
+is tied to one test type and to CACHE_VERSION, which is bumped whenever the
+parsers change the rows they return.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from ortholog_bundle import BundleMember
+
+CACHE_VERSION = 2
+CACHE_SUFFIX = '.parse_cache.tsv'
+
+def content_digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+def file_identity(json_file):
+    """(key, size, mtime_ns) of a file or bundle member"""
+    if isinstance(json_file, BundleMember):
+        bundle_path = json_file.reader.bundle_path.resolve()
+        return (f"{bundle_path}:{json_file.name}",
+                json_file.reader.length(json_file.gene, json_file.member),
+                bundle_path.stat().st_mtime_ns)
+    stat = json_file.stat()
+    return str(json_file.resolve()), stat.st_size, stat.st_mtime_ns
+
+class ParseCache:
+    """Parsed rows by file identity, loaded from and saved to one TSV file"""
+
+    def __init__(self, path, test):
+        self.path = Path(path)
+        self.test = test
+        self.previous = {}
+        self.current = {}
+        self.n_reused = 0
+        self.n_unchanged = 0
+        self.n_parsed = 0
+
+        if self.path.exists():
+            with open(self.path) as handle:
+                header = next(handle, '').rstrip('\n').split('\t')
+                if header == ['#parse_cache', str(CACHE_VERSION), test]:
+                    for line in handle:
+                        key, size, mtime_ns, digest, row = line.rstrip('\n').split('\t')
+                        self.previous[key] = (int(size), int(mtime_ns), digest, row)
+
+    def lookup(self, key, size, mtime_ns):
+        """
+        (True, None) if the entry for key has this size and mtime (its row is
+        then available from row()), else (False, digest) with the digest to
+        check the contents against (None if the file is new or its size
+        changed)
+        """
+        entry = self.previous.get(key)
+        if entry is None or entry[0] != size:
+            return False, None
+        if entry[1] == mtime_ns:
+            self.current[key] = entry
+            self.n_reused += 1
+            return True, None
+        return False, entry[2]
+
+    def row(self, key):
+        """Cached row of a file that lookup() found unchanged"""
+        return json.loads(self.current[key][3])
+
+    def reuse(self, key, size, mtime_ns):
+        """Keep the row of a file whose contents matched its digest"""
+        _, _, digest, row = self.previous[key]
+        self.current[key] = (size, mtime_ns, digest, row)
+        self.n_unchanged += 1
+        return json.loads(row)
+
+    def store(self, key, size, mtime_ns, digest, row):
+        self.current[key] = (size, mtime_ns, digest, json.dumps(row))
+        self.n_parsed += 1
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as handle:
+            handle.write(f"#parse_cache\t{CACHE_VERSION}\t{self.test}\n")
+            for key in sorted(self.current):
+                size, mtime_ns, digest, row = self.current[key]
+                handle.write(f"{key}\t{size}\t{mtime_ns}\t{digest}\t{row}\n")
+        os.replace(tmp_path, self.path)
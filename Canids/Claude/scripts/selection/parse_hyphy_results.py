@@ -2,14 +2,53 @@
 """
 parse_hyphy_results.py
 Parse HyPhy JSON output from aBSREL, BUSTED, RELAX, etc.
+
+Files are decoded with orjson when it is installed (several times faster
+than the json module on large HyPhy outputs) and can be parsed on a process
+pool with --workers. Only the top-level sections a test reads (SECTIONS) are
+decoded; fits, traces and other large sections are skipped unparsed (see
+json_sections.py). Results are merged into the output table in chunks.
+
+Multiple-testing corrections (multiple_testing.py) are applied as results
+are written: gene-level q-values across all genes (hierarchically down to
+the tested branches for aBSREL), and per-site q-values within each gene for
+MEME and FEL, computed for batches of genes at once.
 """
 
 import argparse
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import sys
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'alignment'))
+from ortholog_bundle import BundleMember, BundleReader, LoadedMember, is_bundle
+from hyphy_tables import (BRANCH_COLUMNS, SITE_FIELDS, LongTableWriter,
+                          branch_values, site_columns)
+from json_sections import extract_sections, read_sections
+from multiple_testing import METHODS, adjust, hierarchical_fdr
+from parse_cache import CACHE_SUFFIX, ParseCache, content_digest, file_identity
+
+JSON_DECODERS = ['orjson', 'json'] if orjson is not None else ['json']
+MERGE_CHUNK = 1000
+
+# Top-level JSON sections each parser reads
+SECTIONS = {
+    'absrel': ('branch attributes', 'tested', 'test results'),
+    'busted': ('test results', 'fits'),
+    'relax': ('test results',),
+    'meme': ('MLE',),
+    'fel': ('MLE',)
+}
+
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description='Parse HyPhy JSON results'
@@ -18,7 +57,7 @@ def parse_arguments():
         '--input',
         type=str,
         required=True,
-        help='Directory containing HyPhy JSON output files'
+        help='Directory containing HyPhy JSON output files, or a packed bundle of them'
     )
     parser.add_argument(
         '--output',
@@ -33,34 +72,153 @@ def parse_arguments():
         required=True,
         help='Type of HyPhy test'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of processes parsing JSON files in parallel (default: 1)'
+    )
+    parser.add_argument(
+        '--json_decoder',
+        choices=JSON_DECODERS,
+        default=JSON_DECODERS[0],
+        help='JSON decoder (default: orjson if installed, else the json module)'
+    )
+    parser.add_argument(
+        '--full_json',
+        action='store_true',
+        help='Decode whole JSON files instead of only the sections the test reads'
+    )
+    parser.add_argument(
+        '--cache',
+        type=str,
+        default=None,
+        help='Parse cache: only files that are new or changed since the last run are '
+             f'decoded (default: <output>{CACHE_SUFFIX})'
+    )
+    parser.add_argument(
+        '--no_cache',
+        action='store_true',
+        help='Parse every file and do not read or write the parse cache'
+    )
+    parser.add_argument(
+        '--correction',
+        choices=METHODS,
+        default='bh',
+        help='Multiple-testing correction for q-values: Benjamini-Hochberg, Benjamini-Yekutieli, '
+             'Holm or Storey q-values (default: bh)'
+    )
+    parser.add_argument(
+        '--fdr_threshold',
+        type=float,
+        default=0.1,
+        help='Q-value threshold for significance (default: 0.1, as in analysis_config.yaml)'
+    )
+    parser.add_argument(
+        '--detail_table',
+        type=str,
+        default=None,
+        help='Long-format Parquet table of per-branch (absrel) or per-site (meme, fel) results '
+             '(default: <output stem>.branches.parquet or <output stem>.sites.parquet)'
+    )
     return parser.parse_args()
 
+_decoder = JSON_DECODERS[0]
+_streaming = True
+
+def set_json_options(decoder, streaming=True):
+    """
+    Select the decoder and whether load_json extracts sections or decodes
+    whole files (also the worker initializer)
+    """
+    global _decoder, _streaming
+    _decoder = decoder
+    _streaming = streaming
+
+def decode_json(data):
+    if _decoder == 'orjson':
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity literals are only accepted by the json module
+            pass
+    return json.loads(data)
+
+def load_json(json_file, sections=None):
+    """
+    Decode a HyPhy JSON file or bundle member; with sections, only those
+    top-level members (unless whole files were requested)
+    """
+    if sections is None or not _streaming:
+        return decode_json(json_file.read_bytes())
+    if isinstance(json_file, BundleMember):
+        return extract_sections(json_file.read_bytes(), sections, decode_json)
+    return read_sections(json_file, sections, decode_json)
+
+def _nested(values, key, field, default):
+    value = values.get(key)
+    return value.get(field, default) if isinstance(value, dict) else default
+
+def tested_branches(data):
+    """
+    (branch, attributes) for every tested branch. HyPhy nests both tables by
+    partition ({"0": {branch: ...}}, tested branches marked "test"); a flat
+    layout ({branch: ...}, tested as a positive count) is also accepted.
+    """
+    attributes = data.get('branch attributes', {})
+    tested = data.get('tested', {})
+
+    if tested and all(isinstance(flags, dict) for flags in tested.values()):
+        for partition, branches in attributes.items():
+            flags = tested.get(partition, {})
+            for branch_name, branch_data in branches.items():
+                if flags.get(branch_name) == 'test':
+                    yield branch_name, branch_data
+    else:
+        for branch_name, branch_data in attributes.items():
+            if tested.get(branch_name, 0) > 0:
+                yield branch_name, branch_data
+
+def branch_omega(branch_data):
+    """Largest omega class with non-zero weight (aBSREL 'Rate Distributions')"""
+    classes = branch_data.get('Rate Distributions')
+    if isinstance(classes, list) and classes:
+        weighted = [omega for omega, weight in classes if weight > 0]
+        return max(weighted) if weighted else 'NA'
+    return _nested(branch_data, 'Rate classes', 'omega', 'NA')
+
 def parse_absrel(json_file):
     """Parse aBSREL output"""
     try:
-        with open(json_file) as f:
-            data = json.load(f)
+        data = load_json(json_file, SECTIONS['absrel'])
 
         results = []
 
         # Branch-level results
-        if 'branch attributes' in data:
-            for branch_name, branch_data in data['branch attributes'].items():
-                if 'tested' in data and data['tested'].get(branch_name, 0) > 0:
-                    result = {
-                        'branch': branch_name,
-                        'pvalue': branch_data.get('Corrected P-value', 1.0),
-                        'uncorrected_pvalue': branch_data.get('original name', {}).get('P-value', 1.0),
-                        'omega': branch_data.get('Rate classes', {}).get('omega', 'NA')
-                    }
-                    results.append(result)
-
-        # Get test result
+        for branch_name, branch_data in tested_branches(data):
+            rate_classes = branch_data.get('Rate classes')
+            result = {
+                'branch': branch_name,
+                'pvalue': branch_data.get('Corrected P-value', 1.0),
+                'uncorrected_pvalue': branch_data.get(
+                    'Uncorrected P-value', _nested(branch_data, 'original name', 'P-value', 1.0)),
+                'omega': branch_omega(branch_data),
+                'LRT': branch_data.get('LRT', 'NA'),
+                'rate_classes': rate_classes if isinstance(rate_classes, int) else None
+            }
+            results.append(result)
+
+        # Gene-level p-value: aBSREL reports none ('test results' only holds
+        # the threshold and counts), so use the smallest Holm-corrected
+        # branch p-value, as parse_all_absrel_results.parse_log_file does
         test_results = data.get('test results', {})
-        overall_pvalue = test_results.get('p-value', 1.0)
+        overall_pvalue = test_results.get('p-value')
+        if overall_pvalue is None:
+            corrected = [r['pvalue'] for r in results if isinstance(r['pvalue'], (int, float))]
+            overall_pvalue = min(corrected) if corrected else 1.0
 
         return {
-            'gene': Path(json_file).stem,
+            'gene': json_file.stem,
             'pvalue': overall_pvalue,
             'n_branches_tested': len(results),
             'n_significant': sum(1 for r in results if r['pvalue'] < 0.05),
@@ -74,13 +232,12 @@ def parse_absrel(json_file):
 def parse_busted(json_file):
     """Parse BUSTED output"""
     try:
-        with open(json_file) as f:
-            data = json.load(f)
+        data = load_json(json_file, SECTIONS['busted'])
 
         test_results = data.get('test results', {})
 
         return {
-            'gene': Path(json_file).stem,
+            'gene': json_file.stem,
             'pvalue': test_results.get('p-value', 1.0),
             'LRT': test_results.get('LRT', 'NA'),
             'evidence_of_selection': test_results.get('p-value', 1.0) < 0.05,
@@ -95,8 +252,7 @@ def parse_busted(json_file):
 def parse_relax(json_file):
     """Parse RELAX output"""
     try:
-        with open(json_file) as f:
-            data = json.load(f)
+        data = load_json(json_file, SECTIONS['relax'])
 
         test_results = data.get('test results', {})
 
@@ -114,7 +270,7 @@ def parse_relax(json_file):
             interpretation = 'unknown'
 
         return {
-            'gene': Path(json_file).stem,
+            'gene': json_file.stem,
             'pvalue': test_results.get('p-value', 1.0),
             'LRT': test_results.get('LRT', 'NA'),
             'k_value': k_value,
@@ -126,27 +282,53 @@ def parse_relax(json_file):
         print(f"Error parsing {json_file}: {e}", file=sys.stderr)
         return None
 
+def mle_sites(data, test):
+    """
+    Per-site MLE table as {column: list} (columns from hyphy_tables.SITE_FIELDS
+    plus partition and site, numbered from 1 across partitions). HyPhy writes
+    one list of rows per partition in 'headers' order; a layout with one
+    {field: value} dict per site is also accepted.
+    """
+    mle = data.get('MLE', {})
+    names = [header[0] if isinstance(header, list) else header
+             for header in mle.get('headers', [])]
+    fields = SITE_FIELDS[test]
+    sites = {'partition': [], 'site': [], **{column: [] for column in fields.values()}}
+
+    def add(partition, columns, n_rows):
+        first = len(sites['site']) + 1
+        sites['partition'].extend([partition] * n_rows)
+        sites['site'].extend(range(first, first + n_rows))
+        for name, column in fields.items():
+            sites[column].extend(columns.get(name) or [None] * n_rows)
+
+    for key, rows in mle.get('content', {}).items():
+        if isinstance(rows, list):
+            # Transpose the partition's rows into header-named columns
+            add(int(key), dict(zip(names, zip(*rows))), len(rows))
+        elif isinstance(rows, dict):
+            add(0, {name: [value] for name, value in rows.items()}, 1)
+    return sites
+
+def _value(value, default):
+    return default if value is None else value
+
 def parse_meme(json_file):
     """Parse MEME output (site-level episodic selection)"""
     try:
-        with open(json_file) as f:
-            data = json.load(f)
+        data = load_json(json_file, SECTIONS['meme'])
 
         # Count sites under selection
-        sites = data.get('MLE', {}).get('content', {})
-        significant_sites = 0
-
-        for site_data in sites.values():
-            if isinstance(site_data, dict):
-                pvalue = site_data.get('p-value', 1.0)
-                if pvalue < 0.05:
-                    significant_sites += 1
+        sites = mle_sites(data, 'meme')
+        n_sites = len(sites['site'])
+        significant_sites = sum(1 for pvalue in sites['pvalue'] if _value(pvalue, 1.0) < 0.05)
 
         return {
-            'gene': Path(json_file).stem,
-            'n_sites_tested': len(sites),
+            'gene': json_file.stem,
+            'n_sites_tested': n_sites,
             'n_significant_sites': significant_sites,
-            'proportion_selected': significant_sites / len(sites) if len(sites) > 0 else 0
+            'proportion_selected': significant_sites / n_sites if n_sites > 0 else 0,
+            'site_results': sites
         }
 
     except Exception as e:
@@ -156,80 +338,305 @@ def parse_meme(json_file):
 def parse_fel(json_file):
     """Parse FEL output (site-level pervasive selection)"""
     try:
-        with open(json_file) as f:
-            data = json.load(f)
+        data = load_json(json_file, SECTIONS['fel'])
 
-        mle_data = data.get('MLE', {}).get('content', {})
+        sites = mle_sites(data, 'fel')
 
         positive_sites = 0
         negative_sites = 0
 
-        for site_data in mle_data.values():
-            if isinstance(site_data, dict):
-                alpha = site_data.get('alpha', 0)
-                beta = site_data.get('beta', 0)
+        for alpha, beta, pvalue in zip(sites['alpha'], sites['beta'], sites['pvalue']):
+            alpha, beta = _value(alpha, 0), _value(beta, 0)
 
-                if beta > alpha and site_data.get('p-value', 1.0) < 0.05:
-                    positive_sites += 1
-                elif alpha > beta and site_data.get('p-value', 1.0) < 0.05:
-                    negative_sites += 1
+            if beta > alpha and _value(pvalue, 1.0) < 0.05:
+                positive_sites += 1
+            elif alpha > beta and _value(pvalue, 1.0) < 0.05:
+                negative_sites += 1
 
         return {
-            'gene': Path(json_file).stem,
-            'n_sites': len(mle_data),
+            'gene': json_file.stem,
+            'n_sites': len(sites['site']),
             'positive_selection_sites': positive_sites,
-            'negative_selection_sites': negative_sites
+            'negative_selection_sites': negative_sites,
+            'site_results': sites
         }
 
     except Exception as e:
         print(f"Error parsing {json_file}: {e}", file=sys.stderr)
         return None
 
+PARSERS = {
+    'absrel': parse_absrel,
+    'busted': parse_busted,
+    'relax': parse_relax,
+    'meme': parse_meme,
+    'fel': parse_fel
+}
+
+UNCHANGED = 'unchanged'
+
+def parse_file(test, json_file, known_digest=None, hashing=False):
+    """
+    Parse one file and return (digest, result). With hashing, digest is the
+    SHA-1 of the file contents, and a file whose digest equals known_digest
+    is not decoded (result is UNCHANGED).
+    """
+    if not hashing:
+        return None, PARSERS[test](json_file)
+
+    data = json_file.read_bytes()
+    digest = content_digest(data)
+    if digest == known_digest:
+        return digest, UNCHANGED
+    return digest, PARSERS[test](LoadedMember(json_file.name, data))
+
+def _parse_worker(task):
+    return parse_file(*task)
+
+def parser_pool(workers, decoder=None, streaming=True):
+    """Process pool whose workers parse with the given JSON options"""
+    return ProcessPoolExecutor(max_workers=workers, initializer=set_json_options,
+                               initargs=(decoder or _decoder, streaming))
+
+def _map_chunks(pool, workers, test, json_files, known_digests, hashing, chunk_size):
+    for start in range(0, len(json_files), chunk_size):
+        chunk = [
+            (test, json_file.load() if isinstance(json_file, BundleMember) else json_file,
+             known_digest, hashing)
+            for json_file, known_digest in zip(json_files[start:start + chunk_size],
+                                               known_digests[start:start + chunk_size])
+        ]
+        yield from pool.map(_parse_worker, chunk,
+                            chunksize=max(1, len(chunk) // (workers * 4)))
+
+def parse_files(json_files, test, workers=1, decoder=None, known_digests=None,
+                streaming=True, chunk_size=MERGE_CHUNK, pool=None):
+    """
+    (digest, result) per file in input order; result is None for failures.
+    Files are hashed only if known_digests (one digest or None per file) is
+    given. With several workers the files are sent to a process pool (pool,
+    from parser_pool(), or a new one) one chunk at a time; bundle members are
+    read in this process and sent as their contents.
+    """
+    decoder = decoder or _decoder
+    set_json_options(decoder, streaming)
+    hashing = known_digests is not None
+    if not hashing:
+        known_digests = [None] * len(json_files)
+
+    if workers <= 1:
+        for json_file, known_digest in zip(json_files, known_digests):
+            yield parse_file(test, json_file, known_digest, hashing)
+    elif pool is not None:
+        yield from _map_chunks(pool, workers, test, json_files, known_digests, hashing,
+                               chunk_size)
+    else:
+        with parser_pool(workers, decoder, streaming) as pool:
+            yield from _map_chunks(pool, workers, test, json_files, known_digests, hashing,
+                                   chunk_size)
+
+def _float_array(values):
+    """values as float64, with None, 'NA' and other non-numbers as NaN"""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(np.float64)
+
+def adjust_sites(pending, method, fdr_threshold):
+    """
+    Site q-values within each gene for a batch of (summary row, site table)
+    pairs, in one call: adds 'qvalue' to every site table and the number of
+    sites at q <= fdr_threshold to every row (n_significant_sites_fdr)
+    """
+    sizes = [len(sites['site']) for _, sites in pending]
+    pvalues = _float_array([p for _, sites in pending for p in sites['pvalue']])
+    genes = np.repeat(np.arange(len(pending)), sizes)
+    qvalues = adjust(pvalues, method, groups=genes)
+    n_significant = np.bincount(genes, weights=qvalues <= fdr_threshold, minlength=len(pending))
+
+    for (result, sites), gene_qvalues, count in zip(pending, np.split(qvalues, np.cumsum(sizes)[:-1]),
+                                                     n_significant):
+        sites['qvalue'] = gene_qvalues.tolist()
+        result['n_significant_sites_fdr'] = int(count)
+
+def add_qvalues(df, test, method='bh', fdr_threshold=0.1):
+    """
+    Gene-level q-values across all genes (qvalue) and significance at
+    fdr_threshold (significant_fdr). For aBSREL the correction is
+    hierarchical: n_significant_fdr counts the tested branches of each
+    selected gene that pass at the level scaled by the fraction of genes
+    selected (multiple_testing.hierarchical_fdr).
+    """
+    if 'pvalue' not in df.columns:
+        return df
+    pvalues = _float_array(df['pvalue'].tolist())
+
+    if test == 'absrel' and 'branch_results' in df.columns:
+        sizes = [len(branches) for branches in df['branch_results']]
+        branch_pvalues = _float_array([branch['pvalue'] for branches in df['branch_results']
+                                       for branch in branches])
+        genes = np.repeat(np.arange(len(df)), sizes)
+        qvalues, selected, branch_significant = hierarchical_fdr(
+            pvalues, branch_pvalues, genes, fdr_threshold, method)
+        df['qvalue'] = qvalues
+        df['significant_fdr'] = selected
+        df['n_significant_fdr'] = np.bincount(genes, weights=branch_significant,
+                                              minlength=len(df)).astype(int)
+    else:
+        df['qvalue'] = adjust(pvalues, method)
+        df['significant_fdr'] = df['qvalue'] <= fdr_threshold
+    return df
+
+def print_progress(n_done, n_total, start):
+    """Rewrite the single progress line"""
+    elapsed = time.perf_counter() - start
+    rate = n_done / elapsed if elapsed > 0 else 0.0
+    print(f"\r  Parsed {n_done}/{n_total} files ({rate:,.0f} files/s)", end='', flush=True)
+
+def _flush_sites(pending, detail_table, correction, fdr_threshold):
+    """Adjust and write out the site tables of the genes collected so far"""
+    if pending and correction is not None:
+        adjust_sites(pending, correction, fdr_threshold)
+    if detail_table is not None:
+        for result, sites in pending:
+            detail_table.append(result['gene'], sites)
+    pending.clear()
+
+def collect_results(json_files, test, workers=1, decoder=None, progress=True, cache=None,
+                    detail_table=None, streaming=True, pool=None, correction=None,
+                    fdr_threshold=0.1):
+    """
+    Parse all files into one DataFrame of summary rows, merged in chunks;
+    returns (df, n_failed). Per-branch and per-site results are streamed to
+    detail_table (a LongTableWriter) in input order; per-site results are
+    not kept in the summary. With a correction method, per-site results get
+    within-gene q-values (adjust_sites) one chunk of genes at a time. With a
+    ParseCache only new or changed files are decoded and the cache is
+    updated (not saved). A shared pool can be passed to parse several tests
+    at once (see build_selection_matrix.py).
+    """
+    fresh = [False] * len(json_files)
+    identities = known_digests = None
+
+    if cache is not None:
+        identities = [file_identity(json_file) for json_file in json_files]
+        known_digests = []
+        for i, identity in enumerate(identities):
+            fresh[i], digest = cache.lookup(*identity)
+            if not fresh[i]:
+                known_digests.append(digest)
+
+    todo = [i for i in range(len(json_files)) if not fresh[i]]
+    parsed = parse_files([json_files[i] for i in todo], test, workers, decoder, known_digests,
+                         streaming, pool=pool)
+
+    frames = []
+    rows = []
+    pending_sites = []
+    failed = 0
+    n_done = 0
+    start = time.perf_counter()
+
+    for i in range(len(json_files)):
+        if fresh[i]:
+            result = cache.row(identities[i][0])
+        else:
+            digest, result = next(parsed)
+            if cache is not None:
+                if result == UNCHANGED:
+                    result = cache.reuse(*identities[i])
+                else:
+                    cache.store(*identities[i], digest, result)
+            n_done += 1
+            if progress and (n_done % 100 == 0 or n_done == len(todo)):
+                print_progress(n_done, len(todo), start)
+
+        if result is None:
+            failed += 1
+            continue
+
+        sites = result.pop('site_results', None)
+        if sites is not None:
+            pending_sites.append((result, sites))
+        elif detail_table is not None and 'branch_results' in result:
+            detail_table.append(result['gene'], branch_values(result['branch_results']))
+
+        rows.append(result)
+        if len(rows) >= MERGE_CHUNK:
+            _flush_sites(pending_sites, detail_table, correction, fdr_threshold)
+            frames.append(pd.DataFrame(rows))
+            rows = []
+
+    if progress and todo:
+        print()
+    if rows:
+        _flush_sites(pending_sites, detail_table, correction, fdr_threshold)
+        frames.append(pd.DataFrame(rows))
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return df, failed
+
+def find_json_files(input_dir):
+    """JSON files of a results directory, or the members of a bundle (read in place)"""
+    input_dir = Path(input_dir)
+    if is_bundle(input_dir):
+        return BundleReader(input_dir).glob('json')
+    return sorted(input_dir.glob('*.json'))
+
+def detail_writer(test, output, detail_table=None):
+    """
+    LongTableWriter for the per-branch (absrel) or per-site (meme, fel)
+    results, by default next to the output CSV; None for other tests
+    """
+    output_path = Path(output)
+    if test == 'absrel':
+        return LongTableWriter(
+            detail_table or output_path.with_suffix('.branches.parquet'), BRANCH_COLUMNS)
+    if test in SITE_FIELDS:
+        return LongTableWriter(
+            detail_table or output_path.with_suffix('.sites.parquet'), site_columns(test))
+    return None
+
 def main():
     args = parse_arguments()
 
     input_dir = Path(args.input)
-
-    # Find JSON files
-    json_files = list(input_dir.glob('*.json'))
+    json_files = find_json_files(input_dir)
 
     if not json_files:
         print(f"ERROR: No JSON files found in {input_dir}")
         sys.exit(1)
 
+    workers = max(1, min(args.workers, len(json_files)))
+
     print(f"Found {len(json_files)} JSON files")
     print(f"Test type: {args.test}")
+    print(f"JSON decoder: {args.json_decoder}" +
+          (" (install orjson for faster parsing)" if orjson is None else ""))
+    print(f"JSON sections: {'all' if args.full_json else ', '.join(SECTIONS[args.test])}")
+    print(f"Workers: {workers}")
     print()
 
-    # Select parser based on test type
-    parser_map = {
-        'absrel': parse_absrel,
-        'busted': parse_busted,
-        'relax': parse_relax,
-        'meme': parse_meme,
-        'fel': parse_fel
-    }
-
-    parser_func = parser_map[args.test]
-
-    # Parse all files
-    results = []
-    failed = 0
-
-    for i, json_file in enumerate(json_files, 1):
-        print(f"[{i}/{len(json_files)}] Parsing {json_file.name}...")
-
-        result = parser_func(json_file)
-
-        if result is not None:
-            results.append(result)
-        else:
-            failed += 1
-
-    # Convert to DataFrame
-    if results:
-        df = pd.DataFrame(results)
-
+    cache = None
+    if not args.no_cache:
+        cache = ParseCache(args.cache or args.output + CACHE_SUFFIX, args.test)
+
+    # Per-branch / per-site results as a long table next to the summary
+    detail_table = detail_writer(args.test, args.output, args.detail_table)
+
+    # Parse all files (or only the new and changed ones)
+    df, failed = collect_results(json_files, args.test, workers, args.json_decoder,
+                                 cache=cache, detail_table=detail_table,
+                                 streaming=not args.full_json, correction=args.correction,
+                                 fdr_threshold=args.fdr_threshold)
+    df = add_qvalues(df, args.test, args.correction, args.fdr_threshold)
+    if detail_table is not None:
+        detail_table.close()
+    if cache is not None:
+        cache.save()
+        print(f"Parse cache: {cache.n_reused} reused, {cache.n_unchanged} unchanged after "
+              f"hashing, {cache.n_parsed} parsed ({cache.path})")
+
+    if len(df):
         # Save to CSV
         output_dir = Path(args.output).parent
         output_dir.mkdir(parents=True, exist_ok=True)
@@ -238,14 +645,25 @@ def main():
 
         print()
         print("=== Summary ===")
-        print(f"Successfully parsed: {len(results)}")
+        print(f"Successfully parsed: {len(df)}")
         print(f"Failed: {failed}")
         print(f"Output saved: {args.output}")
+        if detail_table is not None and detail_table.enabled:
+            print(f"Detail table: {detail_table.path} ({detail_table.n_rows} rows)")
 
         # Print quick stats
         if 'pvalue' in df.columns:
             n_sig = (df['pvalue'] < 0.05).sum()
+            n_fdr = df['significant_fdr'].sum()
             print(f"\nSignificant results (p < 0.05): {n_sig} / {len(df)} ({100*n_sig/len(df):.1f}%)")
+            print(f"Significant results ({args.correction} q <= {args.fdr_threshold}): "
+                  f"{n_fdr} / {len(df)} ({100*n_fdr/len(df):.1f}%)")
+            if 'n_significant_fdr' in df.columns:
+                print(f"Significant branches (hierarchical): {df['n_significant_fdr'].sum()}")
+        elif 'n_significant_sites_fdr' in df.columns:
+            print(f"\nSignificant sites ({args.correction} q <= {args.fdr_threshold} within genes): "
+                  f"{df['n_significant_sites_fdr'].sum()} in "
+                  f"{(df['n_significant_sites_fdr'] > 0).sum()} / {len(df)} genes")
 
     else:
         print("ERROR: No results parsed successfully")